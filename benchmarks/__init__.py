@@ -0,0 +1,7 @@
+'''Benchmarks for the cloud info provider.
+
+The benchmarks run the providers and the renderers against synthetic sites
+of increasing size. Run them from the top of the source tree with:
+
+    python -m benchmarks.run --output results.json
+'''
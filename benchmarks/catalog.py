@@ -0,0 +1,254 @@
+'''Synthetic cloud catalogs.
+
+A catalog describes a site with a number of compute endpoints, flavors and
+images, and it is able to produce the same information in the formats used
+by each provider: a static YAML file, a fake novaclient and canned
+OpenNebula XML-RPC responses.
+'''
+
+import sys
+import types
+
+from six.moves.urllib import parse
+
+
+SITE_NAME = 'BENCHMARK-SITE'
+
+
+class Catalog(object):
+    def __init__(self, endpoints, flavors, images):
+        self.endpoints = endpoints
+        self.flavors = flavors
+        self.images = images
+
+    @classmethod
+    def from_spec(cls, spec):
+        '''Build a catalog from a "<endpoints>x<flavors>x<images>" string.'''
+        try:
+            endpoints, flavors, images = [int(i) for i in spec.split('x')]
+        except ValueError:
+            raise ValueError('Invalid catalog size: %s' % spec)
+        return cls(endpoints, flavors, images)
+
+    @property
+    def spec(self):
+        return '%sx%sx%s' % (self.endpoints, self.flavors, self.images)
+
+    def endpoint_url(self, i):
+        return 'https://cloud-%03d.example.org:8787/' % i
+
+    def image_mpuri(self, i):
+        return 'https://appdb.example.org/store/vm/image/%08d:%d/' % (i, i)
+
+    def write_yaml(self, path, catalog=True):
+        '''Write the static YAML file of the site.
+
+        If catalog is False only the site and the endpoints are written, so
+        that the flavors and images come from a dynamic provider.
+        '''
+        # The file is written by hand, as dumping hundreds of thousands of
+        # images with PyYAML takes longer than the benchmarks themselves.
+        lines = [
+            'site:',
+            '    name: %s' % SITE_NAME,
+            'compute:',
+            '    total_cores: %d' % (self.flavors * 8),
+            '    total_ram: %d' % (self.flavors * 16384),
+            '    hypervisor: Foo Hypervisor',
+            '    hypervisor_version: 0.0.0',
+            '    middleware: A Middleware',
+            '    middleware_version: v1.0',
+            '    middleware_developer: Middleware Developer',
+            '    service_production_level: production',
+            '    capabilities:',
+            '        - cloud.managementSystem',
+            '        - cloud.vm.uploadImage',
+            '    endpoints:',
+            '        defaults:',
+            '            api_type: OCCI',
+            '            api_version: 1.1',
+            '            api_endpoint_technology: REST',
+            '            api_authn_method: X509-VOMS',
+            '            production_level: production',
+        ]
+        for i in range(self.endpoints):
+            url = self.endpoint_url(i)
+            lines.extend([
+                '        %s:' % url,
+                '            endpoint_url: %s' % url,
+            ])
+
+        lines.extend([
+            '    templates:',
+            '        defaults:',
+            '            platform: amd64',
+            '            network: public',
+        ])
+        if catalog:
+            for i in range(self.flavors):
+                lines.extend([
+                    '        resource_tpl#flavor_%06d:' % i,
+                    '            memory: %d' % (512 * (i % 64 + 1)),
+                    '            cpu: %d' % (i % 32 + 1),
+                ])
+
+        lines.extend([
+            '    images:',
+            '        defaults:',
+            '            platform: amd64',
+        ])
+        if catalog:
+            for i in range(self.images):
+                lines.extend([
+                    '        os_tpl#image_%08d:' % i,
+                    '            name: Image %d' % i,
+                    '            version: %d.0' % (i % 10),
+                    '            marketplace_id: %s' % self.image_mpuri(i),
+                    '            os_family: linux',
+                    '            os_name: Ubuntu',
+                    '            os_version: 16.04',
+                ])
+
+        with open(path, 'w') as f:
+            f.write('\n'.join(lines))
+            f.write('\n')
+
+    def nova_api(self):
+        return FakeNovaAPI(self)
+
+    def install_novaclient(self):
+        '''Make "import novaclient.client" return a fake client.'''
+        catalog = self
+
+        client = types.ModuleType('novaclient.client')
+        client.Client = lambda *args, **kwargs: catalog.nova_api()
+        novaclient = types.ModuleType('novaclient')
+        novaclient.client = client
+        sys.modules['novaclient'] = novaclient
+        sys.modules['novaclient.client'] = client
+
+    def one_server_proxy(self):
+        return FakeONEServerProxy(self)
+
+    def one_templatepool(self):
+        pool = ['<VMTEMPLATE_POOL>']
+        for i in range(self.images):
+            pool.append(
+                '<VMTEMPLATE><ID>%(id)d</ID><UID>0</UID><GID>0</GID>'
+                '<NAME>image-%(id)08d</NAME><REGTIME>1455720123</REGTIME>'
+                '<TEMPLATE><CPU><![CDATA[%(cpu)d]]></CPU>'
+                '<MEMORY><![CDATA[%(memory)d]]></MEMORY>'
+                '<DESCRIPTION><![CDATA[Template %(id)d]]></DESCRIPTION>'
+                '<CLOUDKEEPER_APPLIANCE_MPURI><![CDATA[%(mpuri)s]]>'
+                '</CLOUDKEEPER_APPLIANCE_MPURI>'
+                '<CLOUDKEEPER_APPLIANCE_DESCRIPTION><![CDATA[Image %(id)d]]>'
+                '</CLOUDKEEPER_APPLIANCE_DESCRIPTION>'
+                '<CLOUDKEEPER_APPLIANCE_VERSION><![CDATA[%(version)d.0]]>'
+                '</CLOUDKEEPER_APPLIANCE_VERSION>'
+                '<CLOUDKEEPER_APPLIANCE_ARCHITECTURE><![CDATA[x86_64]]>'
+                '</CLOUDKEEPER_APPLIANCE_ARCHITECTURE>'
+                '</TEMPLATE></VMTEMPLATE>' % {
+                    'id': i,
+                    'cpu': i % 32 + 1,
+                    'memory': 512 * (i % 64 + 1),
+                    'mpuri': self.image_mpuri(i),
+                    'version': i % 10,
+                })
+        pool.append('</VMTEMPLATE_POOL>')
+        return ''.join(pool)
+
+    def one_imagepool(self):
+        pool = ['<IMAGE_POOL>']
+        for i in range(self.images):
+            pool.append(
+                '<IMAGE><ID>%(id)d</ID><UID>0</UID><GID>0</GID>'
+                '<NAME>image-%(id)08d</NAME><TYPE>0</TYPE>'
+                '<SIZE>%(size)d</SIZE><STATE>1</STATE>'
+                '<TEMPLATE><DESCRIPTION><![CDATA[Image %(id)d]]>'
+                '</DESCRIPTION>'
+                '<CLOUDKEEPER_APPLIANCE_MPURI><![CDATA[%(mpuri)s]]>'
+                '</CLOUDKEEPER_APPLIANCE_MPURI>'
+                '<CLOUDKEEPER_APPLIANCE_VERSION><![CDATA[%(version)d.0]]>'
+                '</CLOUDKEEPER_APPLIANCE_VERSION>'
+                '</TEMPLATE></IMAGE>' % {
+                    'id': i,
+                    'size': 1024 * (i % 16 + 1),
+                    'mpuri': self.image_mpuri(i),
+                    'version': i % 10,
+                })
+        pool.append('</IMAGE_POOL>')
+        return ''.join(pool)
+
+
+class _Object(object):
+    def __init__(self, **kwargs):
+        self.__dict__.update(kwargs)
+
+
+class _FakeManager(object):
+    def __init__(self, items):
+        self.items = items
+        self.index = dict((item.id, i) for i, item in enumerate(items))
+
+    def list(self, detailed=True, limit=None, marker=None):
+        start = 0
+        if marker is not None:
+            start = self.index[marker] + 1
+        end = None if limit is None else start + limit
+        return self.items[start:end]
+
+
+class FakeNovaAPI(object):
+    '''A novaclient lookalike serving the flavors and images of a catalog.'''
+    def __init__(self, catalog):
+        endpoints = [{'id': 'endpoint-%03d' % i,
+                      'publicURL': catalog.endpoint_url(i)}
+                     for i in range(catalog.endpoints)]
+        service_catalog = {'access': {'serviceCatalog': [
+            {'type': 'compute', 'endpoints': endpoints},
+        ]}}
+        self.client = _Object(
+            auth_url='https://keystone.example.org:5000/v2.0',
+            service_catalog=_Object(catalog=service_catalog))
+
+        self.flavors = _FakeManager([
+            _Object(id='%d' % i,
+                    name='flavor.%d' % i,
+                    is_public=(i % 10 != 9),
+                    ram=512 * (i % 64 + 1),
+                    vcpus=i % 32 + 1,
+                    disk=10 * (i % 8 + 1))
+            for i in range(catalog.flavors)])
+
+        images = []
+        for i in range(catalog.images):
+            image_id = '%08d-0000-0000-0000-000000000000' % i
+            metadata = {'os_distro': 'ubuntu', 'os_version': '16.04'}
+            if i % 2:
+                metadata.update({
+                    'vmcatcher_event_ad_mpuri': catalog.image_mpuri(i),
+                    'vmcatcher_event_dc_title': 'Image %d' % i,
+                    'vmcatcher_event_hv_version': '%d.0' % (i % 10),
+                })
+            link = parse.urljoin('https://glance.example.org:9292/images/',
+                                 image_id)
+            images.append(_Object(
+                id=image_id,
+                name='image-%08d' % i,
+                metadata=metadata,
+                links=[{'type': 'application/vnd.openstack.image',
+                        'href': link}]))
+        self.images = _FakeManager(images)
+
+    def authenticate(self):
+        pass
+
+
+class FakeONEServerProxy(object):
+    '''An XML-RPC server proxy returning canned OpenNebula pools.'''
+    def __init__(self, catalog):
+        templatepool = (True, catalog.one_templatepool())
+        imagepool = (True, catalog.one_imagepool())
+        self.one = _Object(
+            templatepool=_Object(info=lambda *args: templatepool),
+            imagepool=_Object(info=lambda *args: imagepool))
@@ -0,0 +1,192 @@
+'''Benchmarked phases.
+
+Every phase is a function that gets a catalog and a working directory, does
+all the set up that should not be measured and returns the callable that is
+timed.
+'''
+
+import codecs
+import collections
+import multiprocessing
+import os.path
+
+from cloud_info import core
+
+PHASES = collections.OrderedDict()
+
+TEMPLATE_DIR = os.path.join(os.path.dirname(os.path.dirname(
+    os.path.abspath(__file__))), 'etc', 'templates')
+
+
+def phase(name):
+    def decorator(f):
+        PHASES[name] = f
+        return f
+    return decorator
+
+
+def get_opts(catalog, workdir, middleware='static', static_catalog=True,
+             extra=()):
+    '''Write the static YAML file of the catalog and parse the options.'''
+    yaml_file = os.path.join(workdir, 'static.yaml')
+    catalog.write_yaml(yaml_file, catalog=static_catalog)
+
+    argv = ['--middleware', middleware,
+            '--yaml-file', yaml_file,
+            '--template-dir', TEMPLATE_DIR,
+            '--block-cache-size', '0']
+    if middleware == 'openstack':
+        catalog.install_novaclient()
+        argv.extend(['--os-username', 'user',
+                     '--os-password', 'password',
+                     '--os-tenant-name', 'tenant',
+                     '--os-auth-url', 'https://keystone.example.org:5000'])
+    argv.extend(extra)
+    return core.parse_opts(argv)
+
+
+def _static_provider(catalog, workdir):
+    opts = get_opts(catalog, workdir)
+    return core.load_provider('static')(opts)
+
+
+@phase('static.load')
+def static_load(catalog, workdir):
+    opts = get_opts(catalog, workdir)
+    return lambda: core.load_provider('static')(opts)
+
+
+@phase('static.get_compute_endpoints')
+def static_get_compute_endpoints(catalog, workdir):
+    return _static_provider(catalog, workdir).get_compute_endpoints
+
+
+@phase('static.get_templates')
+def static_get_templates(catalog, workdir):
+    return _static_provider(catalog, workdir).get_templates
+
+
+@phase('static.get_images')
+def static_get_images(catalog, workdir):
+    return _static_provider(catalog, workdir).get_images
+
+
+@phase('static.collect')
+def static_collect(catalog, workdir):
+    '''Collect the compute section of a site only described statically.'''
+    bdii = core.ComputeBDII(get_opts(catalog, workdir))
+    return bdii._get_compute_info
+
+
+def _openstack_provider(catalog, workdir):
+    opts = get_opts(catalog, workdir, middleware='openstack',
+                    static_catalog=False)
+    return core.load_provider('openstack')(opts)
+
+
+@phase('openstack.get_compute_endpoints')
+def openstack_get_compute_endpoints(catalog, workdir):
+    return _openstack_provider(catalog, workdir).get_compute_endpoints
+
+
+@phase('openstack.get_templates')
+def openstack_get_templates(catalog, workdir):
+    return _openstack_provider(catalog, workdir).get_templates
+
+
+@phase('openstack.get_images')
+def openstack_get_images(catalog, workdir):
+    return _openstack_provider(catalog, workdir).get_images
+
+
+def _opennebula_provider(catalog, workdir, middleware):
+    opts = get_opts(catalog, workdir, middleware=middleware,
+                    static_catalog=False)
+    provider = core.load_provider(middleware)(opts)
+    provider.server_proxy = catalog.one_server_proxy()
+    return provider
+
+
+@phase('opennebula.get_images')
+def opennebula_get_images(catalog, workdir):
+    return _opennebula_provider(catalog, workdir, 'opennebula').get_images
+
+
+@phase('indigoon.get_templates')
+def indigoon_get_templates(catalog, workdir):
+    return _opennebula_provider(catalog, workdir, 'indigoon').get_templates
+
+
+@phase('indigoon.get_images')
+def indigoon_get_images(catalog, workdir):
+    return _opennebula_provider(catalog, workdir, 'indigoon').get_images
+
+
+def _compute_bdii(catalog, workdir, writer='template', extra=()):
+    opts = get_opts(catalog, workdir, middleware='openstack',
+                    static_catalog=False,
+                    extra=['--ldif-writer', writer] + list(extra))
+    bdii = core.ComputeBDII(opts)
+    bdii.load_templates()
+    return bdii
+
+
+@phase('compute.render')
+def compute_render(catalog, workdir):
+    '''Collect the information and render the whole compute section.'''
+    return _compute_bdii(catalog, workdir).render
+
+
+@phase('compute.render_stream')
+def compute_render_stream(catalog, workdir):
+    '''Collect and render the compute section in streaming mode.'''
+    bdii = _compute_bdii(catalog, workdir)
+
+    def render():
+        with open(os.devnull, 'wb') as out:
+            bdii.render_stream(codecs.getwriter('utf-8')(out))
+    return render
+
+
+@phase('compute.render_native')
+def compute_render_native(catalog, workdir):
+    '''Collect and render the compute section with the native writer.'''
+    return _compute_bdii(catalog, workdir, writer='native').render
+
+
+@phase('compute.json')
+def compute_json(catalog, workdir):
+    '''Collect the compute section and write it as JSON.'''
+    bdii = _compute_bdii(catalog, workdir)
+
+    def render():
+        with open(os.devnull, 'wb') as out:
+            core.write_json([bdii], codecs.getwriter('utf-8')(out))
+    return render
+
+
+def _prefetched_compute_bdii(catalog, workdir, writer='template', extra=()):
+    bdii = _compute_bdii(catalog, workdir, writer=writer, extra=extra)
+    core.prefetch_sections([bdii])
+    return bdii
+
+
+@phase('render.compute_template')
+def render_compute_template(catalog, workdir):
+    '''Render the already collected compute section with the template.'''
+    return _prefetched_compute_bdii(catalog, workdir).render
+
+
+@phase('render.compute_native')
+def render_compute_native(catalog, workdir):
+    '''Render the already collected compute section natively.'''
+    return _prefetched_compute_bdii(catalog, workdir, writer='native').render
+
+
+@phase('render.compute_native_sharded')
+def render_compute_native_sharded(catalog, workdir):
+    '''Render the already collected compute section in a process per CPU.'''
+    processes = max(2, multiprocessing.cpu_count())
+    extra = ['--render-processes', str(processes)]
+    return _prefetched_compute_bdii(catalog, workdir, writer='native',
+                                    extra=extra).render
@@ -0,0 +1,230 @@
+'''Run the benchmarks and report the results.
+
+Every phase runs for every catalog size in a fresh interpreter, so that the
+peak RSS of a phase is not hidden by the memory used by the previous ones.
+The results are written as JSON so that runs can be compared with
+--compare.
+'''
+
+from __future__ import print_function
+
+import argparse
+import json
+import os
+import platform
+import resource
+import shutil
+import subprocess  # nosec
+import sys
+import tempfile
+import time
+import timeit
+
+from benchmarks import catalog as catalog_
+from benchmarks import phases
+
+# Catalog sizes, as <endpoints>x<flavors>x<images>
+SIZES = {
+    'small': '1x20x100',
+    'medium': '2x100x1000',
+    'large': '5x200x10000',
+    'huge': '10x500x100000',
+    'xhuge': '20x1000x300000',
+}
+
+DEFAULT_SIZES = ('small', 'medium', 'large')
+
+RESULTS_VERSION = 1
+
+
+def _max_rss():
+    '''Peak resident set size of this process, in KiB.'''
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == 'darwin':
+        # Reported in bytes instead of KiB
+        rss //= 1024
+    return rss
+
+
+def _cpu_time():
+    t = os.times()
+    return t[0] + t[1]
+
+
+def measure(name, spec):
+    '''Run a phase in this process and return its measurements.'''
+    catalog = catalog_.Catalog.from_spec(spec)
+    workdir = tempfile.mkdtemp(prefix='cloud-info-bench-')
+    try:
+        func = phases.PHASES[name](catalog, workdir)
+
+        rss_before = _max_rss()
+        cpu = _cpu_time()
+        wall = timeit.default_timer()
+        func()
+        wall = timeit.default_timer() - wall
+        cpu = _cpu_time() - cpu
+        rss_peak = _max_rss()
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    return {
+        'phase': name,
+        'size': spec,
+        'endpoints': catalog.endpoints,
+        'flavors': catalog.flavors,
+        'images': catalog.images,
+        'wall_time': wall,
+        'cpu_time': cpu,
+        'rss_before_kb': rss_before,
+        'rss_peak_kb': rss_peak,
+    }
+
+
+def run_child(name, spec):
+    '''Measure a phase in a fresh interpreter.'''
+    cmd = [sys.executable, '-m', 'benchmarks.run',
+           '--measure', name, '--size', spec]
+    output = subprocess.check_output(cmd)  # nosec
+    return json.loads(output.decode('utf-8'))
+
+
+def run(names, specs, repeat=1):
+    '''Run the phases for every size, yielding the results.
+
+    The best wall and CPU times of the repetitions are reported, together
+    with the highest peak RSS.
+    '''
+    for spec in specs:
+        for name in names:
+            result = None
+            for _ in range(repeat):
+                r = run_child(name, spec)
+                if result is None:
+                    result = r
+                    continue
+                for key in ('wall_time', 'cpu_time'):
+                    result[key] = min(result[key], r[key])
+                for key in ('rss_before_kb', 'rss_peak_kb'):
+                    result[key] = max(result[key], r[key])
+            result['repeat'] = repeat
+            yield result
+
+
+def compare(results, previous):
+    '''Get the ratio of the wall times, CPU times and peak RSS of two runs.'''
+    old = dict(((r['phase'], r['size']), r) for r in previous['results'])
+    for r in results:
+        o = old.get((r['phase'], r['size']))
+        if o is None:
+            continue
+        ratios = {}
+        for key in ('wall_time', 'cpu_time', 'rss_peak_kb'):
+            ratios[key] = r[key] / o[key] if o[key] else None
+        yield r, ratios
+
+
+def _format_ratio(ratio):
+    return '%7.2fx' % ratio if ratio is not None else '%8s' % '-'
+
+
+def parse_opts(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Cloud info provider benchmarks',
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+
+    parser.add_argument(
+        '--size',
+        dest='sizes',
+        metavar='SIZE',
+        action='append',
+        help=('Catalog size to benchmark, either one of %s or '
+              '<endpoints>x<flavors>x<images>. Can be given several '
+              'times. Defaults to %s.' %
+              (', '.join(sorted(SIZES)), ', '.join(DEFAULT_SIZES))))
+
+    parser.add_argument(
+        '--phase',
+        dest='phases',
+        metavar='PHASE',
+        action='append',
+        choices=list(phases.PHASES),
+        help=('Phase to benchmark, can be given several times. Defaults '
+              'to all of them: %s.' % ', '.join(phases.PHASES)))
+
+    parser.add_argument(
+        '--repeat',
+        type=int,
+        default=1,
+        help='Number of times that each phase is run.')
+
+    parser.add_argument(
+        '--output',
+        metavar='FILE',
+        default=None,
+        help='Write the results as JSON into this file.')
+
+    parser.add_argument(
+        '--compare',
+        metavar='FILE',
+        default=None,
+        help='Compare the results with the ones stored in this file.')
+
+    parser.add_argument(
+        '--measure',
+        metavar='PHASE',
+        default=None,
+        help=argparse.SUPPRESS)
+
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    opts = parse_opts(argv)
+    specs = [SIZES.get(s, s) for s in opts.sizes or DEFAULT_SIZES]
+    for spec in specs:
+        catalog_.Catalog.from_spec(spec)
+
+    if opts.measure:
+        print(json.dumps(measure(opts.measure, specs[0])))
+        return 0
+
+    previous = None
+    if opts.compare:
+        with open(opts.compare) as f:
+            previous = json.load(f)
+
+    results = []
+    header = '%-34s %-16s %10s %10s %12s' % ('phase', 'size', 'wall (s)',
+                                             'cpu (s)', 'peak rss (KiB)')
+    print(header, file=sys.stderr)
+    for result in run(opts.phases or list(phases.PHASES), specs,
+                      repeat=opts.repeat):
+        results.append(result)
+        print('%-34s %-16s %10.3f %10.3f %14d' % (
+            result['phase'], result['size'], result['wall_time'],
+            result['cpu_time'], result['rss_peak_kb']), file=sys.stderr)
+
+    if previous is not None:
+        print('\nCompared with %s:' % opts.compare, file=sys.stderr)
+        for result, ratios in compare(results, previous):
+            print('%-34s %-16s %10s %10s %14s' % (
+                result['phase'], result['size'],
+                _format_ratio(ratios['wall_time']),
+                _format_ratio(ratios['cpu_time']),
+                _format_ratio(ratios['rss_peak_kb'])), file=sys.stderr)
+
+    if opts.output:
+        with open(opts.output, 'w') as f:
+            json.dump({
+                'version': RESULTS_VERSION,
+                'timestamp': time.time(),
+                'python': platform.python_version(),
+                'platform': platform.platform(),
+                'results': results,
+            }, f, indent=4, sort_keys=True)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
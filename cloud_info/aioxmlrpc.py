@@ -0,0 +1,179 @@
+'''Asynchronous XML-RPC client, on top of asyncio.
+
+Calls are sent over a pool of keep-alive HTTP connections, so several calls
+to the same server can be in flight at the same time, each one with its own
+timeout. The payloads are marshalled with the standard xmlrpc module (that
+is protected by defusedxml once the OpenNebula providers are loaded).
+
+This module requires Python 3.5 or newer, it is only imported when the
+asynchronous transport is enabled.
+'''
+
+import asyncio
+import ssl
+import urllib.parse
+import xmlrpc.client  # nosec
+
+USER_AGENT = 'cloud-info-provider (asyncio)'
+
+
+class _Connection(object):
+    def __init__(self, reader, writer):
+        self.reader = reader
+        self.writer = writer
+
+    def close(self):
+        self.writer.close()
+
+
+class ServerProxy(object):
+    '''Client of an XML-RPC server.
+
+    At most max_connections calls are sent at the same time, the others
+    wait for a connection to be free. The timeout of a call includes that
+    wait.
+    '''
+    def __init__(self, uri, max_connections=4, timeout=None):
+        url = urllib.parse.urlsplit(uri)
+        if url.scheme not in ('http', 'https'):
+            raise ValueError('Unsupported XML-RPC endpoint: %s' % uri)
+
+        self.uri = uri
+        self.host = url.hostname
+        self.port = url.port or (443 if url.scheme == 'https' else 80)
+        self.ssl = ssl.create_default_context() if (
+            url.scheme == 'https') else None
+        self.path = url.path or '/RPC2'
+        if url.query:
+            self.path += '?' + url.query
+        self.timeout = timeout
+
+        self._slots = asyncio.Semaphore(max_connections)
+        self._idle = []
+
+    async def call(self, method, *params, **kwargs):
+        '''Call method with params, returning its result.
+
+        The timeout keyword argument overrides the timeout of the proxy.
+        Raises asyncio.TimeoutError if the call does not finish in time,
+        xmlrpc.client.Fault for XML-RPC faults and
+        xmlrpc.client.ProtocolError for HTTP errors.
+        '''
+        timeout = kwargs.pop('timeout', self.timeout)
+        if kwargs:
+            raise TypeError('Unexpected arguments: %s' % ', '.join(kwargs))
+        body = xmlrpc.client.dumps(params, method).encode('utf-8')
+        data = await asyncio.wait_for(self._request(body), timeout)
+        result, = xmlrpc.client.loads(data)[0]
+        return result
+
+    def close(self):
+        while self._idle:
+            self._idle.pop().close()
+
+    async def _connect(self):
+        if self._idle:
+            return self._idle.pop()
+        reader, writer = await asyncio.open_connection(self.host, self.port,
+                                                       ssl=self.ssl)
+        return _Connection(reader, writer)
+
+    async def _request(self, body):
+        async with self._slots:
+            conn = await self._connect()
+            try:
+                keep_alive, data = await self._send(conn, body)
+            except BaseException:
+                # Including the cancellation on timeouts, the connection is
+                # left in an unknown state
+                conn.close()
+                raise
+            if keep_alive:
+                self._idle.append(conn)
+            else:
+                conn.close()
+            return data
+
+    async def _send(self, conn, body):
+        headers = [
+            'POST %s HTTP/1.1' % self.path,
+            'Host: %s:%d' % (self.host, self.port),
+            'User-Agent: %s' % USER_AGENT,
+            'Content-Type: text/xml',
+            'Content-Length: %d' % len(body),
+        ]
+        conn.writer.write(('\r\n'.join(headers) + '\r\n\r\n').encode('ascii'))
+        conn.writer.write(body)
+        await conn.writer.drain()
+
+        status_line = await conn.reader.readline()
+        try:
+            version, status, reason = status_line.decode(
+                'latin-1').rstrip('\r\n').split(' ', 2)
+            status = int(status)
+        except ValueError:
+            raise xmlrpc.client.ProtocolError(
+                self.uri, 0, 'Invalid status line: %r' % status_line, {})
+
+        headers = {}
+        while True:
+            line = await conn.reader.readline()
+            if line in (b'\r\n', b'\n', b''):
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            headers[name.strip().lower()] = value.strip()
+
+        keep_alive = version == 'HTTP/1.1'
+        if headers.get('connection', '').lower() == 'close':
+            keep_alive = False
+        if headers.get('transfer-encoding', '').lower() == 'chunked':
+            data = await self._read_chunked(conn.reader)
+        elif 'content-length' in headers:
+            data = await conn.reader.readexactly(
+                int(headers['content-length']))
+        else:
+            data = await conn.reader.read()
+            keep_alive = False
+
+        if status != 200:
+            raise xmlrpc.client.ProtocolError(self.uri, status, reason,
+                                              headers)
+        return keep_alive, data
+
+    @staticmethod
+    async def _read_chunked(reader):
+        chunks = []
+        while True:
+            size = int((await reader.readline()).split(b';')[0], 16)
+            if not size:
+                break
+            chunks.append(await reader.readexactly(size))
+            await reader.readline()
+        # Trailer headers
+        while (await reader.readline()) not in (b'\r\n', b'\n', b''):
+            pass
+        return b''.join(chunks)
+
+
+def call_many(uri, calls, max_connections=4, timeout=None):
+    '''Make several calls concurrently, blocking until all of them finish.
+
+    calls is a list of (method, params) tuples. Returns the result of each
+    call in the same order, or the exception that it raised.
+    '''
+    async def call_all():
+        proxy = ServerProxy(uri, max_connections=max_connections,
+                            timeout=timeout)
+        try:
+            return await asyncio.gather(
+                *[proxy.call(method, *params) for method, params in calls],
+                return_exceptions=True)
+        finally:
+            proxy.close()
+
+    # A loop of our own, as this may be called from any thread
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(call_all())
+    finally:
+        loop.close()
@@ -0,0 +1,127 @@
+import collections
+import hashlib
+import json
+import logging
+import threading
+
+from cloud_info import utils
+
+logger = logging.getLogger(__name__)
+
+
+class NoCache(object):
+    '''Block renderer that does not cache anything.'''
+    enabled = False
+    hits = misses = 0
+
+    def bind(self, scope):
+        return self
+
+    def render(self, name, capture, block, *args):
+        return capture(block, *args)
+
+    def save(self):
+        pass
+
+
+class BlockCache(object):
+    '''LRU cache of the blocks rendered for each entity.
+
+    Templates render the per-entity blocks (e.g. a GLUE2 execution
+    environment) through this cache, keyed by a hash of the block name and
+    its arguments, so only the entities that changed are rendered again.
+
+    If path is set, the blocks used in this run are stored there so that
+    they can be reused by the next one.
+    '''
+    enabled = True
+
+    def __init__(self, size=10000, path=None):
+        self.size = size
+        self.path = path
+
+        self.blocks = collections.OrderedDict()
+        self.used = set()
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+        if path is not None:
+            self.load()
+
+    def load(self):
+        try:
+            with open(self.path, 'r') as f:
+                blocks = json.load(f)
+        except (IOError, OSError):
+            return
+        except ValueError:
+            logger.warning('Ignoring invalid block cache %s', self.path)
+            return
+        for key, block in blocks[-self.size:]:
+            self.blocks[key] = block
+
+    def save(self):
+        if self.path is None:
+            return
+        with self._lock:
+            blocks = [(key, block) for key, block in self.blocks.items()
+                      if key in self.used]
+            self.used = set()
+        utils.atomic_write(self.path, json.dumps(blocks))
+
+    @staticmethod
+    def key(scope, name, args):
+        data = json.dumps([scope, name, args], sort_keys=True, default=str)
+        return hashlib.sha1(data.encode('utf-8')).hexdigest()  # nosec
+
+    def bind(self, scope):
+        '''Get a renderer for the blocks of the template identified by scope.
+
+        The scope must change whenever the template changes.
+        '''
+        return _BoundCache(self, scope)
+
+    def render(self, scope, name, capture, block, *args):
+        key = self.key(scope, name, [dict(arg) for arg in args])
+        with self._lock:
+            rendered = self.blocks.get(key)
+            if rendered is not None:
+                self.hits += 1
+                del self.blocks[key]
+                self.blocks[key] = rendered
+                self.used.add(key)
+                return rendered
+            self.misses += 1
+
+        rendered = capture(block, *args)
+
+        with self._lock:
+            self.blocks[key] = rendered
+            self.used.add(key)
+            while len(self.blocks) > self.size:
+                self.blocks.popitem(last=False)
+        return rendered
+
+
+class _BoundCache(object):
+    def __init__(self, cache, scope):
+        self.cache = cache
+        self.scope = scope
+
+    def render(self, name, capture, block, *args):
+        return self.cache.render(self.scope, name, capture, block, *args)
+
+
+def get_cache(opts):
+    '''Get the block cache to use according to the options.
+
+    Caching blocks only pays off if they are reused, therefore it is only
+    enabled when running as a daemon or when a block cache file is set.
+    '''
+    if opts.block_cache_size <= 0:
+        return NoCache()
+    if opts.block_cache_file or opts.daemon:
+        return BlockCache(size=opts.block_cache_size,
+                          path=opts.block_cache_file)
+    return NoCache()
@@ -0,0 +1,76 @@
+'''Thin client for the cloud-info-provider daemon.
+
+This module is loaded on every BDII poll, therefore it must only depend on
+the standard library so that it starts as fast as possible.
+'''
+
+import argparse
+import socket
+import sys
+
+DEFAULT_SOCKET = '/var/run/cloud-info-provider/cloud-info-provider.sock'
+
+
+def fetch(path, out, timeout=None, chunk_size=65536):
+    '''Stream the output served by the daemon at path into out.
+
+    Returns the number of bytes written.
+    '''
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.settimeout(timeout)
+    try:
+        sock.connect(path)
+        size = 0
+        while True:
+            chunk = sock.recv(chunk_size)
+            if not chunk:
+                break
+            out.write(chunk)
+            size += len(chunk)
+    finally:
+        sock.close()
+    return size
+
+
+def parse_opts(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Cloud BDII provider client',
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+    )
+
+    parser.add_argument(
+        '--daemon-socket',
+        metavar='PATH',
+        default=DEFAULT_SOCKET,
+        help='Path to the UNIX socket where the daemon is listening.')
+
+    parser.add_argument(
+        '--timeout',
+        metavar='SECONDS',
+        type=float,
+        default=30,
+        help='Timeout for the communication with the daemon.')
+
+    return parser.parse_args(argv)
+
+
+def main():
+    opts = parse_opts()
+
+    out = getattr(sys.stdout, 'buffer', sys.stdout)
+    try:
+        size = fetch(opts.daemon_socket, out, timeout=opts.timeout)
+    except (socket.error, socket.timeout) as e:
+        sys.stderr.write('Cannot get information from the daemon at '
+                         '%s: %s\n' % (opts.daemon_socket, e))
+        return 1
+    out.flush()
+
+    if not size:
+        sys.stderr.write('The daemon does not have any information yet\n')
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
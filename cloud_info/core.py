@@ -1,35 +1,377 @@
 import argparse
+import codecs
+import importlib
+import itertools
+import json
+import logging
 import os.path
+import sys
+import threading
+import timeit
 
-import cloud_info.providers.opennebula
-import cloud_info.providers.openstack
-import cloud_info.providers.static
+from cloud_info import blocks
+from cloud_info import client
+from cloud_info import exceptions
+from cloud_info import metrics
+from cloud_info import profiling
+from cloud_info import resilience
+from cloud_info import template_cache
+from cloud_info import utils
 
-import mako.template
+import six
 
+logger = logging.getLogger(__name__)
+
+# Providers are only imported when they are used, so that the start up time
+# does not depend on the number of providers available. Likewise, the
+# modules of optional features (the native and JSON writers, the snapshot
+# and the delta output) are imported where they are needed. More providers can
+# be registered with entry points in the PROVIDERS_ENTRY_POINT group.
 SUPPORTED_MIDDLEWARE = {
-    'openstack': cloud_info.providers.openstack.OpenStackProvider,
-    'opennebula': cloud_info.providers.opennebula.OpenNebulaProvider,
-    'indigoon': cloud_info.providers.opennebula.IndigoONProvider,
-    'opennebularocci': cloud_info.providers.opennebula.OpenNebulaROCCIProvider,
-    'static': cloud_info.providers.static.StaticProvider,
+    'openstack': 'cloud_info.providers.openstack:OpenStackProvider',
+    'opennebula': 'cloud_info.providers.opennebula:OpenNebulaProvider',
+    'indigoon': 'cloud_info.providers.opennebula:IndigoONProvider',
+    'opennebularocci':
+        'cloud_info.providers.opennebula:OpenNebulaROCCIProvider',
+    'static': 'cloud_info.providers.static:StaticProvider',
 }
 
+PROVIDERS_ENTRY_POINT = 'cloud_info.providers'
+
+
+def _get_entry_points():
+    '''Get the providers registered with entry points.
+
+    Returns a dict mapping the middleware names to 'module:Class' strings.
+    '''
+    try:
+        from importlib import metadata
+    except ImportError:
+        import pkg_resources
+        return dict((ep.name, '%s:%s' % (ep.module_name, '.'.join(ep.attrs)))
+                    for ep in pkg_resources.iter_entry_points(
+                        PROVIDERS_ENTRY_POINT))
+
+    eps = metadata.entry_points()
+    if hasattr(eps, 'select'):
+        eps = eps.select(group=PROVIDERS_ENTRY_POINT)
+    else:
+        eps = eps.get(PROVIDERS_ENTRY_POINT, [])
+    return dict((ep.name, ep.value) for ep in eps)
+
+
+def get_middleware_names():
+    '''Get the names of all the available providers.'''
+    names = set(SUPPORTED_MIDDLEWARE)
+    names.update(_get_entry_points())
+    return sorted(names)
+
+
+def load_provider(name):
+    '''Get the provider class for a middleware, importing it if needed.
+
+    Returns None if there is no such provider.
+    '''
+    provider = SUPPORTED_MIDDLEWARE.get(name)
+    if provider is None:
+        provider = _get_entry_points().get(name)
+        if provider is None:
+            return None
+
+    if isinstance(provider, six.string_types):
+        module, cls_ = provider.split(':', 1)
+        provider = importlib.import_module(module)
+        for attr in cls_.split('.'):
+            provider = getattr(provider, attr)
+    return provider
+
+
+class Collector(object):
+    '''Collection session shared by all the BDII renderers of a run.
+
+    The static and dynamic providers are built only once per run (thus the
+    dynamic provider authenticates only once) and the result of every
+    provider method is memoized, so that all the renderers get the very same
+    snapshot of the information.
+
+    The whole run must finish within the --deadline budget, if any: every
+    provider gets the time left in it for its calls to the backend. Those
+    calls are retried and guarded by the circuit breaker of the backend,
+    that is kept across runs.
+    '''
+    def __init__(self, opts, info=None):
+        self.opts = opts
+
+        self.info = {}
+        self.deadline = utils.Deadline(opts.deadline)
+        self.skipped_sections = []
+        self._locks = {}
+        self.block_cache = blocks.get_cache(opts)
+        self.profiler = profiling.get_profiler(opts)
+        self.profiler.start()
+        self.metrics = metrics.get_metrics(opts)
+        self.backend = resilience.get_backend(opts)
+
+        if info is not None:
+            # Information collected by a previous run, do not build the
+            # providers at all.
+            self.dynamic_provider = self.static_provider = None
+            self.info.update(info)
+            return
+
+        with self.profiler.phase('static init'):
+            self.static_provider = load_provider('static')(opts)
+
+        self.dynamic_provider = None
+        if opts.middleware != 'static':
+            provider = load_provider(opts.middleware)
+            if provider is not None:
+                with self.profiler.phase('%s init' % opts.middleware):
+                    # Building the provider usually authenticates with the
+                    # backend
+                    self.dynamic_provider = self.backend.call(
+                        provider, (opts,), deadline=self.deadline,
+                        is_transient=provider.is_transient_error)
+        self._bind_providers()
+
+    def _bind_providers(self):
+        for provider in (self.static_provider, self.dynamic_provider):
+            if provider:
+                provider.deadline = self.deadline
+        if self.dynamic_provider:
+            self.dynamic_provider.backend = self.backend
+
+    def _get_provider_name(self, provider):
+        if provider is self.static_provider:
+            return 'static'
+        return self.opts.middleware
+
+    def _observe(self, provider, method, seconds):
+        name = self._get_provider_name(provider)
+        self.profiler.add('%s.%s' % (name, method), seconds)
+        self.metrics.set('call_duration_seconds', seconds,
+                         provider=name, method=method)
+
+    def _call(self, provider, method):
+        '''Call a provider method, measuring the time spent on it.'''
+        if self.deadline.expired():
+            raise exceptions.DeadlineExceeded()
+        start = timeit.default_timer()
+        result = getattr(provider, method)()
+        self._observe(provider, method, timeit.default_timer() - start)
+        return result
+
+    def get_info(self, method):
+        '''Get the merged static and dynamic info for a provider method.'''
+        # Sections may be rendered concurrently, make sure that each method
+        # is only collected once.
+        with self._locks.setdefault(method, threading.Lock()):
+            if method not in self.info:
+                info = {}
+                for i in (self.static_provider, self.dynamic_provider):
+                    if not i:
+                        continue
+                    result = self._call(i, method)
+                    info.update(result)
+                self.info[method] = info
+        return self.info[method]
+
+    def iter_info(self, method):
+        '''Iterate over the merged entities of a provider method.
+
+        Unlike get_info, the entities of the dynamic provider are yielded as
+        they are produced and are not kept in the collector. The (few)
+        static entities are yielded at the end, unless they were overridden
+        by a dynamic one.
+        '''
+        if method in self.info:
+            for entity in six.iteritems(self.info[method]):
+                yield entity
+            return
+
+        static = {}
+        if self.static_provider:
+            static.update(self._call(self.static_provider, method))
+
+        if self.dynamic_provider:
+            iter_method = method.replace('get_', 'iter_', 1)
+            entities = profiling.timed_iter(
+                getattr(self.dynamic_provider, iter_method)(),
+                lambda seconds: self._observe(self.dynamic_provider,
+                                              iter_method, seconds))
+            for key, entity in entities:
+                # Stop at a complete entity if the time is over
+                if self.deadline.expired():
+                    raise exceptions.DeadlineExceeded()
+                static.pop(key, None)
+                yield key, entity
+
+        for entity in six.iteritems(static):
+            yield entity
+
+    def reset(self):
+        '''Forget the collected information, keeping the providers.
+
+        This starts a new run for the profiler and the metrics, and renews
+        the credentials of the dynamic provider if they are about to
+        expire.
+        '''
+        self.info = {}
+        self.deadline = utils.Deadline(self.opts.deadline)
+        self.skipped_sections = []
+        self._bind_providers()
+        self.profiler.start()
+        self.metrics.start()
+
+        if self.dynamic_provider:
+            self.backend.call(
+                self.dynamic_provider.renew, deadline=self.deadline,
+                is_transient=self.dynamic_provider.is_transient_error)
+
+    def prefetch(self, methods):
+        '''Collect several provider methods concurrently.
+
+        The calls to the providers are run in a thread pool bounded by the
+        number of collection workers, and their results are merged in the
+        same static-then-dynamic order used by get_info.
+        '''
+        methods = [m for m in sorted(set(methods)) if m not in self.info]
+        calls = [(i, m) for m in methods
+                 for i in (self.static_provider, self.dynamic_provider) if i]
+
+        workers = min(self.opts.collection_workers, len(calls))
+        if workers <= 1:
+            for method in methods:
+                self.get_info(method)
+            return
+
+        def call(args):
+            try:
+                return self._call(*args), None
+            except Exception as e:
+                return None, e
+
+        import multiprocessing.pool
+        pool = multiprocessing.pool.ThreadPool(workers)
+        try:
+            results = pool.map(call, calls)
+        finally:
+            pool.close()
+            pool.join()
+
+        # Keep the methods that were completely collected, even if others
+        # failed, so that their sections can still be rendered
+        info = {}
+        failed = set()
+        error = None
+        for (provider, method), (result, e) in zip(calls, results):
+            if e is not None:
+                failed.add(method)
+                error = error or e
+                continue
+            info.setdefault(method, {}).update(result)
+        for method in failed:
+            info.pop(method, None)
+        self.info.update(info)
+        if error is not None:
+            raise error
+
+    def report_metrics(self, success=True, output_size=None):
+        '''Write the metrics of the run.'''
+        for provider in (self.static_provider, self.dynamic_provider):
+            if not provider:
+                continue
+            name = self._get_provider_name(provider)
+            self.metrics.set('api_calls_total', provider.api_calls,
+                             provider=name)
+            self.metrics.set('api_received_bytes_total',
+                             provider.api_received_bytes, provider=name)
+
+        hits, misses = self.block_cache.hits, self.block_cache.misses
+        self.metrics.set('block_cache_hits_total', hits)
+        self.metrics.set('block_cache_misses_total', misses)
+        if hits + misses:
+            self.metrics.set('block_cache_hit_ratio',
+                             float(hits) / (hits + misses))
+
+        for section in self.skipped_sections:
+            self.metrics.set('skipped_sections', 1, section=section)
+
+        if output_size is not None:
+            self.metrics.set('output_bytes', output_size)
+        self.metrics.finish(success=success)
+
+
+def report_failure(opts, collector=None):
+    '''Write the profile and the metrics of a failed run.'''
+    if collector is not None:
+        collector.profiler.finish()
+        collector.report_metrics(success=False)
+    else:
+        metrics.get_metrics(opts).finish(success=False)
+
+
+class _LayeredEntities(utils.Mapping):
+    '''Read-only mapping of entities layered over the static info.
+
+    Entities are seen through a ChainMap (see utils.layer), so that they get
+    the (shared) service and site attributes without copying them into every
+    entity.
+    '''
+    def __init__(self, entities, static_info):
+        self.entities = entities
+        self.static_info = static_info
+
+    def __getitem__(self, key):
+        return utils.layer(self.entities[key], self.static_info)
+
+    def __iter__(self):
+        return iter(self.entities)
+
+    def __len__(self):
+        return len(self.entities)
+
+    def items(self):
+        for key, entity in six.iteritems(self.entities):
+            yield key, utils.layer(entity, self.static_info)
+
+
+class _StreamedEntities(object):
+    '''Entities layered over the static info as they are rendered.'''
+    def __init__(self, entities, static_info):
+        self.entities = entities
+        self.static_info = static_info
+        self.count = 0
+
+    def items(self):
+        for key, entity in self.entities:
+            self.count += 1
+            yield key, utils.layer(entity, self.static_info)
+
 
 class BaseBDII(object):
-    def __init__(self, opts):
+    section = None
+    provider_methods = ()
+    # Provider methods that are only needed if the section has endpoints
+    entity_methods = ()
+
+    def __init__(self, opts, collector=None):
         self.opts = opts
 
         self.templates = ()
         self.templates_files = {}
 
-        if (opts.middleware != 'static' and
-                opts.middleware in SUPPORTED_MIDDLEWARE):
-            self.dynamic_provider = SUPPORTED_MIDDLEWARE[opts.middleware](opts)
-        else:
-            self.dynamic_provider = None
+        if collector is None:
+            collector = Collector(opts)
+        self.collector = collector
+
+    @property
+    def static_provider(self):
+        return self.collector.static_provider
 
-        self.static_provider = SUPPORTED_MIDDLEWARE['static'](opts)
+    @property
+    def dynamic_provider(self):
+        return self.collector.dynamic_provider
 
     def load_templates(self):
         self.templates_files = {}
@@ -40,88 +382,191 @@ class BaseBDII(object):
             self.templates_files[tpl] = template_file
 
     def _get_info_from_providers(self, method):
-        info = {}
-        for i in (self.static_provider, self.dynamic_provider):
-            if not i:
-                continue
-            result = getattr(i, method)()
-            info.update(result)
-        return info
+        return self.collector.get_info(method)
+
+    def get_entity_methods(self):
+        '''Get the entity methods needed, once provider_methods are collected.
 
-    def _format_template(self, template, info, extra={}):
+        The entities (e.g. the templates and images) are not needed if the
+        section has no endpoints.
+        '''
+        return ()
+
+    def _count(self, section, kind, count):
+        self.collector.metrics.set('entities', count,
+                                   section=section, type=kind)
+
+    def _format_template(self, template, info, extra={}, out=None):
+        '''Render a template, writing it into out if it is given.'''
         info = info.copy()
         info.update(extra)
         t = self.templates_files[template]
-        tpl = mako.template.Template(filename=t)
-        return tpl.render(attributes=info)
+        tpl = template_cache.get_template(
+            t, cache_dir=self.opts.template_cache_dir)
+        data = {'attributes': info}
+        # Without a cache the blocks are rendered inline, without computing
+        # their keys
+        if self.collector.block_cache.enabled:
+            scope = [t, template_cache.get_stamp(t)]
+            data['blocks'] = self.collector.block_cache.bind(scope)
+        with self.collector.profiler.phase('render %s' % template):
+            if out is None:
+                return tpl.render(**data)
+            import mako.runtime
+            tpl.render_context(mako.runtime.Context(out, **data))
+
+    def render_stream(self, out):
+        '''Render the information, writing it into out as it is produced.'''
+        out.write(self.render())
+
+    def iter_objects(self):
+        '''Iterate over the GLUE2 entities, as ordered dicts.'''
+        return iter(())
 
 
 class StorageBDII(BaseBDII):
-    def __init__(self, opts):
-        super(StorageBDII, self).__init__(opts)
+    section = 'storage'
+    provider_methods = ('get_storage_endpoints', 'get_site_info')
+
+    def __init__(self, opts, collector=None):
+        super(StorageBDII, self).__init__(opts, collector=collector)
 
         self.templates = ['storage']
 
-    def render(self):
+    def _get_storage_info(self):
         endpoints = self._get_info_from_providers('get_storage_endpoints')
+        self._count('storage', 'endpoints',
+                    len(endpoints.get('endpoints', ())))
 
         if not endpoints.get('endpoints'):
-            return ''
+            return None
 
         site_info = self._get_info_from_providers('get_site_info')
         static_storage_info = dict(endpoints, **site_info)
         static_storage_info.pop('endpoints')
 
-        for url, endpoint in endpoints['endpoints'].items():
-            endpoint.update(static_storage_info)
+        endpoints = dict(endpoints, endpoints=_LayeredEntities(
+            endpoints['endpoints'], static_storage_info))
 
         info = {}
         info.update({'endpoints': endpoints})
         info.update({'static_storage_info': static_storage_info})
+        return info
 
+    def render(self):
+        info = self._get_storage_info()
+        if info is None:
+            return ''
         return self._format_template('storage', info)
 
+    def iter_objects(self):
+        info = self._get_storage_info()
+        if info is None:
+            return iter(())
+        from cloud_info import glue2
+        return glue2.StorageWriter(info).iter_objects()
+
 
 class ComputeBDII(BaseBDII):
-    def __init__(self, opts):
-        super(ComputeBDII, self).__init__(opts)
+    section = 'compute'
+    provider_methods = ('get_compute_endpoints', 'get_site_info')
+    entity_methods = ('get_templates', 'get_images')
+
+    def __init__(self, opts, collector=None):
+        super(ComputeBDII, self).__init__(opts, collector=collector)
 
         self.templates = ['compute']
 
-    def render(self):
+    def get_entity_methods(self):
         endpoints = self._get_info_from_providers('get_compute_endpoints')
+        if not endpoints.get('endpoints'):
+            return ()
+        return self.entity_methods
+
+    def _get_compute_info(self, stream=False):
+        endpoints = self._get_info_from_providers('get_compute_endpoints')
+        self._count('compute', 'endpoints',
+                    len(endpoints.get('endpoints', ())))
 
         if not endpoints.get('endpoints'):
-            return ''
+            return None
 
         site_info = self._get_info_from_providers('get_site_info')
         static_compute_info = dict(endpoints, **site_info)
         static_compute_info.pop('endpoints')
 
-        templates = self._get_info_from_providers('get_templates')
-        images = self._get_info_from_providers('get_images')
+        endpoints = dict(endpoints, endpoints=_LayeredEntities(
+            endpoints['endpoints'], static_compute_info))
 
-        for url, endpoint in endpoints['endpoints'].items():
-            endpoint.update(static_compute_info)
-
-        for template_id, template in templates.items():
-            template.update(static_compute_info)
+        if stream:
+            templates = _StreamedEntities(
+                self.collector.iter_info('get_templates'),
+                static_compute_info)
+            images = _StreamedEntities(
+                self.collector.iter_info('get_images'),
+                static_compute_info)
+        else:
+            templates = _LayeredEntities(
+                self._get_info_from_providers('get_templates'),
+                static_compute_info)
+            images = _LayeredEntities(
+                self._get_info_from_providers('get_images'),
+                static_compute_info)
 
-        for image_id, image in images.items():
-            image.update(static_compute_info)
+            self._count('compute', 'templates', len(templates))
+            self._count('compute', 'images', len(images))
 
         info = {}
         info.update({'endpoints': endpoints})
         info.update({'static_compute_info': static_compute_info})
         info.update({'templates': templates})
         info.update({'images': images})
+        return info
 
+    def render(self):
+        info = self._get_compute_info()
+        if info is None:
+            return ''
+        if self.opts.ldif_writer == 'native':
+            from cloud_info import glue2
+            with self.collector.profiler.phase('render compute'):
+                return glue2.render_compute(
+                    info, width=self.opts.ldif_fold_width,
+                    processes=self.opts.render_processes)
         return self._format_template('compute', info)
 
+    def render_stream(self, out):
+        info = self._get_compute_info(stream=True)
+        if info is None:
+            return
+        if self.opts.ldif_writer == 'native':
+            from cloud_info import glue2
+            with self.collector.profiler.phase('render compute'):
+                glue2.write_compute(info, out,
+                                    width=self.opts.ldif_fold_width,
+                                    processes=self.opts.render_processes)
+        else:
+            self._format_template('compute', info, out=out)
+            self._count('compute', 'templates', info['templates'].count)
+            self._count('compute', 'images', info['images'].count)
+
+    def iter_objects(self):
+        info = self._get_compute_info(stream=True)
+        if info is None:
+            return
+        from cloud_info import glue2
+        for obj in glue2.ComputeWriter(info).iter_objects():
+            yield obj
+        self._count('compute', 'templates', info['templates'].count)
+        self._count('compute', 'images', info['images'].count)
+
 
 class CloudBDII(BaseBDII):
-    def __init__(self, opts):
-        super(CloudBDII, self).__init__(opts)
+    section = 'cloud'
+    provider_methods = ('get_site_info', )
+
+    def __init__(self, opts, collector=None):
+        super(CloudBDII, self).__init__(opts, collector=collector)
 
         if not self.opts.full_bdii_ldif:
             self.templates = ('headers', 'clouddomain')
@@ -137,8 +582,107 @@ class CloudBDII(BaseBDII):
 
         return '\n'.join(output)
 
+    def iter_objects(self):
+        from cloud_info import glue2
+        info = self._get_info_from_providers('get_site_info')
+        writer = glue2.CloudWriter(info,
+                                   full_bdii=self.opts.full_bdii_ldif)
+        return writer.iter_objects()
+
+
+def prefetch_sections(bdiis):
+    '''Collect the information needed by the BDII sections.
+
+    The site information and the endpoints are collected first, then the
+    entities of the sections that have any endpoint. The entities are the
+    slowest to collect, so if the deadline is exceeded while collecting them
+    the other sections can still be written.
+    '''
+    collector = bdiis[0].collector
+    collector.prefetch(
+        itertools.chain(*[b.provider_methods for b in bdiis]))
+    collector.prefetch(
+        itertools.chain(*[b.get_entity_methods() for b in bdiis]))
+
+
+def collect_all(collector):
+    '''Collect the information needed by all the sections.'''
+    prefetch_sections([cls_(collector.opts, collector=collector)
+                       for cls_ in (CloudBDII, ComputeBDII, StorageBDII)])
+    return collector.info
+
+
+def refresh_snapshot(opts):
+    '''Collect all the information and store it in the snapshot.'''
+    from cloud_info import snapshot
+    snap = snapshot.Snapshot(opts.snapshot_file)
+    lock = snap.lock()
+    if lock is None:
+        # Another refresh is already running
+        return None
+    try:
+        collector = Collector(opts)
+        snap.save(collect_all(collector))
+    finally:
+        lock.close()
+    return collector
+
+
+def get_collector(opts, argv=None):
+    '''Get the collection session for this run.
+
+    If a snapshot file is configured and its information is fresh enough,
+    the collector will use it without querying the providers. A stale (but
+    not expired) snapshot is used as well, but a background refresh is
+    started so that the next run gets up to date information. An expired
+    snapshot is only used if it cannot be refreshed.
+    '''
+    if not opts.snapshot_file:
+        return Collector(opts)
+
+    from cloud_info import snapshot
+    snap = snapshot.Snapshot(opts.snapshot_file)
+    data = snap.load()
+    if data is not None:
+        timestamp, info = data
+        age = snap.age(timestamp)
+        if age <= opts.snapshot_max_staleness:
+            if age > opts.snapshot_ttl:
+                if argv is None:
+                    argv = sys.argv[1:]
+                snap.refresh_in_background(argv)
+            return Collector(opts, info=info)
+
+    try:
+        collector = refresh_snapshot(opts)
+        if collector is None:
+            collector = Collector(opts)
+    except Exception:
+        if data is None:
+            raise
+        # e.g. the backend is down, old information is better than none
+        logger.exception('Cannot refresh the snapshot, using the one '
+                         'collected %d seconds ago', age)
+        return Collector(opts, info=info)
+    return collector
+
+
+def get_middleware(argv):
+    '''Get the middleware selected in the command line arguments.'''
+    preparser = argparse.ArgumentParser(add_help=False,
+                                        fromfile_prefix_chars='@')
+    preparser.add_argument('--middleware', default='static')
+    return preparser.parse_known_args(argv)[0].middleware
+
+
+def parse_opts(argv=None):
+    if argv is None:
+        argv = sys.argv[1:]
+
+    # Only the options of the selected provider are needed, so parse the
+    # middleware first to avoid loading all the providers.
+    middleware = get_middleware(argv)
 
-def parse_opts():
     parser = argparse.ArgumentParser(
         description='Cloud BDII provider',
         formatter_class=argparse.ArgumentDefaultsHelpFormatter,
@@ -155,6 +699,15 @@ def parse_opts():
               'a dynamic provider is used and it is not able to produce any '
               'of the required values, or when using the static provider. '))
 
+    parser.add_argument(
+        '--yaml-cache-dir',
+        metavar='DIR',
+        default=None,
+        help=('Directory where the parsed YAML file is stored, so that it '
+              'is not parsed again on every run unless it is modified. It '
+              'must only be writable by trusted users. If not set, the '
+              'file is only parsed once per process.'))
+
     parser.add_argument(
         '--template-dir',
         default='/etc/cloud-info-provider/templates',
@@ -165,6 +718,76 @@ def parse_opts():
         default='ldif',
         help=('Extension to use for the templates'))
 
+    parser.add_argument(
+        '--template-cache-dir',
+        metavar='DIR',
+        default=None,
+        help=('Directory where the compiled templates are stored, so that '
+              'they are not compiled again on every run. The compiled '
+              'templates are Python modules that are executed, so it must '
+              'only be writable by trusted users: it is created only '
+              'accessible by the current user, and ignored if other users '
+              'can write into it. If not set, templates are only cached in '
+              'memory (e.g. when running as a daemon).'))
+
+    parser.add_argument(
+        '--block-cache-file',
+        metavar='FILE',
+        default=None,
+        help=('File where the blocks rendered for each endpoint, template '
+              'and image are stored, so that the next run only renders '
+              'the entities that changed.'))
+
+    parser.add_argument(
+        '--block-cache-size',
+        metavar='BLOCKS',
+        type=int,
+        default=10000,
+        help=('Maximum number of rendered blocks to cache. Blocks are '
+              'cached in memory when running as a daemon, or on disk if '
+              '--block-cache-file is set. Set to 0 to disable the cache.'))
+
+    parser.add_argument(
+        '--format',
+        choices=('ldif', 'json'),
+        default='ldif',
+        help=('Output format. With json, the GLUE2 entities are written '
+              'as JSON objects, one per line, directly from the collected '
+              'information without using the templates. The templates and '
+              'images are written as they are collected, as with '
+              '--stream. --ldif-delta-state only applies to the LDIF '
+              'output.'))
+
+    parser.add_argument(
+        '--ldif-writer',
+        choices=('template', 'native'),
+        default='template',
+        help=('How the compute entries are rendered: with the compute '
+              'template, or with the native GLUE2 writer. The native '
+              'writer produces LDIF equivalent to the shipped template '
+              'much faster, but it ignores any change made to it. Unlike '
+              'the template, it base64 encodes the values that are not '
+              'safe LDIF strings: non-ASCII ones, those starting with a '
+              'space, ":" or "<", or containing CR or NUL.'))
+
+    parser.add_argument(
+        '--ldif-fold-width',
+        metavar='COLUMNS',
+        type=int,
+        default=0,
+        help=('Fold the LDIF lines written by the native writer that are '
+              'longer than this. By default lines are not folded.'))
+
+    parser.add_argument(
+        '--render-processes',
+        metavar='N',
+        type=int,
+        default=1,
+        help=('Number of processes where the native writer renders the '
+              'compute templates and images, split in shards. Only '
+              'worth it for catalogs with tens of thousands of images. '
+              'The output is the same as when rendering them serially.'))
+
     parser.add_argument(
         '--full-bdii-ldif',
         action='store_true',
@@ -180,30 +803,426 @@ def parse_opts():
         help=('Whether to include the site name in the generated DN\'s'
               'suffix (Use only for execution as a site-BDII provider)'))
 
+    parser.add_argument(
+        '--collection-workers',
+        metavar='WORKERS',
+        type=int,
+        default=1,
+        help=('Number of threads used to query the providers concurrently. '
+              'By default the information is collected sequentially.'))
+
+    parser.add_argument(
+        '--parallel-sections',
+        action='store_true',
+        default=False,
+        help=('Collect and render the Cloud, Compute and Storage sections '
+              'concurrently. The sections are still printed in that '
+              'order. With --collection-workers the information is '
+              'collected by the workers, and only the rendering is done '
+              'concurrently.'))
+
+    parser.add_argument(
+        '--deadline',
+        metavar='SECONDS',
+        type=float,
+        default=None,
+        help=('Time budget of the whole run (or of each daemon refresh). '
+              'Every call to the backends gets the time left in it as its '
+              'timeout. Once it is exceeded, only the sections that are '
+              'complete are written (unless --ldif-delta-state is set, '
+              'then the run fails), while the daemon keeps serving the '
+              'previous output. By default there is no deadline.'))
+
+    parser.add_argument(
+        '--backend-retries',
+        metavar='N',
+        type=int,
+        default=0,
+        help=('Number of times a call to the backend of the provider is '
+              'retried after a transient error (e.g. a 5xx response, a '
+              'timeout or a refused connection). Retries are not started '
+              'if they cannot be made before the --deadline. By default '
+              'calls are not retried.'))
+
+    parser.add_argument(
+        '--backend-retry-delay',
+        metavar='SECONDS',
+        type=float,
+        default=0.5,
+        help=('Base of the exponential backoff between retries. The n-th '
+              'retry waits a random time of up to SECONDS * 2^n seconds.'))
+
+    parser.add_argument(
+        '--circuit-breaker-threshold',
+        metavar='N',
+        type=int,
+        default=0,
+        help=('Number of consecutive failed calls after which the backend '
+              'is considered down and it is not called until '
+              '--circuit-breaker-reset seconds later. Meanwhile the '
+              'expired --snapshot-file is used, if any. By default (0) '
+              'there is no circuit breaker.'))
+
+    parser.add_argument(
+        '--circuit-breaker-reset',
+        metavar='SECONDS',
+        type=int,
+        default=300,
+        help=('Time after which a backend considered down is called '
+              'again.'))
+
+    parser.add_argument(
+        '--circuit-breaker-file',
+        metavar='FILE',
+        default=None,
+        help=('File where the state of the circuit breaker is stored, so '
+              'that it is kept across runs. If not set, it is only kept in '
+              'memory (e.g. when running as a daemon).'))
+
+    parser.add_argument(
+        '--snapshot-file',
+        metavar='FILE',
+        default=None,
+        help=('Path to a file where the collected information is stored. '
+              'If it is fresh enough, the output is rendered from it '
+              'without querying the providers.'))
+
+    parser.add_argument(
+        '--snapshot-ttl',
+        metavar='SECONDS',
+        type=int,
+        default=300,
+        help=('Time after which the snapshot is considered stale. A stale '
+              'snapshot is still used, but it is refreshed in the '
+              'background.'))
+
+    parser.add_argument(
+        '--snapshot-max-staleness',
+        metavar='SECONDS',
+        type=int,
+        default=3600,
+        help=('Maximum age of a snapshot that can be used. Older snapshots '
+              'are refreshed before producing any output.'))
+
+    parser.add_argument(
+        '--snapshot-refresh',
+        action='store_true',
+        default=False,
+        help=argparse.SUPPRESS)
+
+    parser.add_argument(
+        '--stream',
+        action='store_true',
+        default=False,
+        help=('Render the templates and images one by one as the dynamic '
+              'provider produces them, writing the output directly to '
+              'stdout. Memory usage will not grow with the size of the '
+              'catalog, but the whole output is not validated before being '
+              'written. Cannot be used with --ldif-delta-state.'))
+
+    parser.add_argument(
+        '--ldif-delta-state',
+        metavar='FILE',
+        default=None,
+        help=('Output only the LDIF change records (add, modify and delete) '
+              'needed to go from the entries produced by the previous run, '
+              'that are stored in this file, to the current ones.'))
+
+    parser.add_argument(
+        '--profile',
+        action='store_true',
+        default=False,
+        help=('Write the time spent in each phase of the run (provider '
+              'initialization, provider calls, template rendering and '
+              'output) to stderr, and profile the run with cProfile.'))
+
+    parser.add_argument(
+        '--profile-output',
+        metavar='FILE',
+        default=None,
+        help=('File where the cProfile statistics are dumped, in pstats '
+              'format. If not set, a summary is written to stderr.'))
+
+    parser.add_argument(
+        '--profile-sample-rate',
+        metavar='RATE',
+        type=float,
+        default=1.0,
+        help=('Fraction of the runs (between 0 and 1) that are profiled '
+              'when --profile is set, so that it can be left enabled.'))
+
+    parser.add_argument(
+        '--metrics-file',
+        metavar='FILE',
+        default=None,
+        help=('File where the metrics of each run (or daemon refresh) are '
+              'written in the node exporter textfile collector format. '
+              'It must have the .prom extension and be in the directory '
+              'of the node exporter textfile collector.'))
+
+    parser.add_argument(
+        '--daemon',
+        action='store_true',
+        default=False,
+        help=('Run as a daemon that refreshes the information periodically '
+              'and serves the latest output over a UNIX socket. Use '
+              'cloud-info-provider-client to retrieve it.'))
+
+    parser.add_argument(
+        '--daemon-socket',
+        metavar='PATH',
+        default=client.DEFAULT_SOCKET,
+        help=('Path to the UNIX socket where the daemon listens.'))
+
+    parser.add_argument(
+        '--daemon-socket-mode',
+        metavar='MODE',
+        type=lambda mode: int(mode, 8),
+        default=0o600,
+        help=('Permissions (in octal) of the daemon socket. Only its owner '
+              'can connect to it by default, as the output may include '
+              'information derived from the provider credentials. Use '
+              'e.g. 0660 to let the group of the daemon user retrieve it.'))
+
+    parser.add_argument(
+        '--daemon-interval',
+        metavar='SECONDS',
+        type=int,
+        default=300,
+        help=('Time between two refreshes of the daemon information.'))
+
+    # Scanning the entry points takes a while, so it is only done to show the
+    # help
+    show_help = '-h' in argv or '--help' in argv
+    if show_help:
+        available = get_middleware_names()
+    else:
+        available = sorted(SUPPORTED_MIDDLEWARE)
+
     parser.add_argument(
         '--middleware',
         metavar='MIDDLEWARE',
-        choices=SUPPORTED_MIDDLEWARE,
         default='static',
         help=('Middleware used. Only the following middlewares are '
               'supported: %s. If you do not specify anything, static '
-              'values will be used.' % SUPPORTED_MIDDLEWARE.keys()))
+              'values will be used.' % ', '.join(available)))
+
+    if show_help:
+        names = available
+    else:
+        names = sorted(set(['static', middleware]))
 
-    for provider_name, provider in SUPPORTED_MIDDLEWARE.items():
+    for provider_name in names:
+        provider = load_provider(provider_name)
+        if provider is None:
+            parser.error('Unsupported middleware: %s' % provider_name)
         group = parser.add_argument_group('%s provider options' %
                                           provider_name)
         provider.populate_parser(group)
 
-    return parser.parse_args()
+    opts = parser.parse_args(argv)
+    if opts.render_processes > 1 and opts.ldif_writer != 'native':
+        parser.error('--render-processes requires --ldif-writer native')
+    if opts.stream and opts.ldif_delta_state:
+        parser.error('--stream cannot be used with --ldif-delta-state')
+    return opts
+
+
+def _skip_section(bdii, partial):
+    '''Whether a section that failed can be left out of the output.
+
+    That is only the case when partial output is allowed and the deadline
+    of the run was exceeded.
+    '''
+    collector = bdii.collector
+    if not partial or not collector.deadline.expired():
+        return False
+    logger.warning('Deadline exceeded, leaving the %s section out of the '
+                   'output', bdii.section)
+    collector.skipped_sections.append(bdii.section)
+    return True
+
+
+def _render(bdii, partial=False):
+    try:
+        bdii.load_templates()
+        return bdii.render()
+    except Exception:
+        if not _skip_section(bdii, partial):
+            raise
+        return None
+
+
+def _prefetch(bdiis, partial=False):
+    try:
+        prefetch_sections(bdiis)
+    except Exception:
+        # The sections are rendered with whatever was collected
+        if not (partial and bdiis[0].collector.deadline.expired()):
+            raise
+
+
+def render_sections(bdiis, parallel=False, partial=False):
+    '''Render the BDII sections, yielding their output in order.
+
+    If parallel is set, the sections are collected and rendered in
+    concurrent threads, buffering the ones that are ready before the
+    sections preceding them. With several collection workers the
+    information is collected by them beforehand instead. If partial is
+    set, the sections that cannot be completed before the deadline are left
+    out instead of failing.
+    '''
+    if not parallel:
+        _prefetch(bdiis, partial=partial)
+        for bdii in bdiis:
+            output = _render(bdii, partial=partial)
+            if output is not None:
+                yield output
+        return
+
+    if bdiis[0].collector.opts.collection_workers > 1:
+        _prefetch(bdiis, partial=partial)
+
+    import multiprocessing.pool
+    pool = multiprocessing.pool.ThreadPool(len(bdiis))
+    try:
+        for output in pool.imap(lambda bdii: _render(bdii, partial=partial),
+                                bdiis):
+            if output is not None:
+                yield output
+    finally:
+        pool.terminate()
+        pool.join()
+
+
+def stream_sections(bdiis, out, partial=False):
+    '''Render the BDII sections writing them into out as they are produced.
+
+    The templates and images of the dynamic provider are rendered one by one
+    as the provider produces them, so memory usage does not depend on the
+    size of the catalog. If partial is set, a section that cannot be
+    completed before the deadline is cut after its last complete entry.
+    '''
+    for bdii in bdiis:
+        try:
+            bdii.load_templates()
+            bdii.render_stream(out)
+        except Exception:
+            if not _skip_section(bdii, partial):
+                raise
+        out.write('\n')
+    out.flush()
+
+
+def write_json(bdiis, out, partial=False):
+    '''Write the GLUE2 entities of the BDII sections into out as JSON.
+
+    Every entity is written as a JSON object in its own line, as soon as it
+    is produced, so memory usage does not depend on the size of the
+    catalog. If partial is set, a section that cannot be completed before
+    the deadline is cut after its last complete entity.
+    '''
+    encoder = json.JSONEncoder(default=six.text_type)
+    for bdii in bdiis:
+        try:
+            for obj in bdii.iter_objects():
+                out.write(encoder.encode(obj) + '\n')
+        except Exception:
+            if not _skip_section(bdii, partial):
+                raise
+    out.flush()
+
+
+class _CountingWriter(object):
+    '''File-like object counting the bytes written into another one.'''
+    def __init__(self, out):
+        self.out = out
+        self.size = 0
+
+    def write(self, data):
+        self.size += len(data)
+        self.out.write(data)
+
+    def flush(self):
+        self.out.flush()
+
+
+def write_output(opts, bdiis, out=None):
+    '''Render the BDII sections and write them into out.
+
+    The output is written as UTF-8 into out, a binary file that defaults to
+    stdout. Returns the size of the output.
+    '''
+    collector = bdiis[0].collector
+    if out is None:
+        out = getattr(sys.stdout, 'buffer', sys.stdout)
+    out = _CountingWriter(out)
+
+    # With a deadline, the sections that are complete are better than no
+    # output at all. A partial delta would delete the missing entries.
+    partial = opts.deadline is not None and not opts.ldif_delta_state
+
+    if opts.format == 'json':
+        write_json(bdiis, codecs.getwriter('utf-8')(out), partial=partial)
+        return out.size
+
+    if opts.stream:
+        stream_sections(bdiis, codecs.getwriter('utf-8')(out),
+                        partial=partial)
+        return out.size
+
+    sections = render_sections(bdiis, parallel=opts.parallel_sections,
+                               partial=partial)
+    state = None
+    if opts.ldif_delta_state:
+        from cloud_info import ldif
+        state = ldif.DeltaState(opts.ldif_delta_state)
+        sections = [state.delta('\n'.join(sections))]
+
+    # Rendering is lazy, so make sure that it is not included in the output
+    sections = list(sections)
+    with collector.profiler.phase('output'):
+        for output in sections:
+            out.write(output.encode('utf-8') + b'\n')
+        out.flush()
+    # Only once the changes are delivered, otherwise they would be lost
+    if state is not None:
+        state.commit()
+    return out.size
+
+
+def run(opts, argv=None, out=None):
+    '''Collect and render the information once, writing it into out.'''
+    collector = None
+    output_size = None
+    try:
+        collector = get_collector(opts, argv=argv)
+        bdiis = [cls_(opts, collector=collector)
+                 for cls_ in (CloudBDII, ComputeBDII, StorageBDII)]
+        output_size = write_output(opts, bdiis, out=out)
+        collector.block_cache.save()
+    finally:
+        # Failed runs are reported as well, that is when they matter most
+        if output_size is None:
+            report_failure(opts, collector)
+        else:
+            collector.profiler.finish()
+            collector.report_metrics(output_size=output_size)
 
 
 def main():
     opts = parse_opts()
 
-    for cls_ in (CloudBDII, ComputeBDII, StorageBDII):
-        bdii = cls_(opts)
-        bdii.load_templates()
-        print(bdii.render().encode('utf-8'))
+    if opts.snapshot_refresh:
+        refresh_snapshot(opts)
+        return
+
+    if opts.daemon:
+        from cloud_info import daemon
+        daemon.Daemon(opts).run()
+        return
+
+    run(opts)
 
 if __name__ == '__main__':
     main()
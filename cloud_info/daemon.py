@@ -0,0 +1,136 @@
+import logging
+import os
+import signal
+import threading
+
+import six
+from six.moves import socketserver
+
+from cloud_info import core
+
+logger = logging.getLogger(__name__)
+
+
+class _Handler(socketserver.BaseRequestHandler):
+    def handle(self):
+        output = self.server.daemon.output
+        if output:
+            self.request.sendall(output)
+
+
+class _Server(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, path, daemon):
+        self.daemon = daemon
+        socketserver.UnixStreamServer.__init__(self, path, _Handler)
+
+
+class Daemon(object):
+    '''Long running provider serving its output over a UNIX socket.
+
+    The providers (and therefore their authentication) are kept between
+    refreshes, that are run every opts.daemon_interval seconds. If a refresh
+    fails, the output of the last successful one keeps being served.
+    SIGHUP rebuilds the providers, SIGTERM and SIGINT stop the daemon.
+    '''
+    def __init__(self, opts):
+        self.opts = opts
+
+        self.output = None
+        self.collector = None
+        self.bdiis = []
+        self.server = None
+
+        self._wakeup = threading.Event()
+        self._reload = False
+        self._stop = False
+
+    def load(self):
+        '''Build the providers and the BDII renderers.'''
+        self.collector = core.Collector(self.opts)
+        self.bdiis = [cls_(self.opts, collector=self.collector)
+                      for cls_ in (core.CloudBDII,
+                                   core.ComputeBDII,
+                                   core.StorageBDII)]
+
+    def refresh(self):
+        '''Collect and render the information again.
+
+        Returns True if the output was updated.
+        '''
+        try:
+            if self.collector is None or self._reload:
+                self.load()
+                # Only now, a failed reload is retried on the next refresh
+                self._reload = False
+            else:
+                self.collector.reset()
+
+            if self.opts.format == 'json':
+                out = six.StringIO()
+                core.write_json(self.bdiis, out)
+                output = out.getvalue()
+            else:
+                sections = core.render_sections(
+                    self.bdiis, parallel=self.opts.parallel_sections)
+                output = ''.join('%s\n' % s for s in sections)
+        except Exception:
+            logger.exception('Cannot refresh the information, serving the '
+                             'last good output')
+            core.report_failure(self.opts, self.collector)
+            return False
+
+        self.output = output.encode('utf-8')
+        self.collector.block_cache.save()
+        self.collector.profiler.finish()
+        self.collector.report_metrics(output_size=len(self.output))
+        return True
+
+    def serve(self):
+        '''Start serving the output in a background thread.'''
+        path = self.opts.daemon_socket
+        if os.path.exists(path):
+            os.unlink(path)
+        # The socket must not be accessible, not even briefly, by anyone
+        # but its owner until its mode is set
+        umask = os.umask(0o177)
+        try:
+            self.server = _Server(path, self)
+        finally:
+            os.umask(umask)
+        os.chmod(path, self.opts.daemon_socket_mode)
+        thread = threading.Thread(target=self.server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        return thread
+
+    def reload(self, *args):
+        self._reload = True
+        self._wakeup.set()
+
+    def stop(self, *args):
+        self._stop = True
+        self._wakeup.set()
+
+    def shutdown(self):
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
+            if os.path.exists(self.opts.daemon_socket):
+                os.unlink(self.opts.daemon_socket)
+
+    def run(self):
+        signal.signal(signal.SIGHUP, self.reload)
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+
+        self.serve()
+        try:
+            while not self._stop:
+                self.refresh()
+                self._wakeup.wait(self.opts.daemon_interval)
+                self._wakeup.clear()
+        finally:
+            self.shutdown()
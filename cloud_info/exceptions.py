@@ -34,3 +34,16 @@ class StaticProviderException(BaseException):
 
 class OpenNebulaProviderException(BaseException):
     pass
+
+
+class DeadlineExceeded(BaseException):
+    msg_fmt = 'The deadline of the run was exceeded.'
+
+
+class BackendUnavailable(BaseException):
+    msg_fmt = ('The %(backend)s backend is unavailable, it will not be '
+               'called for %(seconds)d seconds.')
+
+
+class OpenNebulaInternalError(OpenNebulaProviderException):
+    pass
@@ -0,0 +1,200 @@
+'''Render the information of many sites in a single invocation.
+
+The sites are described in a YAML manifest, each one with the command line
+options of cloud-info-provider-service and the file where its output is
+written:
+
+    # Options shared by all the sites (optional)
+    defaults: [--middleware, openstack]
+    sites:
+        SITE-A:
+            output: /var/lib/cloud-info-provider/site-a.ldif
+            options: [--yaml-file, /etc/cloud-info-provider/site-a.yaml,
+                      --os-password, secret]
+        SITE-B:
+            output: /var/lib/cloud-info-provider/site-b.ldif
+            options: ['@/etc/cloud-info-provider/site-b.args']
+
+Sites are collected and rendered in a pool of processes, so that the
+interpreter and the providers are loaded only once for all of them. A
+failing site does not affect the others, and its output file is kept as it
+was, as every output is written atomically.
+'''
+
+from __future__ import print_function
+
+import argparse
+import collections
+import logging
+import multiprocessing
+import sys
+import time
+import traceback
+
+import six
+
+from cloud_info import core
+from cloud_info import utils
+
+logger = logging.getLogger(__name__)
+
+Site = collections.namedtuple('Site', ('name', 'argv', 'output'))
+
+
+class ManifestError(Exception):
+    pass
+
+
+def _get_options(options, what):
+    if options is None:
+        return []
+    if not isinstance(options, list) or any(isinstance(o, (dict, list))
+                                            for o in options):
+        raise ManifestError('The options of %s must be a list of command '
+                            'line arguments' % what)
+    return [six.text_type(o) for o in options]
+
+
+def load_manifest(path):
+    '''Load the sites of a manifest, sorted by name.'''
+    import yaml
+
+    with open(path) as f:
+        try:
+            manifest = yaml.safe_load(f)
+        except yaml.YAMLError as e:
+            raise ManifestError('Cannot parse %s: %s' % (path, e))
+
+    if not isinstance(manifest, dict) or not isinstance(
+            manifest.get('sites'), dict):
+        raise ManifestError('%s does not have a "sites" mapping' % path)
+
+    defaults = _get_options(manifest.get('defaults'), 'defaults')
+    sites = []
+    for name, data in sorted(manifest['sites'].items()):
+        if not isinstance(data, dict) or not data.get('output'):
+            raise ManifestError('Site %s does not have an output file' %
+                                name)
+        argv = defaults + _get_options(data.get('options'), 'site %s' % name)
+        sites.append(Site(six.text_type(name), argv, data['output']))
+    return sites
+
+
+def render_site(site):
+    '''Collect and render a site, writing its output atomically.
+
+    Returns a (name, error, duration) tuple, where error is None if the
+    site was rendered or the formatted exception otherwise.
+    '''
+    start = time.time()
+    try:
+        opts = core.parse_opts(site.argv)
+        with utils.atomic_open(site.output) as out:
+            core.run(opts, argv=site.argv, out=out)
+    except (Exception, SystemExit):
+        # SystemExit is raised by argparse on invalid options
+        return site.name, traceback.format_exc(), time.time() - start
+    return site.name, None, time.time() - start
+
+
+def preload_providers(sites):
+    '''Import the providers of the sites before starting the pool.
+
+    The worker processes are forked afterwards, so they do not need to
+    import them again.
+    '''
+    names = set(['static'])
+    for site in sites:
+        try:
+            names.add(core.get_middleware(site.argv))
+        except (Exception, SystemExit):
+            # The site will fail when parsing its options
+            pass
+    for name in sorted(names):
+        try:
+            core.load_provider(name)
+        except Exception:
+            logger.debug('Cannot preload provider %s', name, exc_info=True)
+
+
+def render_sites(sites, processes=1):
+    '''Render the sites, yielding the results as they finish.'''
+    if processes <= 1 or len(sites) <= 1:
+        for site in sites:
+            yield render_site(site)
+        return
+
+    preload_providers(sites)
+    pool = multiprocessing.Pool(min(processes, len(sites)))
+    try:
+        for result in pool.imap_unordered(render_site, sites):
+            yield result
+        pool.close()
+    finally:
+        pool.terminate()
+        pool.join()
+
+
+def parse_opts(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Cloud Information provider for many sites',
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+
+    parser.add_argument(
+        'manifest',
+        metavar='MANIFEST',
+        help='YAML manifest with the options and output file of each site.')
+
+    parser.add_argument(
+        '--processes',
+        metavar='N',
+        type=int,
+        default=multiprocessing.cpu_count(),
+        help='Number of sites rendered in parallel.')
+
+    parser.add_argument(
+        '--site',
+        dest='sites',
+        metavar='NAME',
+        action='append',
+        help=('Only render this site of the manifest. Can be given several '
+              'times.'))
+
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    opts = parse_opts(argv)
+    try:
+        sites = load_manifest(opts.manifest)
+    except (IOError, OSError, ManifestError) as e:
+        print('Cannot load the manifest: %s' % e, file=sys.stderr)
+        return 2
+
+    if opts.sites:
+        unknown = set(opts.sites) - set(site.name for site in sites)
+        if unknown:
+            print('Unknown sites: %s' % ', '.join(sorted(unknown)),
+                  file=sys.stderr)
+            return 2
+        sites = [site for site in sites if site.name in opts.sites]
+
+    failed = []
+    for name, error, duration in render_sites(sites, opts.processes):
+        if error is None:
+            logger.info('Rendered site %s in %.2fs', name, duration)
+        else:
+            print('Cannot render site %s:\n%s' % (name, error),
+                  file=sys.stderr)
+            failed.append(name)
+
+    if failed:
+        print('%d of %d sites failed: %s' % (
+            len(failed), len(sites), ', '.join(sorted(failed))),
+            file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,835 @@
+'''Native writers of the GLUE2 entries.
+
+They build the entries directly from the collected information, either as
+LDIF or as objects (e.g. to be written as JSON). The compute LDIF is the
+same as the one of the compute template, without evaluating the template
+expressions for every endpoint, template and image. Values that cannot be
+written as they are (e.g. non-ASCII ones) are base64 encoded, and lines can
+be folded to a given width.
+'''
+
+import collections
+import itertools
+import logging
+import operator
+import re
+
+import six
+
+from cloud_info import ldif
+from cloud_info import utils
+
+logger = logging.getLogger(__name__)
+
+# Values starting with a space, a colon or a "<", and characters that are
+# never written as they are. Entries where they appear are formatted value
+# by value, so false positives only make them slower.
+_UNSAFE_START = re.compile(u': [ :<]')
+_UNSAFE_CHARS = (u'\r', u'\x00')
+
+
+def _encodes_to_ascii(text):
+    try:
+        text.encode('ascii')
+    except UnicodeError:
+        return False
+    return True
+
+
+# Constant time, when available
+_is_ascii = getattr(six.text_type, 'isascii', _encodes_to_ascii)
+
+
+def _is_safe(text):
+    if not _is_ascii(text) or _UNSAFE_START.search(text):
+        return False
+    for c in _UNSAFE_CHARS:
+        if c in text:
+            return False
+    return True
+
+
+class _EntryFormat(object):
+    '''Format of the LDIF entries with a fixed set of attributes.
+
+    The entry is given as a list of (attribute, value) pairs, where the
+    value is None for the attributes whose value is passed to format(). The
+    lines with a None attribute are written as they are (e.g. comments).
+    '''
+    def __init__(self, lines):
+        self.lines = lines
+
+        fmt = [u'dn: %s']
+        for attr, value in lines:
+            if attr is None:
+                fmt.append(value.replace('%', '%%'))
+            elif value is None:
+                fmt.append(u'%s: %%s' % attr)
+            else:
+                fmt.append(u'%s: %s' % (attr, value.replace('%', '%%')))
+        self.fmt = u'\n'.join(fmt) + u'\n\n'
+        self.newlines = self.fmt.count(u'\n')
+
+        attrs = [attr for attr, value in lines if attr is not None]
+        self.multivalued = set(attr for attr in attrs
+                               if attrs.count(attr) > 1)
+
+    def as_dict(self, values):
+        '''Get an entry as an ordered dict, given its DN and its values.
+
+        Attributes with several values (e.g. objectClass) are lists, and
+        the lines without attribute are skipped.
+        '''
+        values = iter(values)
+        entry = collections.OrderedDict([('dn', next(values))])
+        for attr, value in self.lines:
+            if attr is None:
+                continue
+            if value is None:
+                value = next(values)
+            if attr in self.multivalued:
+                entry.setdefault(attr, []).append(value)
+            else:
+                entry[attr] = value
+        return entry
+
+    def format(self, values, width=0):
+        '''Format an entry, given its DN followed by the values.'''
+        return self.format_many((values, ), width)
+
+    def format_many(self, entries, width=0, batch_size=1000):
+        '''Format several entries, yielding them in batches.
+
+        Whether the values can be written as they are is checked once for
+        the whole batch, formatting its entries one by one only when needed.
+        '''
+        fmt = self.fmt
+        entries = iter(entries)
+        while True:
+            batch = list(itertools.islice(entries, batch_size))
+            if not batch:
+                return
+            text = u''.join([fmt % values for values in batch])
+            newlines = self.newlines * len(batch)
+            if text.count(u'\n') != newlines or not _is_safe(text):
+                text = u''.join([self._format_values(values)
+                                 for values in batch])
+            if width:
+                text = u'\n'.join(ldif.fold(line, width)
+                                  for line in text.split(u'\n'))
+            yield text
+
+    def _format_values(self, values):
+        values = iter(values)
+        lines = [ldif.format_attribute('dn', next(values))]
+        for attr, value in self.lines:
+            if attr is None:
+                lines.append(value)
+                continue
+            if value is None:
+                value = next(values)
+            lines.append(ldif.format_attribute(attr, value))
+        return u'\n'.join(lines) + u'\n\n'
+
+
+SERVICE = _EntryFormat([
+    ('objectClass', 'GLUE2Entity'),
+    ('objectClass', 'GLUE2Service'),
+    ('objectClass', 'GLUE2ComputingService'),
+    ('GLUE2ServiceAdminDomainForeignKey', None),
+    ('GLUE2ServiceID', None),
+    ('GLUE2ServiceQualityLevel', None),
+    ('GLUE2ServiceType', 'IaaS'),
+    ('GLUE2ServiceCapability', None),
+])
+
+MANAGER = _EntryFormat([
+    ('objectClass', 'GLUE2Entity'),
+    ('objectClass', 'GLUE2Manager'),
+    ('objectClass', 'GLUE2ComputingManager'),
+    ('GLUE2ManagerID', None),
+    ('GLUE2ManagerProductName', None),
+    ('GLUE2ManagerServiceForeignKey', None),
+    ('GLUE2ComputingManagerComputingServiceForeignKey', None),
+    ('GLUE2EntityName', None),
+    ('GLUE2ManagerProductVersion', None),
+    ('GLUE2ComputingManagerTotalLogicalCPUs', None),
+    ('GLUE2ComputingManagerWorkingAreaTotal', None),
+])
+
+ENDPOINT = _EntryFormat([
+    ('objectClass', 'GLUE2Entity'),
+    ('objectClass', 'GLUE2Endpoint'),
+    ('objectClass', 'GLUE2ComputingEndpoint'),
+    ('GLUE2EndpointHealthState', 'ok'),
+    ('GLUE2EndpointID', None),
+    ('GLUE2EndpointInterfaceName', None),
+    ('GLUE2EndpointQualityLevel', None),
+    ('GLUE2EndpointServiceForeignKey', None),
+    ('GLUE2EndpointServingState', None),
+    ('GLUE2EndpointURL', None),
+    ('GLUE2ComputingEndpointComputingServiceForeignKey', None),
+    ('GLUE2EndpointCapability', None),
+    ('GLUE2EndpointImplementationName', None),
+    ('GLUE2EndpointImplementationVersion', None),
+    ('GLUE2EndpointImplementor', None),
+    ('GLUE2EndpointInterfaceVersion', None),
+    (None, '#GLUE2EndpointSemantics:'),
+    (None, '#GLUE2EndpointSupportedProfile:'),
+    ('GLUE2EntityOtherInfo', None),
+    ('GLUE2EndpointTechnology', None),
+])
+
+EXECUTION_ENVIRONMENT = _EntryFormat([
+    ('objectClass', 'GLUE2Entity'),
+    ('objectClass', 'GLUE2Resource'),
+    ('objectClass', 'GLUE2ExecutionEnvironment'),
+    ('GLUE2ExecutionEnvironmentConnectivityIn', 'TRUE'),
+    ('GLUE2ExecutionEnvironmentConnectivityOut', 'TRUE'),
+    ('GLUE2ExecutionEnvironmentVirtualMachine', 'TRUE'),
+    ('GLUE2ExecutionEnvironmentMainMemorySize', None),
+    ('GLUE2ExecutionEnvironmentPlatform', None),
+    ('GLUE2ExecutionEnvironmentOSFamily', 'linux'),
+    ('GLUE2ResourceManagerForeignKey', None),
+    ('GLUE2EntityName', None),
+    ('GLUE2ExecutionEnvironmentComputingManagerForeignKey', None),
+    ('GLUE2ExecutionEnvironmentCPUModel', 'virtual model'),
+    ('GLUE2ExecutionEnvironmentCPUMultiplicity', 'multicpu-multicore'),
+    ('GLUE2ExecutionEnvironmentCPUVendor', 'virtual vendor'),
+    ('GLUE2ExecutionEnvironmentLogicalCPUs', None),
+    ('GLUE2ExecutionEnvironmentPhysicalCPUs', None),
+    ('GLUE2EntityOtherInfo', None),
+])
+
+APPLICATION_ENVIRONMENT = _EntryFormat([
+    ('objectClass', 'GLUE2Entity'),
+    ('objectClass', 'GLUE2ApplicationEnvironment'),
+    ('GLUE2ApplicationEnvironmentAppName', None),
+    ('GLUE2ApplicationEnvironmentAppVersion', None),
+    ('GLUE2ApplicationEnvironmentRepository', None),
+    ('GLUE2ApplicationEnvironmentDescription', None),
+    ('GLUE2EntityName', None),
+    ('GLUE2ApplicationEnvironmentComputingManagerForeignKey', None),
+])
+
+GROUP = _EntryFormat([
+    ('objectClass', 'GLUE2Group'),
+    ('GLUE2GroupID', None),
+])
+
+ORGANIZATION = _EntryFormat([
+    ('objectClass', 'organization'),
+    ('o', None),
+])
+
+DOMAIN = _EntryFormat([
+    ('objectClass', 'GLUE2AdminDomain'),
+    ('objectClass', 'GLUE2Domain'),
+    ('GLUE2DomainID', None),
+    ('GLUE2DomainDescription', None),
+    ('GLUE2DomainWWW', None),
+    ('GLUE2EntityOtherInfo', None),
+])
+
+LOCATION = _EntryFormat([
+    ('objectClass', 'GLUE2Location'),
+    ('GLUE2LocationID', None),
+    ('GLUE2LocationCountry', None),
+    ('GLUE2LocationDomainForeignKey', None),
+    ('GLUE2LocationLongitude', None),
+    ('GLUE2LocationLatitude', None),
+])
+
+CONTACT = _EntryFormat([
+    ('objectClass', 'GLUE2Contact'),
+    ('GLUE2ContactDetail', None),
+    ('GLUE2ContactID', None),
+    ('GLUE2ContactType', None),
+    ('GLUE2ContactDomainForeignKey', None),
+])
+
+BDII_SERVICE = _EntryFormat([
+    ('objectClass', 'GLUE2Service'),
+    ('GLUE2ServiceAdminDomainForeignKey', None),
+    ('GLUE2ServiceID', None),
+    ('GLUE2ServiceQualityLevel', None),
+    ('GLUE2ServiceType', 'bdii_site'),
+    ('GLUE2EntityName', None),
+    ('GLUE2ServiceCapability', 'information.model'),
+    ('GLUE2ServiceCapability', 'information.discovery'),
+    ('GLUE2ServiceCapability', 'information.monitoring'),
+    ('GLUE2ServiceComplexity', 'endpointType=1, share=0, resource=0'),
+])
+
+BDII_ENDPOINT = _EntryFormat([
+    ('objectClass', 'GLUE2Endpoint'),
+    ('GLUE2EndpointHealthState', 'ok'),
+    ('GLUE2EndpointID', None),
+    ('GLUE2EndpointInterfaceName', 'bdii_site'),
+    ('GLUE2EndpointQualityLevel', None),
+    ('GLUE2EndpointServiceForeignKey', None),
+    ('GLUE2EndpointServingState', None),
+    ('GLUE2EndpointURL', None),
+    ('GLUE2EndpointCapability', 'information.model'),
+    ('GLUE2EndpointCapability', 'information.discovery'),
+    ('GLUE2EndpointCapability', 'information.monitoring'),
+    ('GLUE2EndpointDowntimeInfo',
+     'See the GOC DB for downtimes: https://goc.egi.eu/'),
+    ('GLUE2EndpointHealthStateInfo', 'BDII Runnning [ OK ]'),
+    ('GLUE2EntityName', None),
+])
+
+BDII_POLICY = _EntryFormat([
+    ('objectClass', 'GLUE2AccessPolicy'),
+    ('objectClass', 'GLUE2Policy'),
+    ('GLUE2AccessPolicyEndpointForeignKey', None),
+    ('GLUE2PolicyID', None),
+    ('GLUE2PolicyRule', 'ALL'),
+    ('GLUE2PolicyScheme', 'org.glite.standard'),
+    ('GLUE2EntityName', None),
+])
+
+STORAGE_SERVICE = _EntryFormat([
+    ('objectClass', 'GLUE2Entity'),
+    ('objectClass', 'GLUE2Service'),
+    ('objectClass', 'GLUE2StorageService'),
+    ('GLUE2ServiceAdminDomainForeignKey', None),
+    ('GLUE2ServiceID', None),
+    ('GLUE2ServiceQualityLevel', None),
+    ('GLUE2ServiceType', 'STaaS'),
+    ('GLUE2ServiceCapability', None),
+])
+
+STORAGE_MANAGER = _EntryFormat([
+    ('objectClass', 'GLUE2Entity'),
+    ('objectClass', 'GLUE2Manager'),
+    ('objectClass', 'GLUE2StorageManager'),
+    ('GLUE2ManagerID', None),
+    ('GLUE2ManagerProductName', None),
+    ('GLUE2ManagerServiceForeignKey', None),
+    ('GLUE2StorageManagerStorageServiceForeignKey', None),
+    ('GLUE2EntityName', None),
+    ('GLUE2ManagerProductVersion', None),
+])
+
+STORAGE_ENDPOINT = _EntryFormat([
+    ('objectClass', 'GLUE2Entity'),
+    ('objectClass', 'GLUE2Endpoint'),
+    ('objectClass', 'GLUE2StorageEndpoint'),
+    ('GLUE2EndpointHealthState', 'ok'),
+    ('GLUE2EndpointID', None),
+    ('GLUE2EndpointInterfaceName', None),
+    ('GLUE2EndpointQualityLevel', None),
+    ('GLUE2EndpointServiceForeignKey', None),
+    ('GLUE2EndpointServingState', None),
+    ('GLUE2EndpointURL', None),
+    ('GLUE2StorageEndpointStorageServiceForeignKey', None),
+    ('GLUE2EndpointCapability', None),
+    ('GLUE2EndpointImplementationName', None),
+    ('GLUE2EndpointImplementationVersion', None),
+    ('GLUE2EndpointImplementor', None),
+    ('GLUE2EndpointInterfaceVersion', None),
+    ('GLUE2EntityOtherInfo', None),
+    ('GLUE2EndpointTechnology', None),
+])
+
+STORAGE_CAPACITY = _EntryFormat([
+    ('objectClass', 'GLUE2Entity'),
+    ('objectClass', 'GLUE2StorageServiceCapacity'),
+    ('GLUE2StorageServiceCapacityID', None),
+    ('GLUE2StorageServiceCapacityType', 'online'),
+    ('GLUE2StorageServiceCapacityStorageServiceForeignKey', None),
+    ('GLUE2StorageServiceCapacityTotalSize', None),
+])
+
+_TEMPLATE_KEYS = operator.itemgetter(
+    'template_id', 'compute_service_name', 'suffix', 'template_memory',
+    'template_platform', 'template_cpu', 'template_disk')
+
+_IMAGE_KEYS = operator.itemgetter(
+    'image_id', 'image_name', 'image_version', 'image_marketplace_id',
+    'image_description')
+
+
+def _format_description(image):
+    return (u'%(image_name)s version %(image_version)s on '
+            u'%(image_os_family)s %(image_os_name)s %(image_os_version)s '
+            u'%(image_platform)s' % image)
+
+
+def _values(entities):
+    return (entity for _, entity in entities.items())
+
+
+def _compact(entity):
+    # Only the attributes of the entity itself (and those written over it),
+    # without the static info that it is layered over
+    maps = getattr(entity, 'maps', None)
+    if maps is None:
+        return dict(entity)
+    overlay, own = maps[0], maps[-1]
+    if not overlay:
+        return own
+    compact = dict(own)
+    compact.update(overlay)
+    return compact
+
+
+def _get(entity, getter):
+    # Entities are usually layered under the static info (see utils.layer).
+    # Going through the layers is much slower, so use the entity itself
+    # unless the other layers hide any of its attributes
+    maps = getattr(entity, 'maps', None)
+    if maps is not None:
+        own = maps[-1]
+        if not any(key in layer for layer in maps[:-1] for key in own):
+            try:
+                return getter(own)
+            except KeyError:
+                pass
+    return getter(entity)
+
+
+class _Writer(object):
+    def __init__(self, info, width=0):
+        self.info = info
+        self.width = width
+
+    def iter_kinds(self):
+        '''Iterate over the kinds of entries, in output order.
+
+        Yields the format of each kind together with an iterable of the
+        values of its entries (the DN followed by the attribute values).
+        '''
+        raise NotImplementedError()
+
+    def iter_entries(self):
+        '''Iterate over the LDIF entries, as text.
+
+        Entries of the same kind are yielded in batches, so every item may
+        hold several of them.
+        '''
+        for fmt, entries in self.iter_kinds():
+            for text in fmt.format_many(entries, self.width):
+                yield text
+
+    def iter_objects(self):
+        '''Iterate over the entries, as ordered dicts.'''
+        for fmt, entries in self.iter_kinds():
+            for values in entries:
+                yield fmt.as_dict(values)
+
+    def write(self, out):
+        for entry in self.iter_entries():
+            out.write(entry)
+
+    def render(self):
+        return u''.join(self.iter_entries())
+
+
+class CloudWriter(_Writer):
+    '''Writer of the entries of the cloud section.
+
+    They are the same as those of the headers and clouddomain templates, or
+    if full_bdii is set, of the headers, domain, bdii and clouddomain ones.
+    '''
+    def __init__(self, info, width=0, full_bdii=False):
+        super(CloudWriter, self).__init__(info, width=width)
+        self.full_bdii = full_bdii
+
+    def iter_kinds(self):
+        info = self.info
+        suffix = info['suffix']
+        yield ORGANIZATION, [(u'o=glue', u'glue')]
+        if self.full_bdii:
+            for kind in self._iter_domain(info, suffix):
+                yield kind
+            yield GROUP, [(u'GLUE2GroupID=resource,o=glue', u'resource')]
+            for kind in self._iter_bdii(info, u'o=glue'):
+                yield kind
+            for kind in self._iter_bdii(info, suffix):
+                yield kind
+        yield GROUP, [(u'GLUE2GroupID=cloud,%s' % suffix, u'cloud')]
+
+    def _iter_domain(self, info, suffix):
+        site_name = info['site_name']
+        yield DOMAIN, [(
+            suffix,
+            site_name,
+            site_name,
+            info['site_url'],
+            u'EGI_NGI=%s' % info['site_ngi'],
+        )]
+
+        location_id = u'location.%s' % site_name
+        yield LOCATION, [(
+            u'GLUE2LocationID=%s,%s' % (location_id, suffix),
+            location_id,
+            info['site_country'],
+            site_name,
+            info['site_longitude'],
+            info['site_latitude'],
+        )]
+
+        contacts = []
+        for kind, attr in (('general', 'site_general_contact'),
+                           ('sysadmin', 'site_sysadmin_contact'),
+                           ('security', 'site_security_contact'),
+                           ('usersupport', 'site_user_support_contact')):
+            contact_id = u'%s.contact.%s' % (kind, site_name)
+            contacts.append((
+                u'GLUE2ContactID=%s,%s' % (contact_id, suffix),
+                u'mailto:%s' % info[attr],
+                contact_id,
+                kind,
+                site_name,
+            ))
+        yield CONTACT, contacts
+
+        yield GROUP, [(u'GLUE2GroupID=resource,%s' % suffix, u'resource')]
+
+    def _iter_bdii(self, info, suffix):
+        # The bdii template writes these entries under o=glue and under the
+        # configured suffix
+        site_name = info['site_name']
+        level = info['site_production_level']
+        service_id = u'%s_sitebdii' % site_name
+        service_dn = u'GLUE2ServiceID=%s,GLUE2GroupID=resource,%s' % (
+            service_id, suffix)
+        yield BDII_SERVICE, [(
+            service_dn,
+            site_name,
+            service_id,
+            level,
+            service_id,
+        )]
+
+        host_port = u'%s:%s' % (info['site_bdii_host'],
+                                info['site_bdii_port'])
+        endpoint_id = u'%s_sitebdii_endpoint' % host_port
+        endpoint_dn = u'GLUE2EndpointID=%s,%s' % (endpoint_id, service_dn)
+        yield BDII_ENDPOINT, [(
+            endpoint_dn,
+            endpoint_id,
+            level,
+            service_id,
+            level,
+            u'ldap://%s/%s' % (host_port, info['suffix']),
+            u'bdii_site endpoint for Service %s' % site_name,
+        )]
+
+        policy_id = u'%s_policy' % endpoint_id
+        yield BDII_POLICY, [(
+            u'GLUE2PolicyID=%s,%s' % (policy_id, endpoint_dn),
+            endpoint_id,
+            policy_id,
+            u'Access control rules for Endpoint %s' % site_name,
+        )]
+
+
+class StorageWriter(_Writer):
+    def iter_kinds(self):
+        static = self.info['static_storage_info']
+        service_name = static['storage_service_name']
+        service_id = u'%s_cloud.storage' % service_name
+        service_dn = u'GLUE2ServiceID=%s,GLUE2GroupID=cloud,%s' % (
+            service_id, static['suffix'])
+        manager_id = u'%s_cloud.storage_manager' % service_name
+
+        yield STORAGE_SERVICE, [(
+            service_dn,
+            static['site_name'],
+            service_id,
+            static['storage_service_production_level'],
+            static['storage_capabilities'],
+        )]
+
+        yield STORAGE_MANAGER, [(
+            u'GLUE2ManagerID=%s,%s' % (manager_id, service_dn),
+            manager_id,
+            static['storage_middleware'],
+            service_id,
+            service_id,
+            u'Cloud Storage Manager at %s' % service_name,
+            static['storage_middleware_version'],
+        )]
+
+        endpoints = self.info['endpoints']['endpoints']
+        yield STORAGE_ENDPOINT, [
+            self._endpoint(url, endpoint)
+            for url, endpoint in endpoints.items()]
+
+        capacity_id = u'%s_cloud.storage_capacity' % service_name
+        yield STORAGE_CAPACITY, [(
+            u'GLUE2StorageServiceCapacityID=%s,%s' % (capacity_id,
+                                                      service_dn),
+            capacity_id,
+            service_id,
+            static['storage_total_storage'],
+        )]
+
+    def _endpoint(self, url, endpoint):
+        service_id = u'%s_cloud.storage' % endpoint['storage_service_name']
+        endpoint_id = u'%s_%s_%s_%s' % (url,
+                                        endpoint['storage_api_type'],
+                                        endpoint['storage_api_version'],
+                                        endpoint['storage_api_authn_method'])
+        return (
+            u'GLUE2EndpointID=%s,GLUE2ServiceID=%s,GLUE2GroupID=cloud,%s' % (
+                endpoint_id, service_id, endpoint['suffix']),
+            endpoint_id,
+            endpoint['storage_api_type'],
+            endpoint['storage_production_level'],
+            service_id,
+            endpoint['storage_production_level'],
+            url,
+            service_id,
+            endpoint['storage_capabilities'],
+            endpoint['storage_middleware'],
+            endpoint['storage_middleware_version'],
+            endpoint['storage_middleware_developer'],
+            endpoint['storage_api_version'],
+            u'Authn=%s' % endpoint['storage_api_authn_method'],
+            endpoint['storage_api_endpoint_technology'],
+        )
+
+
+class ComputeWriter(_Writer):
+    '''Writer of the compute entries.
+
+    If processes is greater than one, the templates and images are split
+    in shards of shard_size entities that are formatted in a pool of
+    processes. Only the attributes of each entity are sent to the workers,
+    and the shards are written in order, so the output is the same as the
+    one rendered serially.
+    '''
+    def __init__(self, info, width=0, processes=1, shard_size=2000):
+        super(ComputeWriter, self).__init__(info, width=width)
+
+        self.static = info['static_compute_info']
+        self.endpoints = info['endpoints']['endpoints']
+        self.processes = processes
+        self.shard_size = shard_size
+        self._service_dns = {}
+
+    def _service_dn(self, service_name, suffix):
+        # The DN of the service is shared by all the entries below it
+        key = (service_name, suffix)
+        dn = self._service_dns.get(key)
+        if dn is None:
+            dn = (u'GLUE2ServiceID=%s_cloud.compute,GLUE2GroupID=cloud,%s' %
+                  key)
+            self._service_dns[key] = dn
+        return dn
+
+    def _iter_service_kinds(self):
+        static = self.static
+        service_name = static['compute_service_name']
+        service_id = u'%s_cloud.compute' % service_name
+        service_dn = self._service_dn(service_name, static['suffix'])
+        manager_id = u'%s_cloud.compute_manager' % service_name
+
+        yield SERVICE, [(
+            service_dn,
+            static['site_name'],
+            service_id,
+            static['compute_service_production_level'],
+            static['compute_capabilities'],
+        )]
+
+        yield MANAGER, [(
+            u'GLUE2ManagerID=%s,%s' % (manager_id, service_dn),
+            manager_id,
+            static['compute_hypervisor'],
+            service_id,
+            service_id,
+            u'Cloud Manager for %s' % service_name,
+            static['compute_hypervisor_version'],
+            static['compute_total_cores'],
+            static['compute_total_ram'],
+        )]
+
+        yield ENDPOINT, [self._endpoint(endpoint)
+                         for endpoint in self.endpoints.values()]
+
+    def _get_entity_context(self):
+        '''Get the manager and DN suffix of the templates and images.'''
+        # As in the template, templates and images refer to the service of
+        # the last endpoint
+        endpoints = list(self.endpoints.values())
+        if not endpoints:
+            return None
+        endpoint = endpoints[-1]
+        manager_fk = u'%s_cloud.compute_manager' % (
+            endpoint['compute_service_name'])
+        image_dn = self._service_dn(endpoint['compute_service_name'],
+                                    endpoint['suffix'])
+        image_dn_suffix = u'_%s,%s' % (endpoint['compute_service_name'],
+                                       image_dn)
+        return manager_fk, image_dn_suffix
+
+    def iter_kinds(self):
+        for kind in self._iter_service_kinds():
+            yield kind
+
+        context = self._get_entity_context()
+        if context is None:
+            return
+        manager_fk, image_dn_suffix = context
+
+        yield EXECUTION_ENVIRONMENT, self._templates(
+            _values(self.info['templates']), manager_fk)
+        yield APPLICATION_ENVIRONMENT, self._images(
+            _values(self.info['images']), manager_fk, image_dn_suffix)
+
+    def iter_entries(self):
+        if self.processes <= 1:
+            return super(ComputeWriter, self).iter_entries()
+        import multiprocessing
+        if multiprocessing.current_process().daemon:
+            # e.g. when running in the pool of cloud-info-provider-fleet,
+            # as daemonic processes cannot start their own
+            logger.debug('Cannot start processes from a daemonic process, '
+                         'rendering the compute entries serially')
+            return super(ComputeWriter, self).iter_entries()
+        return self._iter_sharded_entries()
+
+    def _iter_shards(self, name):
+        entities = (_compact(entity)
+                    for entity in _values(self.info[name]))
+        while True:
+            shard = list(itertools.islice(entities, self.shard_size))
+            if not shard:
+                return
+            yield name, shard
+
+    def _iter_sharded_entries(self):
+        for fmt, entries in self._iter_service_kinds():
+            for text in fmt.format_many(entries, self.width):
+                yield text
+
+        context = self._get_entity_context()
+        if context is None:
+            return
+
+        shards = itertools.chain(self._iter_shards('templates'),
+                                 self._iter_shards('images'))
+        import multiprocessing
+        pool = multiprocessing.Pool(
+            self.processes, _init_shard_worker,
+            (self.static, context, self.width))
+        try:
+            # Only a few shards are in flight at any time, so streamed
+            # entities are not all read before they are written
+            pending = collections.deque()
+            for shard in shards:
+                pending.append(pool.apply_async(_format_shard, (shard,)))
+                if len(pending) > 2 * self.processes:
+                    yield pending.popleft().get()
+            while pending:
+                yield pending.popleft().get()
+            pool.close()
+        finally:
+            pool.terminate()
+            pool.join()
+
+    def _endpoint(self, endpoint):
+        service_name = endpoint['compute_service_name']
+        service_id = u'%s_cloud.compute' % service_name
+        endpoint_id = u'%s_%s_%s_%s' % (endpoint['compute_endpoint_url'],
+                                        endpoint['compute_api_type'],
+                                        endpoint['compute_api_version'],
+                                        endpoint['compute_api_authn_method'])
+        return (
+            u'GLUE2EndpointID=%s,%s' % (
+                endpoint_id,
+                self._service_dn(service_name, endpoint['suffix'])),
+            endpoint_id,
+            endpoint['compute_api_type'],
+            endpoint['compute_production_level'],
+            service_id,
+            endpoint['compute_production_level'],
+            endpoint['compute_endpoint_url'],
+            service_id,
+            endpoint['compute_capabilities'],
+            endpoint['compute_middleware'],
+            endpoint['compute_middleware_version'],
+            endpoint['compute_middleware_developer'],
+            endpoint['compute_api_version'],
+            u'Authn=%s' % endpoint['compute_api_authn_method'],
+            endpoint['compute_api_endpoint_technology'],
+        )
+
+    def _templates(self, templates, manager_fk):
+        service_dn = self._service_dn
+        for template in templates:
+            (template_id, service_name, suffix, memory, platform, cpu,
+             disk) = _get(template, _TEMPLATE_KEYS)
+            if disk is None:
+                disk = 0
+            yield (
+                u'GLUE2ResourceID=%s_%s,%s' % (
+                    template_id, service_name,
+                    service_dn(service_name, suffix)),
+                memory,
+                platform,
+                manager_fk,
+                template_id,
+                manager_fk,
+                cpu,
+                cpu,
+                u'disk=%s' % disk,
+            )
+
+    def _images(self, images, manager_fk, dn_suffix):
+        for image in images:
+            (image_id, name, version, marketplace_id,
+             description) = _get(image, _IMAGE_KEYS)
+            if description is None:
+                description = _get(image, _format_description)
+            yield (
+                u'GLUE2ApplicationEnvironmentID=%s%s' % (image_id, dn_suffix),
+                name,
+                version,
+                marketplace_id,
+                description,
+                image_id,
+                manager_fk,
+            )
+
+
+# Context of the shard workers, set when the pool starts
+_shard_context = {}
+
+
+def _init_shard_worker(static, context, width):
+    writer = ComputeWriter({'static_compute_info': static,
+                            'endpoints': {'endpoints': {}}}, width=width)
+    _shard_context.update(writer=writer, static=static, context=context)
+
+
+def _format_shard(shard):
+    name, entities = shard
+    writer = _shard_context['writer']
+    static = _shard_context['static']
+    manager_fk, image_dn_suffix = _shard_context['context']
+
+    # Layer the entities again over the static info, as they were
+    entities = [utils.layer(entity, static) for entity in entities]
+    if name == 'templates':
+        fmt = EXECUTION_ENVIRONMENT
+        entries = writer._templates(entities, manager_fk)
+    else:
+        fmt = APPLICATION_ENVIRONMENT
+        entries = writer._images(entities, manager_fk, image_dn_suffix)
+    return u''.join(fmt.format_many(entries, writer.width))
+
+
+def render_compute(info, width=0, processes=1):
+    '''Render the compute entries of the collected information.'''
+    return ComputeWriter(info, width=width, processes=processes).render()
+
+
+def write_compute(info, out, width=0, processes=1):
+    '''Write the compute entries of the collected information into out.'''
+    ComputeWriter(info, width=width, processes=processes).write(out)
@@ -0,0 +1,184 @@
+import base64
+import collections
+import json
+import logging
+import re
+
+import six
+
+from cloud_info import utils
+
+logger = logging.getLogger(__name__)
+
+
+# SAFE-STRING values of RFC 2849, that can be written without encoding them
+_SAFE_STRING = re.compile(u'^(?:[\x01-\x09\x0b\x0c\x0e-\x1f\x21-\x39\x3b'
+                          u'\x3d-\x7f][\x01-\x09\x0b\x0c\x0e-\x7f]*)?\\Z')
+
+
+def fold(line, width):
+    '''Fold a LDIF line so that no line is longer than width.'''
+    if not width or len(line) <= width:
+        return line
+    lines = [line[:width]]
+    for i in range(width, len(line), width - 1):
+        lines.append(' ' + line[i:i + width - 1])
+    return '\n'.join(lines)
+
+
+def format_attribute(attr, value, width=0):
+    '''Format an attribute line, base64 encoding the value if needed.
+
+    Values that are not SAFE-STRINGs (e.g. non-ASCII values or values
+    starting with a space or a colon) are base64 encoded. If width is set,
+    the line is folded to that width.
+    '''
+    value = six.text_type(value)
+    if _SAFE_STRING.match(value):
+        line = u'%s: %s' % (attr, value)
+    else:
+        value = base64.b64encode(value.encode('utf-8')).decode('ascii')
+        line = u'%s:: %s' % (attr, value)
+    return fold(line, width)
+
+
+def _unfold(text):
+    '''Join the LDIF continuation lines, skipping comments.'''
+    lines = []
+    for line in text.splitlines():
+        if line.startswith(' ') and lines:
+            if lines[-1] is not None:
+                lines[-1] += line[1:]
+        elif line.startswith('#'):
+            # Mark it so that its continuation lines are dropped too
+            lines.append(None)
+        else:
+            lines.append(line)
+    return [line for line in lines if line is not None]
+
+
+def parse(text):
+    '''Parse a LDIF text into an ordered dict of entries indexed by DN.
+
+    Each entry is a list of (attribute, value) tuples. The value is kept
+    as it is written after the attribute name (including the leading space
+    or the extra colon for base64 values) so that it can be written back
+    without any change.
+    '''
+    entries = collections.OrderedDict()
+    dn = None
+    for line in _unfold(text):
+        if not line.strip():
+            dn = None
+            continue
+
+        attr, sep, value = line.partition(':')
+        if not sep:
+            logger.warning('Ignoring invalid LDIF line: %s', line)
+            continue
+
+        if dn is None:
+            if attr.lower() != 'dn':
+                logger.warning('Ignoring LDIF line out of an entry: %s',
+                               line)
+                continue
+            dn = value.strip()
+            entries[dn] = []
+        else:
+            entries[dn].append((attr, value))
+    return entries
+
+
+def _group(attrs):
+    grouped = collections.OrderedDict()
+    for attr, value in attrs:
+        grouped.setdefault(attr, []).append(value)
+    return grouped
+
+
+def _depth(dn):
+    return dn.count(',')
+
+
+def _format_record(dn, changetype, lines=()):
+    record = ['dn: %s' % dn, 'changetype: %s' % changetype]
+    record.extend(lines)
+    return '\n'.join(record)
+
+
+def diff(old, new):
+    '''Get the LDIF change records needed to go from old to new entries.
+
+    Additions are sorted parents first and deletions children first, so
+    that the records can be applied in order, modifications are sorted by
+    DN. Only the attributes that changed are included in the modify
+    records.
+    '''
+    records = []
+
+    added = sorted((dn for dn in new if dn not in old),
+                   key=lambda dn: (_depth(dn), dn))
+    for dn in added:
+        lines = ['%s:%s' % (attr, value) for attr, value in new[dn]]
+        records.append(_format_record(dn, 'add', lines))
+
+    for dn in sorted(dn for dn in new if dn in old):
+        old_attrs = _group(old[dn])
+        new_attrs = _group(new[dn])
+        lines = []
+        for attr, values in new_attrs.items():
+            if sorted(values) != sorted(old_attrs.get(attr, [])):
+                lines.append('replace: %s' % attr)
+                lines.extend('%s:%s' % (attr, value) for value in values)
+                lines.append('-')
+        for attr in old_attrs:
+            if attr not in new_attrs:
+                lines.append('delete: %s' % attr)
+                lines.append('-')
+        if lines:
+            records.append(_format_record(dn, 'modify', lines))
+
+    deleted = sorted((dn for dn in old if dn not in new),
+                     key=lambda dn: (-_depth(dn), dn))
+    for dn in deleted:
+        records.append(_format_record(dn, 'delete'))
+
+    return ''.join('%s\n\n' % r for r in records)
+
+
+class DeltaState(object):
+    '''Entries produced by the previous run, used to generate deltas.'''
+    def __init__(self, path):
+        self.path = path
+        self._pending = None
+
+    def load(self):
+        try:
+            with open(self.path, 'r') as f:
+                data = json.load(f)
+        except (IOError, OSError):
+            return collections.OrderedDict()
+        except ValueError:
+            logger.warning('Ignoring invalid LDIF delta state %s', self.path)
+            return collections.OrderedDict()
+        return collections.OrderedDict(
+            (dn, [tuple(line) for line in lines]) for dn, lines in data)
+
+    def save(self, entries):
+        utils.atomic_write(self.path,
+                           json.dumps(list(six.iteritems(entries))))
+
+    def delta(self, text):
+        '''Get the changes from the previous run.
+
+        The new state is not stored until commit is called, once the
+        changes have been delivered.
+        '''
+        self._pending = parse(text)
+        return diff(self.load(), self._pending)
+
+    def commit(self):
+        '''Store the state of the last delta.'''
+        if self._pending is not None:
+            self.save(self._pending)
+            self._pending = None
@@ -0,0 +1,114 @@
+import collections
+import threading
+import time
+
+from cloud_info import utils
+
+PREFIX = 'cloud_info_provider_'
+
+# name: (type, help)
+METRICS = collections.OrderedDict([
+    ('call_duration_seconds',
+     ('gauge', 'Time spent in each provider method.')),
+    ('entities',
+     ('gauge', 'Number of entities emitted in each section.')),
+    ('api_calls_total',
+     ('counter', 'Calls made by the providers to their backend API.')),
+    ('api_received_bytes_total',
+     ('counter', 'Bytes received by the providers from their backend API, '
+                 'for the providers able to measure it.')),
+    ('block_cache_hits_total',
+     ('counter', 'Blocks taken from the rendered block cache.')),
+    ('block_cache_misses_total',
+     ('counter', 'Blocks that were not in the rendered block cache.')),
+    ('block_cache_hit_ratio',
+     ('gauge', 'Ratio of blocks taken from the rendered block cache.')),
+    ('skipped_sections',
+     ('gauge', 'Sections left out of the output as the deadline was '
+               'exceeded.')),
+    ('output_bytes',
+     ('gauge', 'Size of the generated output.')),
+    ('run_duration_seconds',
+     ('gauge', 'Duration of the last run.')),
+    ('last_run_success',
+     ('gauge', 'Whether the last run succeeded (1) or failed (0).')),
+    ('last_run_timestamp_seconds',
+     ('gauge', 'Time when the last run finished.')),
+])
+
+
+class NoMetrics(object):
+    '''Metrics that are not recorded anywhere.'''
+    def start(self):
+        pass
+
+    def set(self, name, value, **labels):
+        pass
+
+    def finish(self, success=True):
+        pass
+
+
+class Metrics(object):
+    '''Metrics of a run, written in the node exporter textfile format.
+
+    A run goes from start() to finish(), when the metrics are atomically
+    written into path so that the node exporter never reads a partial file.
+    '''
+    def __init__(self, path):
+        self.path = path
+        self.values = {}
+        self._start = None
+        self._lock = threading.Lock()
+        self.start()
+
+    def start(self):
+        '''Start a new run, forgetting the metrics of the previous one.'''
+        self.values = {}
+        self._start = time.time()
+
+    def set(self, name, value, **labels):
+        if name not in METRICS:
+            raise ValueError('Unknown metric %s' % name)
+        labels = tuple(sorted(labels.items()))
+        with self._lock:
+            self.values.setdefault(name, {})[labels] = value
+
+    def finish(self, success=True):
+        '''Record the result of the run and write the metrics.'''
+        now = time.time()
+        self.set('run_duration_seconds', now - self._start)
+        self.set('last_run_success', 1 if success else 0)
+        self.set('last_run_timestamp_seconds', now)
+        utils.atomic_write(self.path, self.format())
+
+    @staticmethod
+    def _format_labels(labels):
+        if not labels:
+            return ''
+        return '{%s}' % ','.join(
+            '%s="%s"' % (k, str(v).replace('\\', '\\\\')
+                         .replace('"', '\\"').replace('\n', '\\n'))
+            for k, v in labels)
+
+    def format(self):
+        lines = []
+        with self._lock:
+            for name, (type_, help_) in METRICS.items():
+                values = self.values.get(name)
+                if not values:
+                    continue
+                lines.append('# HELP %s%s %s' % (PREFIX, name, help_))
+                lines.append('# TYPE %s%s %s' % (PREFIX, name, type_))
+                for labels, value in sorted(values.items()):
+                    lines.append('%s%s%s %s' % (PREFIX, name,
+                                                self._format_labels(labels),
+                                                repr(float(value))))
+        return '\n'.join(lines) + '\n'
+
+
+def get_metrics(opts):
+    '''Get the metrics configured in the options.'''
+    if not opts.metrics_file:
+        return NoMetrics()
+    return Metrics(opts.metrics_file)
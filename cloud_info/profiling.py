@@ -0,0 +1,144 @@
+import random
+import sys
+import threading
+import timeit
+
+
+class _NoPhase(object):
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+_NO_PHASE = _NoPhase()
+
+
+class NoProfiler(object):
+    '''Profiler that does not measure anything.'''
+    def start(self):
+        pass
+
+    def add(self, name, seconds):
+        pass
+
+    def phase(self, name):
+        return _NO_PHASE
+
+    def finish(self):
+        pass
+
+
+def timed_iter(iterable, done):
+    '''Measure the time spent producing the items of an iterable.
+
+    The time spent by the consumer of the items is not included. Once the
+    iteration ends, done is called with the elapsed time in seconds.
+    '''
+    elapsed = 0
+    iterator = iter(iterable)
+    try:
+        while True:
+            start = timeit.default_timer()
+            try:
+                item = next(iterator)
+            finally:
+                elapsed += timeit.default_timer() - start
+            yield item
+    except StopIteration:
+        return
+    finally:
+        done(elapsed)
+
+
+class _Phase(object):
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+
+    def __enter__(self):
+        self.start = timeit.default_timer()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.profiler.add(self.name, timeit.default_timer() - self.start)
+        return False
+
+
+class Profiler(object):
+    '''Per phase timing of the runs, profiling them with cProfile as well.
+
+    A run goes from start() to finish(), and only a sample_rate fraction of
+    the runs are profiled, so that it can be left enabled in production.
+    When a run finishes, the time spent in each phase is written into out,
+    and the cProfile statistics are dumped into path (or summarized into
+    out if path is not set).
+
+    Note that cProfile only profiles the thread where the run started.
+    '''
+    def __init__(self, path=None, sample_rate=1.0, out=None):
+        self.path = path
+        self.sample_rate = sample_rate
+        self.out = out or sys.stderr
+
+        self.timings = []
+        self.sampled = False
+        self._profile = None
+        self._start = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        '''Start a new run, deciding whether it is profiled or not.'''
+        self.finish()
+        self.timings = []
+        # Not used for security purposes
+        self.sampled = random.random() < self.sample_rate  # nosec
+        if not self.sampled:
+            return
+
+        import cProfile
+        self._start = timeit.default_timer()
+        self._profile = cProfile.Profile()
+        self._profile.enable()
+
+    def add(self, name, seconds):
+        if not self.sampled:
+            return
+        with self._lock:
+            self.timings.append((name, seconds))
+
+    def phase(self, name):
+        '''Context manager measuring the time spent in a phase.'''
+        if not self.sampled:
+            return _NO_PHASE
+        return _Phase(self, name)
+
+    def finish(self):
+        '''Stop the current run and report it.'''
+        if self._profile is None:
+            return
+        self._profile.disable()
+        total = timeit.default_timer() - self._start
+
+        self.out.write('Time spent in each phase (seconds):\n')
+        for name, seconds in self.timings:
+            self.out.write('  %-40s %10.4f\n' % (name, seconds))
+        self.out.write('  %-40s %10.4f\n' % ('total', total))
+
+        if self.path:
+            self._profile.dump_stats(self.path)
+        else:
+            import pstats
+            stats = pstats.Stats(self._profile, stream=self.out)
+            stats.sort_stats('cumulative').print_stats(25)
+        self.out.flush()
+        self._profile = None
+
+
+def get_profiler(opts):
+    '''Get the profiler configured in the options.'''
+    if not opts.profile:
+        return NoProfiler()
+    return Profiler(path=opts.profile_output,
+                    sample_rate=opts.profile_sample_rate)
@@ -1,7 +1,56 @@
+import threading
+
+from cloud_info import resilience
+from cloud_info import utils
+
+
 class BaseProvider(object):
+    # Calls made to the backend API and bytes received from it, reported in
+    # the metrics of the run.
+    api_calls = 0
+    api_received_bytes = 0
+    _api_lock = threading.Lock()
+
+    # Time budget of the run, set by the collector. Calls to the backend API
+    # should not take longer than the time left in it.
+    deadline = utils.Deadline()
+
+    # Retry policy and circuit breaker of the backend, set by the collector
+    backend = resilience.Backend()
+
     def __init__(self, opts):
         self.opts = opts
 
+    @classmethod
+    def is_transient_error(cls, exc):
+        '''Whether a backend error is worth retrying.'''
+        return resilience.is_transient_error(exc)
+
+    def renew(self):
+        '''Renew the credentials of the backend if they are about to expire.
+
+        Called before every refresh of the daemon.
+        '''
+
+    def call_backend(self, func, *args):
+        '''Call the backend API, retrying it on transient errors.'''
+        return self.backend.call(func, args, deadline=self.deadline,
+                                 is_transient=self.is_transient_error)
+
+    def record_api_call(self, received_bytes=0):
+        '''Account a call to the backend API.'''
+        with self._api_lock:
+            self.api_calls += 1
+            self.api_received_bytes += received_bytes
+
+    def record_received_bytes(self, received_bytes):
+        '''Account data received from the backend API.
+
+        For providers that cannot tell it apart for each call.
+        '''
+        with self._api_lock:
+            self.api_received_bytes += received_bytes
+
     def get_site_info(self):
         return {}
 
@@ -11,6 +60,18 @@ class BaseProvider(object):
     def get_templates(self):
         return {}
 
+    def iter_images(self):
+        '''Iterate over the (id, image) pairs returned by get_images.
+
+        Providers able to produce the images one by one should override this
+        method so that the whole catalog is never held in memory.
+        '''
+        return iter(self.get_images().items())
+
+    def iter_templates(self):
+        '''Iterate over the (id, template) pairs returned by get_templates.'''
+        return iter(self.get_templates().items())
+
     def get_compute_endpoints(self):
         return {}
 
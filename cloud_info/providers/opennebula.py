@@ -1,20 +1,53 @@
 import json
 import os
 import string
+import threading
+import time
+
+import six
 
 from cloud_info import exceptions
 from cloud_info import providers
+from cloud_info.providers import static
 from cloud_info import utils
 
 
+# Error code of the OpenNebula API for internal errors (e.g. when oned is too
+# busy to load the pool from its database), that are worth retrying
+ONE_INTERNAL_ERROR = 0x2000
+
+
+class _TimeoutTransport(object):
+    '''Mixin for the XML-RPC transports bounding the time of each request.'''
+    timeout = None
+
+    def make_connection(self, host):
+        conn = super(_TimeoutTransport, self).make_connection(host)
+        conn.timeout = self.timeout
+        if conn.sock is not None:
+            # Kept alive from a previous request
+            conn.sock.settimeout(self.timeout)
+        return conn
+
+
 class OpenNebulaBaseProvider(providers.BaseProvider):
+    # Responses of the asyncio transport are shared by the threads
+    # collecting concurrently
+    _async_lock = threading.Lock()
+
+    # Pool requests made concurrently with the asyncio transport, and for how
+    # long their responses are kept until they are requested
+    on_rpcxml_async = False
+    _async_responses_ttl = 60
+
+    on_rpcxml_timeout = None
+
     def __init__(self, opts):
         super(OpenNebulaBaseProvider, self).__init__(opts)
 
         try:
             import defusedxml.ElementTree
             from defusedxml import xmlrpc
-            import xmlrpclib  # nosec
             # Protect the XMLRPC parser from various XML-based threats
             xmlrpc.monkey_patch()
         except ImportError:
@@ -37,44 +70,206 @@ class OpenNebulaBaseProvider(providers.BaseProvider):
                    ' env[ON_RPCXML_ENDPOINT]')
             raise exceptions.OpenNebulaProviderException(msg)
 
-        self.static = providers.static.StaticProvider(opts)
+        self.on_rpcxml_async = opts.on_rpcxml_async
+        self.on_rpcxml_timeout = opts.on_rpcxml_timeout
+        self.on_rpcxml_connections = opts.on_rpcxml_connections
+        if self.on_rpcxml_async and six.PY2:
+            msg = 'The asyncio XML-RPC transport requires Python 3'
+            raise exceptions.OpenNebulaProviderException(msg)
+        self._async_responses = {}
+
+        self.static = static.StaticProvider(opts)
         self.xml_parser = defusedxml.ElementTree
-        self.server_proxy = xmlrpclib.ServerProxy(self.on_rpcxml_endpoint)
+        self.server_proxy = self._get_server_proxy()
+
+    @property
+    def _thread(self):
+        '''State of the current thread (its ServerProxy and transport).'''
+        return self.__dict__.setdefault('_threads', threading.local())
+
+    @property
+    def server_proxy(self):
+        '''ServerProxy of the current thread.
+
+        A ServerProxy reuses a single connection, therefore each of the
+        threads collecting concurrently gets its own one.
+        '''
+        if getattr(self._thread, 'server_proxy', None) is None:
+            self._thread.server_proxy = self._get_server_proxy()
+        return self._thread.server_proxy
+
+    @server_proxy.setter
+    def server_proxy(self, server_proxy):
+        self._thread.server_proxy = server_proxy
+
+    def _get_server_proxy(self):
+        '''Get a ServerProxy whose requests can time out.
+
+        It must only be used by the current thread.
+        '''
+        from six.moves import xmlrpc_client  # nosec
+
+        if self.on_rpcxml_endpoint.startswith('https:'):
+            transport_cls = xmlrpc_client.SafeTransport
+        else:
+            transport_cls = xmlrpc_client.Transport
+        self._thread.transport = type('TimeoutTransport',
+                                      (_TimeoutTransport, transport_cls), {})()
+        return xmlrpc_client.ServerProxy(self.on_rpcxml_endpoint,
+                                         transport=self._thread.transport)
+
+    def _get_timeout(self):
+        '''Timeout of the next request, bounded by the deadline.'''
+        return self.deadline.timeout(self.on_rpcxml_timeout)
+
+    def _call(self, method, *args):
+        '''Call an XML-RPC method, accounting the size of its response.'''
+        transport = getattr(self._thread, 'transport', None)
+        if transport is not None:
+            transport.timeout = self._get_timeout()
+        response = method(self.on_auth, *args)
+        self._record_response(response)
+        return response
+
+    def _record_response(self, response):
+        # Characters of the XML document, close enough to its size in bytes
+        size = 0
+        if response and isinstance(response[1], six.string_types):
+            size = len(response[1])
+        self.record_api_call(size)
+
+    def _get_pool_requests(self):
+        '''Get the (method, args) of the pool requests of a collection.
+
+        With the asyncio transport they are all made concurrently as soon as
+        one of them is needed.
+        '''
+        return [('one.templatepool.info', (-3, -1, -1))]
+
+    @classmethod
+    def is_transient_error(cls, exc):
+        from six.moves import xmlrpc_client  # nosec
+
+        if isinstance(exc, exceptions.OpenNebulaInternalError):
+            return True
+        if isinstance(exc, xmlrpc_client.ProtocolError):
+            return exc.errcode >= 500
+        return super(OpenNebulaBaseProvider, cls).is_transient_error(exc)
+
+    def _call_pool(self, method, *args):
+        '''Request a pool (e.g. one.templatepool.info).'''
+        return self.call_backend(self._request_pool, method, args)
+
+    def _request_pool(self, method, args):
+        if self.on_rpcxml_async:
+            response = self._call_pool_async(method, args)
+        else:
+            func = self.server_proxy
+            for name in method.split('.'):
+                func = getattr(func, name)
+            response = self._call(func, *args)
+
+        # Responses are [success, result or error message, error code]
+        failed = response and not response[0]
+        if failed and len(response) > 2 and response[2] == ONE_INTERNAL_ERROR:
+            raise exceptions.OpenNebulaInternalError(response[1])
+        return response
+
+    def _call_pool_async(self, method, args):
+        import asyncio
+
+        from cloud_info import aioxmlrpc
+
+        key = (method, args)
+        with self._async_lock:
+            fetched, response = self._async_responses.pop(key, (0, None))
+            if time.time() - fetched > self._async_responses_ttl:
+                requests = self._get_pool_requests()
+                if key not in requests:
+                    requests.append(key)
+                responses = aioxmlrpc.call_many(
+                    self.on_rpcxml_endpoint,
+                    [(m, (self.on_auth,) + a) for m, a in requests],
+                    max_connections=self.on_rpcxml_connections,
+                    timeout=self._get_timeout())
+                now = time.time()
+                self._async_responses = dict(
+                    (request, (now, response))
+                    for request, response in zip(requests, responses))
+                fetched, response = self._async_responses.pop(key)
+
+        if isinstance(response, asyncio.TimeoutError):
+            msg = ('Timeout calling %s on OpenNebula\'s XML RPC endpoint' %
+                   method)
+            raise exceptions.OpenNebulaProviderException(msg)
+        if isinstance(response, Exception):
+            raise response
+        self._record_response(response)
+        return response
 
     def _handle_response(self, response):
+        return dict(self._iter_response(response))
+
+    def _iter_response(self, response):
+        '''Iterate over the (id, object) pairs of a pool response.
+
+        The objects are parsed and yielded one by one, and discarded from the
+        XML tree once they have been processed.
+        '''
         if not response:
             msg = 'Invalid response from OpenNebula\'s XML RPC endpoint'
             raise exceptions.OpenNebulaProviderException(msg)
         if not response[0]:
             raise exceptions.OpenNebulaProviderException(response[1])
 
-        doc = self.xml_parser.fromstring(response[1])
-        if doc is None:
+        xml = response[1]
+        if isinstance(xml, six.text_type):
+            xml = xml.encode('utf-8')
+
+        root = None
+        depth = 0
+        events = self.xml_parser.iterparse(six.BytesIO(xml),
+                                           events=('start', 'end'))
+        for event, obj in events:
+            if event == 'start':
+                if root is None:
+                    root = obj
+                depth += 1
+                continue
+
+            depth -= 1
+            if depth == 1:
+                yield (self._get_xml_string(obj, 'ID'),
+                       self._recurse_dict(obj)[1])
+                root.clear()
+
+        if root is None:
             msg = 'Invalid XML in response from OpenNebula\'s XML RPC endpoint'
             raise exceptions.OpenNebulaProviderException(msg)
 
-        objects = {}
-        for obj in doc.getchildren():
-            objects[self._get_xml_string(obj, 'ID')] = \
-                self._recurse_dict(obj)[1]
-        return objects
-
     def _get_one_templates(self):
-        response = self.server_proxy.one.templatepool.info(
-            self.on_auth, -3, -1, -1)
-        return self._handle_response(response)
+        return dict(self._iter_one_templates())
+
+    def _iter_one_templates(self):
+        response = self._call_pool('one.templatepool.info', -3, -1, -1)
+        return self._iter_response(response)
 
     def _get_one_images(self):
-        response = self.server_proxy.one.imagepool.info(
-            self.on_auth, -3, -1, -1)
-        return self._handle_response(response)
+        return dict(self._iter_one_images())
+
+    def _iter_one_images(self):
+        response = self._call_pool('one.imagepool.info', -3, -1, -1)
+        return self._iter_response(response)
 
     def _get_one_documents(self, document_type):
-        response = self.server_proxy.one.documentpool.info(
-            self.on_auth, -3, -1, -1, document_type)
+        response = self._call_pool('one.documentpool.info',
+                                   -3, -1, -1, document_type)
         return self._handle_response(response)
 
     def get_images(self):
+        return dict(self.iter_images())
+
+    def iter_images(self):
         template = {
             'image_name': None,
             'image_description': None,
@@ -89,8 +284,7 @@ class OpenNebulaBaseProvider(providers.BaseProvider):
         defaults = self.static.get_image_defaults(prefix=True)
         img_schema = defaults.get('image_schema', 'template')
 
-        templates = {}
-        for tpl_id, tpl in self._get_one_templates().items():
+        for tpl_id, tpl in self._iter_one_templates():
             aux_tpl = template.copy()
             aux_tpl.update(defaults)
 
@@ -111,8 +305,7 @@ class OpenNebulaBaseProvider(providers.BaseProvider):
                 if not aux_tpl['image_marketplace_id']:
                     continue
 
-            templates[tpl_id] = aux_tpl
-        return templates
+            yield tpl_id, aux_tpl
 
     @staticmethod
     def populate_parser(parser):
@@ -140,6 +333,31 @@ class OpenNebulaBaseProvider(providers.BaseProvider):
             help=('If set, include only information on images that '
                   'have cloudkeeper metadata, ignoring the others.'))
 
+        parser.add_argument(
+            '--on-rpcxml-async',
+            action='store_true',
+            default=False,
+            help=('Make the pool requests needed by the provider (e.g. '
+                  'the templates and the images) concurrently with an '
+                  'asyncio XML-RPC client. Requires Python 3.'))
+
+        parser.add_argument(
+            '--on-rpcxml-timeout',
+            metavar='SECONDS',
+            type=float,
+            default=None,
+            help=('Timeout of each request to the XML RPC endpoint. It is '
+                  'further bounded by --deadline, if set. By default '
+                  'requests do not time out.'))
+
+        parser.add_argument(
+            '--on-rpcxml-connections',
+            metavar='N',
+            type=int,
+            default=4,
+            help=('Maximum number of concurrent connections to the XML RPC '
+                  'endpoint with --on-rpcxml-async.'))
+
     @staticmethod
     def _gen_id(image_name, image_id, schema):
         # FIXME(aloga): make this an abstrac method
@@ -176,7 +394,15 @@ class IndigoONProvider(OpenNebulaBaseProvider):
     def __init__(self, opts):
         super(IndigoONProvider, self).__init__(opts)
 
+    def _get_pool_requests(self):
+        requests = super(IndigoONProvider, self)._get_pool_requests()
+        requests.append(('one.imagepool.info', (-3, -1, -1)))
+        return requests
+
     def get_templates(self):
+        return dict(self.iter_templates())
+
+    def iter_templates(self):
         template = {
             'template_id': None,
             'template_name': None,
@@ -190,8 +416,7 @@ class IndigoONProvider(OpenNebulaBaseProvider):
         defaults = self.static.get_image_defaults(prefix=True)
         img_schema = defaults.get('template_schema', 'template')
 
-        templates = {}
-        for tpl_id, tpl in self._get_one_templates().items():
+        for tpl_id, tpl in self._iter_one_templates():
             aux_tpl = template.copy()
             aux_tpl.update(defaults)
 
@@ -215,10 +440,12 @@ class IndigoONProvider(OpenNebulaBaseProvider):
                 if not aux_tpl['image_marketplace_id']:
                     continue
 
-            templates[tpl_id] = aux_tpl
-        return templates
+            yield tpl_id, aux_tpl
 
     def get_images(self):
+        return dict(self.iter_images())
+
+    def iter_images(self):
         image = {
             'image_name': None,
             'image_id': None,
@@ -228,8 +455,7 @@ class IndigoONProvider(OpenNebulaBaseProvider):
         }
         defaults = self.static.get_image_defaults(prefix=True)
 
-        images = {}
-        for img_id, img in self._get_one_images().items():
+        for img_id, img in self._iter_one_images():
             aux_img = image.copy()
             aux_img.update(defaults)
 
@@ -254,11 +480,12 @@ class IndigoONProvider(OpenNebulaBaseProvider):
                 if not aux_img['image_marketplace_id']:
                     continue
 
-            images[img_id] = aux_img
-        return images
+            yield img_id, aux_img
 
 
 class OpenNebulaROCCIProvider(OpenNebulaBaseProvider):
+    document_type = 999  # TODO(bparak): configurable?
+
     def __init__(self, opts):
         self.rocci_template_dir = opts.rocci_template_dir
         self.rocci_remote_templates = opts.rocci_remote_templates
@@ -268,6 +495,13 @@ class OpenNebulaROCCIProvider(OpenNebulaBaseProvider):
             raise exceptions.OpenNebulaProviderException(msg)
         super(OpenNebulaROCCIProvider, self).__init__(opts)
 
+    def _get_pool_requests(self):
+        requests = super(OpenNebulaROCCIProvider, self)._get_pool_requests()
+        if self.rocci_remote_templates:
+            requests.append(('one.documentpool.info',
+                             (-3, -1, -1, self.document_type)))
+        return requests
+
     def get_templates(self):
         """Get flavors from rOCCI-server configuration."""
         template = {
@@ -319,10 +553,9 @@ class OpenNebulaROCCIProvider(OpenNebulaBaseProvider):
         return templates
 
     def remote_templates(self, template):
-        document_type = 999  # TODO(bparak): configurable?
-
         templates = {}
-        for doc_id, doc in self._get_one_documents(document_type).items():
+        for doc_id, doc in self._get_one_documents(
+                self.document_type).items():
             document = json.loads(doc['template']['body'])
 
             aux = template.copy()
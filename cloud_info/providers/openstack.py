@@ -1,11 +1,23 @@
 import logging
+import time
 
 from cloud_info import exceptions
 from cloud_info import providers
+from cloud_info.providers import static
+from cloud_info import token_cache
 from cloud_info import utils
 
 
 class OpenStackProvider(providers.BaseProvider):
+    # Keystone token in use, and when it expires
+    token_cache = None
+    token_refresh_margin = 300
+    _token = None
+    _token_expires = None
+
+    # Images requested at a time, 0 to list them all in one request
+    image_page_size = 1000
+
     def __init__(self, opts):
         super(OpenStackProvider, self).__init__(opts)
 
@@ -56,7 +68,8 @@ class OpenStackProvider(providers.BaseProvider):
                                   os_password,
                                   os_tenant_name,
                                   auth_url=os_auth_url,
-                                  insecure=insecure)
+                                  insecure=insecure,
+                                  timeout=opts.deadline)
         else:
             self.api = client_cls(2,
                                   os_username,
@@ -64,12 +77,157 @@ class OpenStackProvider(providers.BaseProvider):
                                   os_tenant_name,
                                   auth_url=os_auth_url,
                                   insecure=insecure,
-                                  cacert=cacert)
+                                  cacert=cacert,
+                                  timeout=opts.deadline)
 
-        self.api.authenticate()
-        self.static = providers.static.StaticProvider(opts)
+        self.token_refresh_margin = opts.os_token_refresh_margin
+        if opts.os_token_cache_file:
+            self.token_cache = token_cache.TokenCache(
+                opts.os_token_cache_file)
+            self._token_key = token_cache.get_key(
+                os_auth_url, os_username, os_password, os_tenant_name)
+
+        self.image_page_size = opts.os_image_page_size
+
+        self._record_responses()
+        self._authenticate()
+        self.static = static.StaticProvider(opts)
         self.legacy_occi_os = legacy_occi_os
 
+    def _record_responses(self):
+        '''Account the size of the responses received by the API client.'''
+        client = self.api.client
+        request = getattr(client, 'request', None)
+        if request is None:
+            return
+
+        def record(*args, **kwargs):
+            # Both the legacy and the session clients return the requests
+            # response and its decoded body
+            resp, body = request(*args, **kwargs)
+            content = getattr(resp, 'content', None)
+            if isinstance(content, bytes):
+                self.record_received_bytes(len(content))
+            return resp, body
+        client.request = record
+
+    def _authenticate(self):
+        '''Authenticate with Keystone, unless a cached token is still valid.
+
+        The token and the service catalog obtained are stored in the cache,
+        so that the next runs do not need to authenticate again.
+        '''
+        if self.token_cache is not None:
+            token = self.token_cache.load(self._token_key,
+                                          margin=self.token_refresh_margin)
+            if token is not None:
+                self._restore_token(token)
+                return
+
+        self.api.authenticate()
+        self.record_api_call()
+        self._store_token()
+
+    def _restore_token(self, token):
+        from novaclient import service_catalog
+
+        client = self.api.client
+        client.auth_token = token['token']
+        client.management_url = token['management_url']
+        client.service_catalog = service_catalog.ServiceCatalog(
+            token['catalog'])
+        self._token = token['token']
+        self._token_expires = token['expires']
+
+    def _store_token(self):
+        client = self.api.client
+        catalog = client.service_catalog.catalog
+        expires = catalog.get('access', {}).get('token', {}).get('expires')
+        # Clients authenticating through a keystoneauth session do not
+        # expose their token, they cannot be cached
+        self._token = getattr(client, 'auth_token', None)
+        self._token_expires = token_cache.parse_expires(expires)
+        if self.token_cache is not None and self._token:
+            self.token_cache.save(self._token_key, {
+                'token': self._token,
+                'management_url': client.management_url,
+                'catalog': catalog,
+                'expires': self._token_expires,
+            })
+
+    def _check_token(self):
+        # novaclient authenticates again by itself when the token is
+        # rejected (i.e. with a 401), keep the new one
+        if self.token_cache is not None and (
+                getattr(self.api.client, 'auth_token', None) != self._token):
+            self._store_token()
+
+    def renew(self):
+        '''Authenticate again if the token is about to expire.'''
+        if self._token_expires is None:
+            return
+        if self._token_expires - self.token_refresh_margin <= time.time():
+            self._authenticate()
+
+    @classmethod
+    def is_transient_error(cls, exc):
+        # novaclient errors carry the HTTP status of the response
+        code = getattr(exc, 'http_status', None) or getattr(exc, 'code', None)
+        if isinstance(code, int) and code >= 500:
+            return True
+        return super(OpenStackProvider, cls).is_transient_error(exc)
+
+    def _set_timeout(self):
+        '''Bound the next request to the time left until the deadline.
+
+        A timeout of 0 would make the request non-blocking rather than
+        failing it, so raise DeadlineExceeded once no time is left.
+        '''
+        if self.deadline.expired():
+            raise exceptions.DeadlineExceeded()
+        self.api.client.timeout = self.deadline.timeout()
+
+    def _list(self, manager, **kwargs):
+        self._set_timeout()
+        result = manager.list(detailed=True, **kwargs)
+        self.record_api_call()
+        self._check_token()
+        return result
+
+    def _iter_pages(self, manager, page_size):
+        '''Iterate over the resources of manager, a page at a time.
+
+        The next page is requested in the background while the current one
+        is processed, so at most two pages are held in memory. Resources
+        are released as soon as they are consumed.
+        '''
+        if not page_size:
+            for resource in self.call_backend(self._list, manager):
+                yield resource
+            return
+
+        def get_page(marker):
+            return self.call_backend(
+                lambda: self._list(manager, limit=page_size, marker=marker))
+
+        import multiprocessing.pool
+        pool = multiprocessing.pool.ThreadPool(1)
+        try:
+            pending = pool.apply_async(get_page, (None,))
+            while pending is not None:
+                page = list(pending.get())
+                pending = None
+                # The last page is the first empty one, as Nova may return
+                # fewer resources than requested
+                if page:
+                    pending = pool.apply_async(get_page, (page[-1].id,))
+                page.reverse()
+                while page:
+                    yield page.pop()
+        finally:
+            pool.terminate()
+            pool.join()
+
     def get_compute_endpoints(self):
         ret = {
             'endpoints': {},
@@ -106,15 +264,17 @@ class OpenStackProvider(providers.BaseProvider):
         return ret
 
     def get_templates(self):
-        flavors = {}
+        return dict(self.iter_templates())
 
+    def iter_templates(self):
         defaults = {'template_platform': 'amd64',
                     'template_network': 'private'}
         defaults.update(self.static.get_template_defaults(prefix=True))
         tpl_sch = defaults.get('template_schema', 'resource')
         flavor_id_attr = 'name' if self.legacy_occi_os else 'id'
         URI = 'http://schemas.openstack.org/template/'
-        for flavor in self.api.flavors.list(detailed=True):
+        flavors = self.call_backend(self._list, self.api.flavors)
+        for flavor in flavors:
             if not flavor.is_public:
                 continue
 
@@ -126,12 +286,12 @@ class OpenStackProvider(providers.BaseProvider):
                         'template_memory': flavor.ram,
                         'template_cpu': flavor.vcpus,
                         'template_disk': flavor.disk})
-            flavors[flavor.id] = aux
-        return flavors
+            yield flavor.id, aux
 
     def get_images(self):
-        images = {}
+        return dict(self.iter_images())
 
+    def iter_images(self):
         template = {
             'image_name': None,
             'image_description': None,
@@ -147,7 +307,8 @@ class OpenStackProvider(providers.BaseProvider):
         img_sch = defaults.get('image_schema', 'os')
         URI = 'http://schemas.openstack.org/template/'
 
-        for image in self.api.images.list(detailed=True):
+        images = self._iter_pages(self.api.images, self.image_page_size)
+        for image in images:
             aux_img = template.copy()
             aux_img.update(defaults)
             link = None
@@ -215,8 +376,7 @@ class OpenStackProvider(providers.BaseProvider):
             if image_version:
                 aux_img['image_version'] = image_version
 
-            images[image.id] = aux_img
-        return images
+            yield image.id, aux_img
 
     @staticmethod
     def occify(term_name):
@@ -274,3 +434,30 @@ class OpenStackProvider(providers.BaseProvider):
             action='store_true',
             help="Generate information and ids compatible with OCCI-OS, "
                  "e.g. using the flavor name instead of the flavor id.")
+
+        parser.add_argument(
+            '--os-image-page-size',
+            metavar='IMAGES',
+            type=int,
+            default=1000,
+            help='Number of images requested at a time. Each page is '
+                 'processed while the next one is requested, so memory '
+                 'usage does not depend on the size of the catalog. Set to '
+                 '0 to list all the images in a single request.')
+
+        parser.add_argument(
+            '--os-token-cache-file',
+            metavar='FILE',
+            default=None,
+            help='File where the Keystone token and the service catalog '
+                 'are stored (only readable by its owner), so that they '
+                 'are reused by the next runs until shortly before the '
+                 'token expires. By default every run authenticates.')
+
+        parser.add_argument(
+            '--os-token-refresh-margin',
+            metavar='SECONDS',
+            type=int,
+            default=300,
+            help='Tokens are renewed when they expire in less than this. '
+                 'The daemon checks it before every refresh.')
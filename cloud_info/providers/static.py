@@ -1,37 +1,52 @@
-import copy
 import re
-import socket
-
-import yaml
 
 from cloud_info import exceptions
 from cloud_info import providers
+from cloud_info import utils
+from cloud_info import yaml_cache
 
 
 class StaticProvider(providers.BaseProvider):
+    # Maximum time spent looking up the domain name of the host, used as the
+    # default service name
+    fqdn_timeout = 5
+
     def __init__(self, *args):
         super(StaticProvider, self).__init__(*args)
 
         self._load_yaml(self.opts.yaml_file)
 
     def _load_yaml(self, yaml_file):
-        with open(yaml_file, 'r') as f:
-            self.yaml = yaml.safe_load(f)
+        # The data is shared with the other providers of the process, so it
+        # must not be modified
+        self.yaml = yaml_cache.load(yaml_file,
+                                    cache_dir=self.opts.yaml_cache_dir)
+
+    @property
+    def yaml(self):
+        return self._yaml
+
+    @yaml.setter
+    def yaml(self, data):
+        self._yaml = data
+        self._defaults = {}
+
+    @staticmethod
+    def _prefixed(fields, prefix):
+        return [(field, '%s%s' % (prefix, field)) for field in fields]
+
+    @staticmethod
+    def _overlay(keys, data, defaults):
+        # The values of the entity over the defaults, without copying them
+        get = defaults.get
+        return dict((key, data[field] if field in data else get(field))
+                    for field, key in keys)
 
     def _get_fields_and_prefix(self, fields, prefix, data, defaults={}):
         if data is None:
             data = self.yaml
 
-        ret = {}
-        d = copy.deepcopy(defaults)
-        d.update(data)
-
-        for field in fields:
-            if field not in d:
-                # This should raise a warning
-                d[field] = None
-            ret['%s%s' % (prefix, field)] = d[field]
-        return ret
+        return self._overlay(self._prefixed(fields, prefix), data, defaults)
 
     def _get_what(self, what, which, g_fields, fields, prefix=None):
         if what not in self.yaml:
@@ -48,16 +63,15 @@ class StaticProvider(providers.BaseProvider):
             ret.update(r)
 
         if which in data:
-            defaults = self._get_defaults(what, which)
+            defaults = self._get_shared_defaults(what, which)
+            keys = self._prefixed(fields, prefix)
             for e, e_data in data[which].items():
                 if e == 'defaults':
                     continue
-                r = self._get_fields_and_prefix(fields,
-                                                prefix,
-                                                e_data,
-                                                defaults=defaults)
-#                r['endpoint_url'] = e
-                ret[which][e] = r
+                if e_data is None:
+                    # As in _get_fields_and_prefix
+                    e_data = self.yaml
+                ret[which][e] = self._overlay(keys, e_data, defaults)
 
         return ret
 
@@ -145,7 +159,8 @@ class StaticProvider(providers.BaseProvider):
                                    global_fields,
                                    endpoint_fields)
         if endpoints and not endpoints.get('compute_service_name'):
-            endpoints['compute_service_name'] = socket.getfqdn()
+            endpoints['compute_service_name'] = utils.getfqdn(
+                self.deadline.timeout(self.fqdn_timeout))
         return endpoints
 
     def get_storage_endpoints(self):
@@ -162,26 +177,37 @@ class StaticProvider(providers.BaseProvider):
                                    global_fields,
                                    endpoint_fields)
         if endpoints and not endpoints.get('compute_service_name'):
-            endpoints['storage_service_name'] = socket.getfqdn()
+            endpoints['storage_service_name'] = utils.getfqdn(
+                self.deadline.timeout(self.fqdn_timeout))
         return endpoints
 
-    def _get_defaults(self, what, which, prefix=''):
+    def _get_shared_defaults(self, what, which, prefix=''):
+        '''Get the defaults of which in what, with their keys prefixed.
+
+        They are resolved once per YAML file and shared by all the callers,
+        so they must not be modified.
+        '''
+        key = (what, which, prefix)
+        defaults = self._defaults.get(key)
+        if defaults is not None:
+            return defaults
+
         try:
             defaults = self.yaml[what][which]['defaults']
         except KeyError:
-            return {}
+            defaults = None
 
         if defaults is None:
-            return {}
+            defaults = {}
+        elif prefix:
+            defaults = dict(('%s%s' % (prefix, k), v)
+                            for k, v in defaults.items())
 
-        if prefix:
-            aux = {}
-            for k, v in defaults.items():
-                key = '%s%s' % (prefix, k)
-                aux[key] = v
-            defaults = aux
+        self._defaults[key] = defaults
+        return defaults
 
-        return copy.deepcopy(defaults)
+    def _get_defaults(self, what, which, prefix=''):
+        return dict(self._get_shared_defaults(what, which, prefix=prefix))
 
     def get_image_defaults(self, prefix=False):
         prefix = 'image_' if prefix else ''
@@ -0,0 +1,200 @@
+'''Retries and circuit breaker of the calls to the provider backends.
+
+Transient errors (e.g. a 5xx response or a refused connection) are retried
+with jittered exponential backoff, as long as the deadline of the run
+allows it. Backends that keep failing are skipped straight away by the
+circuit breaker for a while, instead of paying the full timeout on every
+run. The state of the breaker can be persisted, so that it is shared by
+consecutive runs.
+'''
+
+import errno
+import json
+import logging
+import random
+import socket
+import threading
+import time
+
+import six
+
+from cloud_info import exceptions
+from cloud_info import utils
+
+logger = logging.getLogger(__name__)
+
+
+# Errors of the connection to the backend. Other I/O errors (e.g. a missing
+# file) will not go away by trying again.
+_TRANSIENT_ERRNOS = frozenset(
+    getattr(errno, name) for name in (
+        'ECONNREFUSED', 'ECONNRESET', 'ECONNABORTED', 'EPIPE', 'ETIMEDOUT',
+        'EHOSTUNREACH', 'ENETUNREACH', 'ENETDOWN', 'EAGAIN')
+    if hasattr(errno, name))
+
+# Only in Python 3, where e.g. RemoteDisconnected has no errno
+_ConnectionError = getattr(six.moves.builtins, 'ConnectionError', ())
+
+
+def is_transient_error(exc):
+    '''Whether exc is likely caused by a temporary backend problem.
+
+    Only timeouts and connection errors are, e.g. not a missing file.
+    '''
+    if isinstance(exc, (socket.timeout, _ConnectionError)):
+        return True
+    return (isinstance(exc, (IOError, OSError)) and
+            getattr(exc, 'errno', None) in _TRANSIENT_ERRNOS)
+
+
+class CircuitBreaker(object):
+    '''Circuit breaker of a backend.
+
+    After threshold consecutive failed calls the circuit opens and the
+    backend is not called for reset_timeout seconds. Then calls are let
+    through again: the first one that succeeds closes the circuit, while a
+    failure keeps it open for another reset_timeout seconds.
+
+    If path is set the state is stored there, keyed by the backend name, so
+    that it is kept across runs.
+    '''
+    def __init__(self, name, threshold=3, reset_timeout=300, path=None):
+        self.name = name
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self.path = path
+
+        self.failures = 0
+        self.opened_at = None
+        self._lock = threading.Lock()
+
+    def _load(self):
+        if self.path is None:
+            return
+        try:
+            with open(self.path, 'r') as f:
+                state = json.load(f)[self.name]
+            self.failures = int(state['failures'])
+            self.opened_at = state['opened_at']
+        except (IOError, OSError, KeyError):
+            self.failures, self.opened_at = 0, None
+        except (ValueError, TypeError):
+            logger.warning('Ignoring invalid circuit breaker state %s',
+                           self.path)
+            self.failures, self.opened_at = 0, None
+
+    def _save(self):
+        if self.path is None:
+            return
+        try:
+            with open(self.path, 'r') as f:
+                states = json.load(f)
+            if not isinstance(states, dict):
+                states = {}
+        except (IOError, OSError, ValueError):
+            states = {}
+        states[self.name] = {'failures': self.failures,
+                             'opened_at': self.opened_at}
+        try:
+            utils.atomic_write(self.path, json.dumps(states))
+        except (IOError, OSError) as e:
+            logger.warning('Cannot write circuit breaker state %s: %s',
+                           self.path, e)
+
+    def retry_after(self):
+        '''Seconds until the backend can be called again (0 if it can).'''
+        with self._lock:
+            self._load()
+            if self.failures < self.threshold or self.opened_at is None:
+                return 0
+            return max(0, self.opened_at + self.reset_timeout - time.time())
+
+    def success(self):
+        with self._lock:
+            if self.failures or self.opened_at is not None:
+                self.failures, self.opened_at = 0, None
+                self._save()
+
+    def failure(self):
+        with self._lock:
+            self._load()
+            self.failures += 1
+            if self.failures >= self.threshold:
+                if self.opened_at is None:
+                    logger.warning('Opening the circuit breaker of %s after '
+                                   '%d failures', self.name, self.failures)
+                self.opened_at = time.time()
+            self._save()
+
+
+class Backend(object):
+    '''Retry policy and circuit breaker of the calls to a backend.
+
+    Failed calls are retried up to retries times if the error is transient,
+    waiting a random time of up to retry_delay * 2 ** attempt seconds (but
+    no more than max_delay) between them. The default backend does not
+    retry and has no circuit breaker.
+    '''
+    max_delay = 10
+
+    def __init__(self, name=None, retries=0, retry_delay=0.5, breaker=None):
+        self.name = name
+        self.retries = retries
+        self.retry_delay = retry_delay
+        self.breaker = breaker
+
+    def _get_delay(self, attempt):
+        return random.uniform(  # nosec
+            0, min(self.max_delay, self.retry_delay * 2 ** attempt))
+
+    def call(self, func, args=(), deadline=None,
+             is_transient=is_transient_error):
+        '''Call func with args, retrying it on transient errors.
+
+        No retry is started if it cannot be made before the deadline.
+        Raises BackendUnavailable if the circuit breaker is open.
+        '''
+        if deadline is None:
+            deadline = utils.Deadline()
+
+        if self.breaker is not None:
+            retry_after = self.breaker.retry_after()
+            if retry_after:
+                raise exceptions.BackendUnavailable(backend=self.name,
+                                                    seconds=retry_after)
+
+        attempt = 0
+        while True:
+            try:
+                result = func(*args)
+            except Exception as e:
+                if not is_transient(e):
+                    raise
+                delay = self._get_delay(attempt)
+                remaining = deadline.remaining()
+                out_of_time = remaining is not None and delay >= remaining
+                if attempt >= self.retries or out_of_time:
+                    if self.breaker is not None:
+                        self.breaker.failure()
+                    raise
+                logger.warning('Error calling the %s backend, retrying in '
+                               '%.2f seconds: %s', self.name, delay, e)
+                time.sleep(delay)
+                attempt += 1
+                continue
+
+            if self.breaker is not None:
+                self.breaker.success()
+            return result
+
+
+def get_backend(opts):
+    '''Get the backend of the dynamic provider configured in the options.'''
+    breaker = None
+    if opts.circuit_breaker_threshold > 0:
+        breaker = CircuitBreaker(opts.middleware,
+                                 threshold=opts.circuit_breaker_threshold,
+                                 reset_timeout=opts.circuit_breaker_reset,
+                                 path=opts.circuit_breaker_file)
+    return Backend(opts.middleware, retries=opts.backend_retries,
+                   retry_delay=opts.backend_retry_delay, breaker=breaker)
@@ -0,0 +1,89 @@
+import fcntl
+import json
+import logging
+import os
+import subprocess  # nosec
+import sys
+import time
+
+from cloud_info import utils
+
+logger = logging.getLogger(__name__)
+
+
+class Snapshot(object):
+    '''On-disk snapshot of the information collected from the providers.
+
+    The snapshot stores the merged result of every provider method together
+    with the time it was collected, so that a later run can render its
+    output without querying the providers.
+    '''
+    version = 1
+
+    def __init__(self, path):
+        self.path = path
+        self.lock_path = '%s.lock' % path
+
+    def load(self):
+        '''Load the snapshot, returning a (timestamp, info) tuple.
+
+        None is returned if the snapshot does not exist or is not valid.
+        '''
+        try:
+            with open(self.path, 'r') as f:
+                data = json.load(f)
+            if data['version'] != self.version:
+                return None
+            return data['timestamp'], data['info']
+        except (IOError, OSError):
+            return None
+        except (ValueError, KeyError, TypeError):
+            logger.warning('Ignoring invalid snapshot %s', self.path)
+            return None
+
+    def save(self, info, timestamp=None):
+        if timestamp is None:
+            timestamp = time.time()
+        data = {
+            'version': self.version,
+            'timestamp': timestamp,
+            'info': info,
+        }
+        utils.atomic_write(self.path, json.dumps(data, default=str))
+
+    def age(self, timestamp):
+        return max(0, time.time() - timestamp)
+
+    def lock(self):
+        '''Try to get the refresh lock, returning its file or None.'''
+        f = open(self.lock_path, 'a')
+        try:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except (IOError, OSError):
+            f.close()
+            return None
+        return f
+
+    def refreshing(self):
+        '''Check if there is a refresh already running.'''
+        f = self.lock()
+        if f is None:
+            return True
+        f.close()
+        return False
+
+    def refresh_in_background(self, argv):
+        '''Spawn a detached process that refreshes the snapshot.'''
+        if self.refreshing():
+            return None
+
+        cmd = [sys.executable, '-m', 'cloud_info.core']
+        cmd.extend(argv)
+        cmd.append('--snapshot-refresh')
+        with open(os.devnull, 'r+') as devnull:
+            return subprocess.Popen(cmd,  # nosec
+                                    stdin=devnull,
+                                    stdout=devnull,
+                                    stderr=devnull,
+                                    close_fds=True,
+                                    preexec_fn=os.setsid)
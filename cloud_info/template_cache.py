@@ -0,0 +1,90 @@
+import hashlib
+import logging
+import os
+import stat
+import threading
+
+logger = logging.getLogger(__name__)
+
+_cache = {}
+_lock = threading.Lock()
+# Whether each cache directory can be trusted
+_trusted_dirs = {}
+
+
+def _module_filename(filename, data, cache_dir):
+    digest = hashlib.sha1(data).hexdigest()  # nosec
+    name = '%s.%s.py' % (os.path.basename(filename), digest)
+    return os.path.join(cache_dir, name)
+
+
+def _is_trusted(cache_dir):
+    '''Check that only the current user (or root) can write into cache_dir.
+
+    The compiled templates stored there are imported, i.e. executed. The
+    directory is created, only accessible by the current user, if needed.
+    '''
+    try:
+        if not os.path.isdir(cache_dir):
+            os.makedirs(cache_dir, 0o700)
+        st = os.stat(cache_dir)
+    except (IOError, OSError) as e:
+        logger.warning('Cannot use the template cache directory %s: %s',
+                       cache_dir, e)
+        return False
+    if st.st_uid not in (0, os.getuid()):
+        logger.warning('Not using the template cache directory %s, it is '
+                       'not owned by the current user', cache_dir)
+        return False
+    if st.st_mode & (stat.S_IWGRP | stat.S_IWOTH):
+        logger.warning('Not using the template cache directory %s, it is '
+                       'writable by other users', cache_dir)
+        return False
+    return True
+
+
+def get_stamp(filename):
+    '''Get a stamp that changes whenever filename is modified.'''
+    st = os.stat(filename)
+    return (st.st_mtime, st.st_size)
+
+
+def get_template(filename, cache_dir=None):
+    '''Get the compiled Mako template for filename.
+
+    Templates are compiled only once per process, unless the file is
+    modified. If cache_dir is set, the Python modules generated from the
+    templates are stored there, keyed by the template contents, so that
+    later runs do not need to compile them again. The directory is not used
+    if other users can write into it.
+    '''
+    key = (filename, cache_dir)
+    stamp = get_stamp(filename)
+
+    with _lock:
+        cached = _cache.get(key)
+        if cached is not None and cached[0] == stamp:
+            return cached[1]
+
+        if cache_dir is not None and cache_dir not in _trusted_dirs:
+            _trusted_dirs[cache_dir] = _is_trusted(cache_dir)
+
+        module_filename = None
+        if cache_dir is not None and _trusted_dirs[cache_dir]:
+            with open(filename, 'rb') as f:
+                data = f.read()
+            module_filename = _module_filename(filename, data, cache_dir)
+
+        # Mako is imported here as it takes a while to load
+        import mako.template
+        tpl = mako.template.Template(filename=filename,
+                                     module_filename=module_filename)
+        _cache[key] = (stamp, tpl)
+        return tpl
+
+
+def clear_cache():
+    '''Forget all the templates compiled by this process.'''
+    with _lock:
+        _cache.clear()
+        _trusted_dirs.clear()
@@ -0,0 +1,81 @@
+import time
+import unittest
+
+import six
+from six.moves import xmlrpc_client  # nosec
+
+from cloud_info.tests import utils
+
+try:
+    import asyncio
+
+    from cloud_info import aioxmlrpc
+except (ImportError, SyntaxError):
+    aioxmlrpc = None
+
+
+@unittest.skipIf(six.PY2, 'asyncio requires Python 3')
+class ServerProxyTest(unittest.TestCase):
+    def setUp(self):
+        def sleep(seconds, value):
+            time.sleep(seconds)
+            return value
+
+        def fail():
+            raise ValueError('foo')
+
+        self.server = utils.XMLRPCServer({
+            'echo': lambda *args: list(args),
+            'one.sleep': sleep,
+            'fail': fail,
+        })
+        self.server.start()
+        self.addCleanup(self.server.stop)
+
+    def test_call(self):
+        results = aioxmlrpc.call_many(self.server.uri, [
+            ('echo', ('foo', 1, u'caf\xe9')),
+            ('echo', ()),
+        ])
+        self.assertEqual([['foo', 1, u'caf\xe9'], []], results)
+
+    def test_call_concurrent(self):
+        start = time.time()
+        results = aioxmlrpc.call_many(
+            self.server.uri,
+            [('one.sleep', (0.2, i)) for i in range(4)],
+            max_connections=4)
+        self.assertEqual([0, 1, 2, 3], results)
+        self.assertLess(time.time() - start, 0.6)
+
+    def test_call_keep_alive(self):
+        results = aioxmlrpc.call_many(
+            self.server.uri, [('echo', (i,)) for i in range(5)],
+            max_connections=1)
+        self.assertEqual([[i] for i in range(5)], results)
+        self.assertEqual(1, self.server.connections)
+
+    def test_call_timeout(self):
+        results = aioxmlrpc.call_many(
+            self.server.uri,
+            [('one.sleep', (0.5, 'slow')), ('one.sleep', (0, 'fast'))],
+            timeout=0.1)
+        self.assertIsInstance(results[0], asyncio.TimeoutError)
+        self.assertEqual('fast', results[1])
+
+    def test_call_errors(self):
+        results = aioxmlrpc.call_many(self.server.uri, [
+            ('fail', ()),
+            ('foo', ()),
+        ])
+        self.assertIsInstance(results[0], xmlrpc_client.Fault)
+        self.assertIn('foo', results[0].faultString)
+        self.assertIsInstance(results[1], xmlrpc_client.Fault)
+
+        uri = self.server.uri.replace('/RPC2', '/foo')
+        result, = aioxmlrpc.call_many(uri, [('echo', ())])
+        self.assertIsInstance(result, xmlrpc_client.ProtocolError)
+        self.assertEqual(404, result.errcode)
+
+    def test_invalid_uri(self):
+        self.assertRaises(ValueError, aioxmlrpc.ServerProxy, 'foo://bar')
@@ -21,3 +21,9 @@ class BaseProviderTest(unittest.TestCase):
 
     def test_provider_get_storage_endpoints(self):
         self.assertEqual({}, self.provider.get_storage_endpoints())
+
+    def test_provider_iter_images(self):
+        self.assertEqual([], list(self.provider.iter_images()))
+
+    def test_provider_iter_templates(self):
+        self.assertEqual([], list(self.provider.iter_templates()))
@@ -0,0 +1,158 @@
+import os.path
+import shutil
+import tempfile
+import unittest
+
+import mako.template
+import mock
+
+from cloud_info import blocks
+from cloud_info.tests import data
+
+DATA = data.DATA
+
+
+def fake_capture(block, *args):
+    return block(*args)
+
+
+class FakeOpts(object):
+    block_cache_size = 10
+    block_cache_file = None
+    daemon = False
+
+
+class BlockCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmpdir, 'blocks.json')
+        self.block = mock.Mock()
+        self.block.side_effect = lambda entity: 'block %(foo)s' % entity
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_no_cache(self):
+        cache = blocks.NoCache().bind('scope')
+        for i in range(2):
+            self.assertEqual('block bar',
+                             cache.render('foo', fake_capture, self.block,
+                                          {'foo': 'bar'}))
+        self.assertEqual(2, self.block.call_count)
+
+    def test_cache(self):
+        cache = blocks.BlockCache()
+        bound = cache.bind('scope')
+        for i in range(3):
+            self.assertEqual('block bar',
+                             bound.render('foo', fake_capture, self.block,
+                                          {'foo': 'bar'}))
+        self.block.assert_called_once_with({'foo': 'bar'})
+        self.assertEqual(2, cache.hits)
+        self.assertEqual(1, cache.misses)
+
+        # Different entity, block name or scope are rendered again
+        bound.render('foo', fake_capture, self.block, {'foo': 'baz'})
+        bound.render('bar', fake_capture, self.block, {'foo': 'bar'})
+        cache.bind('other').render('foo', fake_capture, self.block,
+                                   {'foo': 'bar'})
+        self.assertEqual(4, self.block.call_count)
+
+    def test_cache_mutated_entity(self):
+        def block(entity):
+            entity['foo'] = 'mutated'
+            return 'block'
+
+        cache = blocks.BlockCache()
+        entity = {'foo': 'bar'}
+        cache.render('scope', 'foo', fake_capture, block, entity)
+        cache.render('scope', 'foo', fake_capture, block, {'foo': 'bar'})
+        self.assertEqual(1, cache.hits)
+
+    def test_lru(self):
+        cache = blocks.BlockCache(size=2)
+        for foo in ('a', 'b', 'a', 'c'):
+            cache.render('scope', 'foo', fake_capture, self.block,
+                         {'foo': foo})
+        self.assertEqual(2, len(cache.blocks))
+        # 'b' was the least recently used
+        cache.render('scope', 'foo', fake_capture, self.block, {'foo': 'a'})
+        cache.render('scope', 'foo', fake_capture, self.block, {'foo': 'b'})
+        self.assertEqual(2, cache.hits)
+        self.assertEqual(4, cache.misses)
+
+    def test_save_load(self):
+        cache = blocks.BlockCache(path=self.path)
+        for foo in ('a', 'b'):
+            cache.render('scope', 'foo', fake_capture, self.block,
+                         {'foo': foo})
+        cache.save()
+
+        cache = blocks.BlockCache(path=self.path)
+        self.assertEqual('block a',
+                         cache.render('scope', 'foo', fake_capture,
+                                      self.block, {'foo': 'a'}))
+        self.assertEqual(1, cache.hits)
+        cache.save()
+
+        # Only the blocks used by the last run are kept
+        cache = blocks.BlockCache(path=self.path)
+        self.assertEqual(1, len(cache.blocks))
+
+    def test_load_invalid(self):
+        with open(self.path, 'w') as f:
+            f.write('foo')
+        cache = blocks.BlockCache(path=self.path)
+        self.assertEqual(0, len(cache.blocks))
+
+    def test_get_cache(self):
+        opts = FakeOpts()
+        self.assertIsInstance(blocks.get_cache(opts), blocks.NoCache)
+        opts.daemon = True
+        self.assertIsInstance(blocks.get_cache(opts), blocks.BlockCache)
+        opts.block_cache_size = 0
+        self.assertIsInstance(blocks.get_cache(opts), blocks.NoCache)
+        opts.daemon = False
+        opts.block_cache_size = 10
+        opts.block_cache_file = self.path
+        cache = blocks.get_cache(opts)
+        self.assertEqual(self.path, cache.path)
+
+
+class ComputeBlocksTest(unittest.TestCase):
+    def _get_info(self):
+        endpoints = DATA.compute_endpoints
+        static = dict(endpoints, **DATA.site_info)
+        static.pop('endpoints')
+        for endpoint in endpoints['endpoints'].values():
+            endpoint.update(static)
+        templates = DATA.compute_templates
+        for template_id, template in templates.items():
+            template.update(static, template_id=template_id,
+                            template_disk=None)
+        images = DATA.compute_images
+        for image_id, image in images.items():
+            image.update(static, image_id=image_id, image_description=None)
+        return {'endpoints': endpoints,
+                'static_compute_info': static,
+                'templates': templates,
+                'images': images}
+
+    def test_compute_template(self):
+        cwd = os.path.dirname(__file__)
+        tpl = mako.template.Template(
+            filename=os.path.join(cwd, '..', '..', 'etc', 'templates',
+                                  'compute.ldif'))
+        expected = tpl.render(attributes=self._get_info(),
+                              blocks=blocks.NoCache())
+        # Other renderers may not give any block cache
+        self.assertEqual(expected, tpl.render(attributes=self._get_info()))
+
+        cache = blocks.BlockCache()
+        for i in range(2):
+            self.assertEqual(expected,
+                             tpl.render(attributes=self._get_info(),
+                                        blocks=cache.bind('compute')))
+        # 3 endpoints, 4 templates and 1 image
+        self.assertEqual(8, cache.misses)
+        self.assertEqual(8, cache.hits)
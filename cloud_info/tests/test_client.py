@@ -0,0 +1,46 @@
+import io
+import os.path
+import shutil
+import tempfile
+import unittest
+
+import mock
+
+from cloud_info import client
+
+
+class ClientTest(unittest.TestCase):
+    def test_parse_opts(self):
+        opts = client.parse_opts(['--daemon-socket', '/foo/bar',
+                                  '--timeout', '2.5'])
+        self.assertEqual('/foo/bar', opts.daemon_socket)
+        self.assertEqual(2.5, opts.timeout)
+
+    def test_parse_opts_defaults(self):
+        opts = client.parse_opts([])
+        self.assertEqual(client.DEFAULT_SOCKET, opts.daemon_socket)
+
+    def test_main_no_daemon(self):
+        tmpdir = tempfile.mkdtemp()
+        path = os.path.join(tmpdir, 'missing.sock')
+        opts = client.parse_opts(['--daemon-socket', path])
+        try:
+            with mock.patch.object(client, 'parse_opts') as m_opts:
+                m_opts.return_value = opts
+                with mock.patch('sys.stderr', new_callable=io.StringIO):
+                    self.assertEqual(1, client.main())
+        finally:
+            shutil.rmtree(tmpdir)
+
+    @mock.patch.object(client, 'fetch')
+    def test_main(self, m_fetch):
+        m_fetch.return_value = 10
+        with mock.patch.object(client, 'parse_opts'):
+            self.assertEqual(0, client.main())
+
+    @mock.patch.object(client, 'fetch')
+    def test_main_empty(self, m_fetch):
+        m_fetch.return_value = 0
+        with mock.patch.object(client, 'parse_opts'):
+            with mock.patch('sys.stderr', new_callable=io.StringIO):
+                self.assertEqual(1, client.main())
@@ -1,9 +1,21 @@
+import base64
+import collections
+import io
+import json
 import os.path
+import shutil
+import tempfile
+import time
 import unittest
 
 import mock
+import six
 
 import cloud_info.core
+from cloud_info import exceptions
+import cloud_info.providers
+import cloud_info.snapshot
+import cloud_info.utils
 from cloud_info.tests import data
 from cloud_info.tests import utils
 
@@ -14,11 +26,19 @@ class ModuleTest(unittest.TestCase):
     def test_main(self):
         with utils.nested(
             mock.patch.object(cloud_info.core, 'parse_opts'),
+            mock.patch('cloud_info.core.Collector'),
             mock.patch('cloud_info.core.CloudBDII'),
             mock.patch('cloud_info.core.ComputeBDII'),
             mock.patch('cloud_info.core.StorageBDII')
-        ) as (m0, m1, m2, m3):
-            m0.return_value = None
+        ) as (m0, m_collector, m1, m2, m3):
+            opts = mock.Mock()
+            opts.parallel_sections = False
+            opts.snapshot_file = None
+            opts.snapshot_refresh = False
+            opts.daemon = False
+            opts.ldif_delta_state = None
+            opts.stream = False
+            m0.return_value = opts
             for i in (m1, m2, m3):
                 i = i.return_value
                 i.render.return_value = 'foo'
@@ -28,6 +48,311 @@ class ModuleTest(unittest.TestCase):
             for i in (m0, m1, m2, m3):
                 assert i.called
 
+            # All the BDIIs share the same collection session
+            m_collector.assert_called_once_with(opts)
+            for i in (m1, m2, m3):
+                i.assert_called_once_with(
+                    opts, collector=m_collector.return_value)
+
+    @mock.patch.object(cloud_info.core, 'get_collector')
+    @mock.patch.object(cloud_info.core, 'parse_opts')
+    def test_main_failure_metrics(self, m_parse_opts, m_get_collector):
+        tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmpdir)
+        opts = m_parse_opts.return_value
+        opts.snapshot_refresh = False
+        opts.daemon = False
+        opts.metrics_file = os.path.join(tmpdir, 'cloud_info.prom')
+        m_get_collector.side_effect = ValueError()
+
+        self.assertRaises(ValueError, cloud_info.core.main)
+        with open(opts.metrics_file) as f:
+            self.assertIn('cloud_info_provider_last_run_success 0.0\n',
+                          f.read())
+
+    @mock.patch.object(cloud_info.core, 'write_output')
+    @mock.patch.object(cloud_info.core, 'get_collector')
+    def test_run_failure_profile(self, m_get_collector, m_write_output):
+        collector = m_get_collector.return_value
+        m_write_output.side_effect = IOError()
+        self.assertRaises(IOError, cloud_info.core.run, mock.Mock())
+        collector.profiler.finish.assert_called_once_with()
+        collector.report_metrics.assert_called_once_with(success=False)
+        self.assertFalse(collector.block_cache.save.called)
+
+        m_write_output.side_effect = None
+        m_write_output.return_value = 10
+        collector.reset_mock()
+        cloud_info.core.run(mock.Mock())
+        collector.profiler.finish.assert_called_once_with()
+        collector.report_metrics.assert_called_once_with(output_size=10)
+
+    def _fake_bdiis(self, delays):
+        collector = mock.Mock()
+        collector.opts.collection_workers = 1
+        bdiis = []
+        for i, delay in enumerate(delays):
+            def render(i=i, delay=delay):
+                time.sleep(delay)
+                return 'section %s' % i
+
+            bdii = mock.Mock()
+            bdii.collector = collector
+            bdii.provider_methods = ('get_foo_%s' % i, )
+            bdii.get_entity_methods.return_value = ('get_bar_%s' % i, )
+            bdii.render.side_effect = render
+            bdiis.append(bdii)
+        return collector, bdiis
+
+    def test_render_sections(self):
+        collector, bdiis = self._fake_bdiis((0, 0, 0))
+        self.assertEqual(['section 0', 'section 1', 'section 2'],
+                         list(cloud_info.core.render_sections(bdiis)))
+        (first, ), (second, ) = [c[0] for c in
+                                 collector.prefetch.call_args_list]
+        self.assertEqual(['get_foo_0', 'get_foo_1', 'get_foo_2'],
+                         list(first))
+        self.assertEqual(['get_bar_0', 'get_bar_1', 'get_bar_2'],
+                         list(second))
+        for bdii in bdiis:
+            bdii.load_templates.assert_called_once_with()
+
+    def test_write_json(self):
+        collector, bdiis = self._fake_bdiis((0, 0))
+        bdiis[0].iter_objects.return_value = iter([{'dn': 'foo'}])
+        bdiis[1].iter_objects.return_value = iter([{'dn': u'b\xe1r'},
+                                                   {'dn': 'baz'}])
+        out = io.StringIO()
+        cloud_info.core.write_json(bdiis, out)
+        lines = out.getvalue().splitlines()
+        self.assertEqual([{'dn': 'foo'}, {'dn': u'b\xe1r'}, {'dn': 'baz'}],
+                         [json.loads(line) for line in lines])
+
+    def test_render_sections_parallel(self):
+        # Later sections finish first, output order must be kept
+        collector, bdiis = self._fake_bdiis((0.2, 0.1, 0))
+        self.assertEqual(['section 0', 'section 1', 'section 2'],
+                         list(cloud_info.core.render_sections(bdiis,
+                                                              parallel=True)))
+        for bdii in bdiis:
+            bdii.load_templates.assert_called_once_with()
+        self.assertFalse(collector.prefetch.called)
+
+        # The collection workers collect the information beforehand
+        collector, bdiis = self._fake_bdiis((0, 0, 0))
+        collector.opts.collection_workers = 4
+        self.assertEqual(['section 0', 'section 1', 'section 2'],
+                         list(cloud_info.core.render_sections(bdiis,
+                                                              parallel=True)))
+        self.assertEqual(2, collector.prefetch.call_count)
+
+    def _fake_expired_bdiis(self):
+        # The second section cannot be collected before the deadline
+        collector, bdiis = self._fake_bdiis((0, 0, 0))
+        collector.deadline = cloud_info.utils.Deadline(0)
+        collector.skipped_sections = []
+        for bdii, section in zip(bdiis, ('cloud', 'compute', 'storage')):
+            bdii.section = section
+        bdiis[1].render.side_effect = exceptions.DeadlineExceeded()
+        bdiis[1].render_stream.side_effect = exceptions.DeadlineExceeded()
+        bdiis[1].iter_objects.side_effect = exceptions.DeadlineExceeded()
+        return collector, bdiis
+
+    def test_render_sections_partial(self):
+        for parallel in (False, True):
+            collector, bdiis = self._fake_expired_bdiis()
+            self.assertEqual(
+                ['section 0', 'section 2'],
+                list(cloud_info.core.render_sections(
+                    bdiis, parallel=parallel, partial=True)))
+            self.assertEqual(['compute'], collector.skipped_sections)
+
+    def test_render_sections_partial_prefetch(self):
+        collector, bdiis = self._fake_expired_bdiis()
+        collector.prefetch.side_effect = exceptions.DeadlineExceeded()
+        self.assertEqual(['section 0', 'section 2'],
+                         list(cloud_info.core.render_sections(
+                             bdiis, partial=True)))
+
+    def test_render_sections_not_partial(self):
+        collector, bdiis = self._fake_expired_bdiis()
+        self.assertRaises(exceptions.DeadlineExceeded, list,
+                          cloud_info.core.render_sections(bdiis))
+
+        # Failures before the deadline are not hidden
+        collector, bdiis = self._fake_expired_bdiis()
+        collector.deadline = cloud_info.utils.Deadline(60)
+        bdiis[1].render.side_effect = ValueError()
+        self.assertRaises(ValueError, list,
+                          cloud_info.core.render_sections(bdiis,
+                                                          partial=True))
+
+    def test_write_json_partial(self):
+        collector, bdiis = self._fake_expired_bdiis()
+        bdiis[0].iter_objects.return_value = iter([{'dn': 'foo'}])
+        bdiis[2].iter_objects.return_value = iter([{'dn': 'bar'}])
+        out = io.StringIO()
+        cloud_info.core.write_json(bdiis, out, partial=True)
+        self.assertEqual([{'dn': 'foo'}, {'dn': 'bar'}],
+                         [json.loads(line)
+                          for line in out.getvalue().splitlines()])
+        self.assertEqual(['compute'], collector.skipped_sections)
+
+    def test_stream_sections_partial(self):
+        collector, bdiis = self._fake_expired_bdiis()
+        for i in (0, 2):
+            bdiis[i].render_stream.side_effect = (
+                lambda out, i=i: out.write(u'section %s' % i))
+        out = io.StringIO()
+        cloud_info.core.stream_sections(bdiis, out, partial=True)
+        self.assertEqual(u'section 0\n\nsection 2\n', out.getvalue())
+
+    def test_write_output_partial(self):
+        opts = mock.Mock()
+        opts.format = 'ldif'
+        opts.stream = False
+        opts.parallel_sections = False
+        opts.ldif_delta_state = None
+        opts.deadline = 10
+        collector, bdiis = self._fake_expired_bdiis()
+        collector.profiler.phase.return_value = mock.MagicMock()
+        out = io.BytesIO()
+        cloud_info.core.write_output(opts, bdiis, out=out)
+        self.assertEqual(b'section 0\nsection 2\n', out.getvalue())
+
+        # A partial delta would delete the entries of the missing sections
+        tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmpdir)
+        opts.ldif_delta_state = os.path.join(tmpdir, 'state.json')
+        collector, bdiis = self._fake_expired_bdiis()
+        self.assertRaises(exceptions.DeadlineExceeded,
+                          cloud_info.core.write_output, opts, bdiis,
+                          out=io.BytesIO())
+        self.assertFalse(os.path.exists(opts.ldif_delta_state))
+
+    def test_write_output_delta_failure(self):
+        tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmpdir)
+        opts = mock.Mock()
+        opts.format = 'ldif'
+        opts.stream = False
+        opts.parallel_sections = False
+        opts.deadline = None
+        opts.ldif_delta_state = os.path.join(tmpdir, 'state.json')
+        collector, bdiis = self._fake_bdiis((0, ))
+        bdiis[0].render.side_effect = lambda: 'dn: o=glue\nobjectClass: foo'
+        collector.profiler.phase.return_value = mock.MagicMock()
+        cloud_info.core.write_output(opts, bdiis, out=io.BytesIO())
+        with open(opts.ldif_delta_state) as f:
+            state = f.read()
+
+        # The changes were not delivered, the next run must output them
+        bdiis[0].render.side_effect = lambda: 'dn: o=glue\nobjectClass: bar'
+        out = mock.Mock()
+        out.write.side_effect = IOError()
+        self.assertRaises(IOError, cloud_info.core.write_output, opts, bdiis,
+                          out=out)
+        with open(opts.ldif_delta_state) as f:
+            self.assertEqual(state, f.read())
+
+        out = io.BytesIO()
+        cloud_info.core.write_output(opts, bdiis, out=out)
+        self.assertIn(b'objectClass: bar', out.getvalue())
+
+
+class ProviderRegistryTest(unittest.TestCase):
+    def test_load_provider(self):
+        import cloud_info.providers.openstack
+        self.assertIs(cloud_info.providers.openstack.OpenStackProvider,
+                      cloud_info.core.load_provider('openstack'))
+
+    def test_load_provider_class(self):
+        provider = mock.Mock()
+        with mock.patch.dict(cloud_info.core.SUPPORTED_MIDDLEWARE,
+                             {'foo': provider}):
+            self.assertIs(provider, cloud_info.core.load_provider('foo'))
+
+    @mock.patch.object(cloud_info.core, '_get_entry_points')
+    def test_load_provider_entry_point(self, m_entry_points):
+        m_entry_points.return_value = {
+            'foo': 'cloud_info.providers:BaseProvider'
+        }
+        self.assertIs(cloud_info.providers.BaseProvider,
+                      cloud_info.core.load_provider('foo'))
+        self.assertIn('foo', cloud_info.core.get_middleware_names())
+        self.assertIn('openstack', cloud_info.core.get_middleware_names())
+
+    @mock.patch.object(cloud_info.core, '_get_entry_points')
+    def test_load_provider_unknown(self, m_entry_points):
+        m_entry_points.return_value = {}
+        self.assertIsNone(cloud_info.core.load_provider('foo'))
+
+    def test_get_entry_points(self):
+        self.assertIsInstance(cloud_info.core._get_entry_points(), dict)
+
+
+class ParseOptsTest(unittest.TestCase):
+    def test_parse_opts(self):
+        opts = cloud_info.core.parse_opts(['--yaml-file', 'foo.yaml'])
+        self.assertEqual('static', opts.middleware)
+        self.assertEqual('foo.yaml', opts.yaml_file)
+        self.assertEqual('/etc/glite-info-static/site/site.cfg',
+                         opts.glite_site_info_static)
+
+    def test_parse_opts_provider(self):
+        opts = cloud_info.core.parse_opts(['--middleware', 'openstack',
+                                           '--os-username', 'foo'])
+        self.assertEqual('openstack', opts.middleware)
+        self.assertEqual('foo', opts.os_username)
+
+    @mock.patch.object(cloud_info.core, '_get_entry_points')
+    def test_parse_opts_no_entry_points(self, m_entry_points):
+        # Entry points are only scanned for the help
+        cloud_info.core.parse_opts(['--middleware', 'openstack'])
+        self.assertFalse(m_entry_points.called)
+
+        m_entry_points.return_value = {}
+        with utils.nested(mock.patch('sys.stdout'), mock.patch('sys.exit')):
+            cloud_info.core.parse_opts(['--help'])
+        m_entry_points.assert_called_with()
+
+    @mock.patch.object(cloud_info.core, 'load_provider')
+    def test_parse_opts_only_selected(self, m_load):
+        m_load.return_value = cloud_info.providers.BaseProvider
+        cloud_info.core.parse_opts(['--middleware', 'openstack'])
+        self.assertEqual([mock.call('openstack'), mock.call('static')],
+                         m_load.call_args_list)
+
+    @mock.patch.object(cloud_info.core, '_get_entry_points')
+    def test_parse_opts_unknown(self, m_entry_points):
+        m_entry_points.return_value = {}
+        with mock.patch('sys.stderr'):
+            self.assertRaises(SystemExit, cloud_info.core.parse_opts,
+                              ['--middleware', 'foo'])
+
+    def test_parse_opts_render_processes(self):
+        opts = cloud_info.core.parse_opts(['--ldif-writer', 'native',
+                                           '--render-processes', '4'])
+        self.assertEqual(4, opts.render_processes)
+        with mock.patch('sys.stderr'):
+            self.assertRaises(SystemExit, cloud_info.core.parse_opts,
+                              ['--render-processes', '4'])
+
+    def test_parse_opts_stream_delta(self):
+        with mock.patch('sys.stderr'):
+            self.assertRaises(SystemExit, cloud_info.core.parse_opts,
+                              ['--stream', '--ldif-delta-state', 'foo'])
+
+    def test_parse_opts_deadline(self):
+        self.assertIsNone(cloud_info.core.parse_opts([]).deadline)
+        opts = cloud_info.core.parse_opts(['--deadline', '2.5'])
+        self.assertEqual(2.5, opts.deadline)
+
+    def test_parse_opts_other_provider_options(self):
+        with mock.patch('sys.stderr'):
+            self.assertRaises(SystemExit, cloud_info.core.parse_opts,
+                              ['--os-username', 'foo'])
+
 
 class FakeBDIIOpts(object):
     full_bdii_ldif = False
@@ -35,14 +360,36 @@ class FakeBDIIOpts(object):
     yaml_file = None
     template_dir = ''
     template_extension = ''
+    collection_workers = 1
+    snapshot_file = None
+    template_cache_dir = None
+    block_cache_file = None
+    block_cache_size = 10000
+    daemon = False
+    profile = False
+    format = 'ldif'
+    ldif_writer = 'template'
+    ldif_fold_width = 0
+    render_processes = 1
+    deadline = None
+    backend_retries = 0
+    backend_retry_delay = 0.5
+    circuit_breaker_threshold = 0
+    circuit_breaker_reset = 300
+    circuit_breaker_file = None
+    metrics_file = None
+    snapshot_ttl = 300
+    snapshot_max_staleness = 3600
 
 
 class BaseTest(unittest.TestCase):
     def setUp(self):
-        cloud_info.core.SUPPORTED_MIDDLEWARE = {
+        patcher = mock.patch.object(cloud_info.core, 'SUPPORTED_MIDDLEWARE', {
             'static': mock.MagicMock(),
             'foo middleware': mock.MagicMock(),
-        }
+        })
+        patcher.start()
+        self.addCleanup(patcher.stop)
 
         self.opts = FakeBDIIOpts()
         cwd = os.path.dirname(__file__)
@@ -80,9 +427,8 @@ class BaseBDIITest(BaseTest):
             ),
         )
 
-        bdii = cloud_info.core.BaseBDII(self.opts)
-
         for s, d, e in cases:
+            bdii = cloud_info.core.BaseBDII(self.opts)
             with utils.nested(
                 mock.patch.object(bdii.static_provider, 'foomethod'),
                 mock.patch.object(bdii.dynamic_provider, 'foomethod')
@@ -92,6 +438,22 @@ class BaseBDIITest(BaseTest):
 
                 self.assertEqual(e, bdii._get_info_from_providers('foomethod'))
 
+    def test_get_info_from_providers_memoized(self):
+        bdii = cloud_info.core.BaseBDII(self.opts)
+        with utils.nested(
+            mock.patch.object(bdii.static_provider, 'foomethod'),
+            mock.patch.object(bdii.dynamic_provider, 'foomethod')
+        ) as (m_static, m_dynamic):
+            m_static.return_value = {'foo': 'bar'}
+            m_dynamic.return_value = {'bar': 'bazonk'}
+
+            expected = {'foo': 'bar', 'bar': 'bazonk'}
+            for i in range(3):
+                self.assertEqual(expected,
+                                 bdii._get_info_from_providers('foomethod'))
+            m_static.assert_called_once_with()
+            m_dynamic.assert_called_once_with()
+
     def test_load_templates(self):
         self.opts.template_dir = 'foobar'
         tpls = ('foo', 'bar')
@@ -108,24 +470,411 @@ class BaseBDIITest(BaseTest):
             self.assertEqual(templates_files, expected_tpls)
 
     def test_format_template(self):
-        self.opts.template_dir = 'foobar'
+        tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmpdir)
+        self.opts.template_dir = tmpdir
         tpl_contents = 'foo ${attributes["fobble"]}'
         tpl_files = {
-            'foo': 'foobar/foo.%s' % self.opts.template_extension,
-            'bar': 'foobar/bar.%s' % self.opts.template_extension
+            'foo': os.path.join(tmpdir, 'foo.%s' %
+                                self.opts.template_extension),
+            'bar': os.path.join(tmpdir, 'bar.%s' %
+                                self.opts.template_extension),
         }
+        with open(tpl_files['foo'], 'w') as f:
+            f.write(tpl_contents)
         info = {'fobble': 'burble', 'brongle': 'farbla'}
         expected = 'foo burble'
 
         bdii = cloud_info.core.BaseBDII(self.opts)
         with utils.nested(
-                mock.patch.object(bdii, 'templates_files', tpl_files),
-                mock.patch('mako.util.open',
-                           mock.mock_open(read_data=tpl_contents), create=True)
-        ):
+                mock.patch.object(bdii, 'templates_files', tpl_files)):
             self.assertEqual(expected, bdii._format_template('foo', info))
 
 
+class CollectorTest(BaseTest):
+    def test_providers_built_once(self):
+        collector = cloud_info.core.Collector(self.opts)
+        for cls_ in (cloud_info.core.CloudBDII,
+                     cloud_info.core.ComputeBDII,
+                     cloud_info.core.StorageBDII):
+            bdii = cls_(self.opts, collector=collector)
+            self.assertIs(collector, bdii.collector)
+            self.assertIs(collector.static_provider, bdii.static_provider)
+            self.assertIs(collector.dynamic_provider, bdii.dynamic_provider)
+
+        for m in cloud_info.core.SUPPORTED_MIDDLEWARE.values():
+            m.assert_called_once_with(self.opts)
+
+    def test_static_middleware(self):
+        self.opts.middleware = 'static'
+        collector = cloud_info.core.Collector(self.opts)
+        self.assertIsNone(collector.dynamic_provider)
+        self.assertIsNotNone(collector.static_provider)
+
+    def test_get_info_shared(self):
+        collector = cloud_info.core.Collector(self.opts)
+        collector.static_provider.get_site_info.return_value = DATA.site_info
+        collector.dynamic_provider.get_site_info.return_value = {}
+
+        for cls_ in (cloud_info.core.CloudBDII,
+                     cloud_info.core.ComputeBDII,
+                     cloud_info.core.StorageBDII):
+            bdii = cls_(self.opts, collector=collector)
+            self.assertEqual(DATA.site_info,
+                             bdii._get_info_from_providers('get_site_info'))
+
+        collector.static_provider.get_site_info.assert_called_once_with()
+        collector.dynamic_provider.get_site_info.assert_called_once_with()
+
+    def _test_prefetch(self, workers):
+        self.opts.collection_workers = workers
+        collector = cloud_info.core.Collector(self.opts)
+        collector.static_provider.get_images.return_value = {
+            'foo': 'static', 'bar': 'static'}
+        collector.dynamic_provider.get_images.return_value = {
+            'foo': 'dynamic'}
+        collector.static_provider.get_site_info.return_value = {
+            'site_name': 'static'}
+        collector.dynamic_provider.get_site_info.return_value = {}
+
+        collector.prefetch(['get_images', 'get_site_info', 'get_images'])
+
+        self.assertEqual({'foo': 'dynamic', 'bar': 'static'},
+                         collector.get_info('get_images'))
+        self.assertEqual({'site_name': 'static'},
+                         collector.get_info('get_site_info'))
+        for p in (collector.static_provider, collector.dynamic_provider):
+            p.get_images.assert_called_once_with()
+            p.get_site_info.assert_called_once_with()
+
+        # Already collected methods are not queried again
+        collector.prefetch(['get_images'])
+        collector.static_provider.get_images.assert_called_once_with()
+
+    def test_prefetch_sequential(self):
+        self._test_prefetch(1)
+
+    def test_prefetch_concurrent(self):
+        self._test_prefetch(4)
+
+    def test_prefetch_concurrent_error(self):
+        self.opts.collection_workers = 4
+        collector = cloud_info.core.Collector(self.opts)
+        collector.static_provider.get_images.return_value = {}
+        collector.dynamic_provider.get_images.side_effect = ValueError()
+        self.assertRaises(ValueError, collector.prefetch, ['get_images'])
+        self.assertNotIn('get_images', collector.info)
+
+    def test_prefetch_concurrent_partial(self):
+        self.opts.collection_workers = 4
+        collector = cloud_info.core.Collector(self.opts)
+        collector.static_provider.get_images.return_value = {}
+        collector.dynamic_provider.get_images.side_effect = ValueError()
+        collector.static_provider.get_site_info.return_value = {'foo': 1}
+        collector.dynamic_provider.get_site_info.return_value = {}
+        self.assertRaises(ValueError, collector.prefetch,
+                          ['get_images', 'get_site_info'])
+        # The methods that were collected are kept
+        self.assertNotIn('get_images', collector.info)
+        self.assertEqual({'foo': 1}, collector.info['get_site_info'])
+
+    def test_backend(self):
+        self.opts.backend_retries = 2
+        self.opts.circuit_breaker_threshold = 1
+        provider = cloud_info.core.SUPPORTED_MIDDLEWARE['foo middleware']
+        provider.is_transient_error.side_effect = (
+            lambda e: isinstance(e, IOError))
+        provider.side_effect = [IOError(), IOError(), IOError()]
+
+        # Building the provider (i.e. authenticating) is retried
+        with mock.patch('time.sleep'):
+            self.assertRaises(IOError, cloud_info.core.Collector, self.opts)
+        self.assertEqual(3, provider.call_count)
+
+        provider.side_effect = None
+        collector = cloud_info.core.Collector(self.opts)
+        self.assertIs(collector.backend, collector.dynamic_provider.backend)
+        self.assertEqual('foo middleware', collector.backend.name)
+
+    def test_deadline(self):
+        self.opts.deadline = 60
+        collector = cloud_info.core.Collector(self.opts)
+        for p in (collector.static_provider, collector.dynamic_provider):
+            self.assertIs(collector.deadline, p.deadline)
+        self.assertLessEqual(collector.deadline.remaining(), 60)
+
+        collector.deadline = cloud_info.utils.Deadline(0)
+        self.assertRaises(exceptions.DeadlineExceeded,
+                          collector.get_info, 'get_images')
+        self.assertFalse(collector.static_provider.get_images.called)
+
+        # Every run gets the whole budget
+        collector.reset()
+        self.assertFalse(collector.deadline.expired())
+        for p in (collector.static_provider, collector.dynamic_provider):
+            self.assertIs(collector.deadline, p.deadline)
+
+    def test_reset_renew(self):
+        collector = cloud_info.core.Collector(self.opts)
+        self.assertFalse(collector.dynamic_provider.renew.called)
+        # e.g. before every refresh of the daemon
+        collector.reset()
+        collector.dynamic_provider.renew.assert_called_once_with()
+        self.assertFalse(collector.static_provider.renew.called)
+
+    def test_iter_info_deadline(self):
+        collector = cloud_info.core.Collector(self.opts)
+        collector.static_provider.get_images.return_value = {}
+
+        def iter_images():
+            yield 'foo', 'dynamic'
+            collector.deadline = cloud_info.utils.Deadline(0)
+            yield 'bar', 'dynamic'
+
+        collector.dynamic_provider.iter_images.side_effect = iter_images
+        entities = collector.iter_info('get_images')
+        self.assertEqual(('foo', 'dynamic'), next(entities))
+        self.assertRaises(exceptions.DeadlineExceeded, next, entities)
+
+    def test_profile(self):
+        self.opts.profile = True
+        self.opts.profile_output = None
+        self.opts.profile_sample_rate = 1.0
+        with mock.patch('sys.stderr', new_callable=six.StringIO):
+            collector = cloud_info.core.Collector(self.opts)
+            collector.static_provider.get_images.return_value = {}
+            collector.dynamic_provider.get_images.return_value = {}
+            collector.get_info('get_images')
+            self.assertEqual(['static init', 'foo middleware init',
+                              'static.get_images',
+                              'foo middleware.get_images'],
+                             [n for n, s in collector.profiler.timings])
+
+            # A new run starts when the information is reset
+            collector.reset()
+            self.assertEqual([], collector.profiler.timings)
+            collector.profiler.finish()
+
+    def test_report_metrics(self):
+        tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmpdir)
+        self.opts.metrics_file = os.path.join(tmpdir, 'cloud_info.prom')
+
+        collector = cloud_info.core.Collector(self.opts)
+        collector.static_provider.api_calls = 0
+        collector.static_provider.api_received_bytes = 0
+        collector.dynamic_provider.api_calls = 2
+        collector.dynamic_provider.api_received_bytes = 1024
+        collector.static_provider.get_images.return_value = {}
+        collector.dynamic_provider.get_images.return_value = {}
+        collector.get_info('get_images')
+        collector.report_metrics(output_size=10)
+
+        with open(self.opts.metrics_file) as f:
+            content = f.read()
+        for line in (
+                'cloud_info_provider_api_calls_total'
+                '{provider="foo middleware"} 2.0',
+                'cloud_info_provider_api_received_bytes_total'
+                '{provider="foo middleware"} 1024.0',
+                'cloud_info_provider_api_calls_total'
+                '{provider="static"} 0.0',
+                'cloud_info_provider_block_cache_hits_total 0.0',
+                'cloud_info_provider_output_bytes 10.0',
+                'cloud_info_provider_last_run_success 1.0'):
+            self.assertIn(line + '\n', content)
+        self.assertIn('cloud_info_provider_call_duration_seconds'
+                      '{method="get_images",provider="foo middleware"} ',
+                      content)
+        self.assertNotIn('block_cache_hit_ratio', content)
+        self.assertNotIn('skipped_sections', content)
+
+        collector.skipped_sections.append('compute')
+        collector.report_metrics(output_size=10)
+        with open(self.opts.metrics_file) as f:
+            self.assertIn('cloud_info_provider_skipped_sections'
+                          '{section="compute"} 1.0\n', f.read())
+
+
+class StreamTest(BaseTest):
+    def test_iter_info(self):
+        collector = cloud_info.core.Collector(self.opts)
+        collector.static_provider.get_images.return_value = {
+            'foo': 'static', 'bar': 'static'}
+        collector.dynamic_provider.iter_images.return_value = iter([
+            ('foo', 'dynamic'), ('baz', 'dynamic')])
+
+        self.assertEqual([('foo', 'dynamic'), ('baz', 'dynamic'),
+                          ('bar', 'static')],
+                         list(collector.iter_info('get_images')))
+        self.assertFalse(collector.dynamic_provider.get_images.called)
+        self.assertNotIn('get_images', collector.info)
+
+    def test_iter_info_collected(self):
+        collector = cloud_info.core.Collector(
+            self.opts, info={'get_images': {'foo': 'bar'}})
+        self.assertEqual([('foo', 'bar')],
+                         list(collector.iter_info('get_images')))
+
+    def test_base_render_stream(self):
+        bdii = cloud_info.core.BaseBDII(self.opts)
+        out = io.StringIO()
+        with mock.patch.object(bdii, 'render', create=True) as m_render:
+            m_render.return_value = u'foo'
+            bdii.render_stream(out)
+        self.assertEqual(u'foo', out.getvalue())
+
+    def test_stream_sections(self):
+        bdiis = []
+        for i in range(3):
+            bdii = mock.Mock()
+            bdii.render_stream.side_effect = (
+                lambda out, i=i: out.write(u'section %s' % i))
+            bdiis.append(bdii)
+        out = io.StringIO()
+        cloud_info.core.stream_sections(bdiis, out)
+        self.assertEqual(u'section 0\nsection 1\nsection 2\n',
+                         out.getvalue())
+
+
+class PartialOutputTest(BaseTest):
+    def _get_bdiis(self, images_delay):
+        self.opts.template_extension = 'ldif'
+        self.opts.stream = False
+        self.opts.parallel_sections = False
+        self.opts.ldif_delta_state = None
+        self.opts.deadline = 0.5
+
+        templates = DATA.compute_templates
+        for template_id, template in templates.items():
+            template['template_id'] = template_id
+            template['template_disk'] = None
+        images = DATA.compute_images
+        for image_id, image in images.items():
+            image['image_id'] = image_id
+            image['image_description'] = None
+
+        def get_images():
+            time.sleep(images_delay)
+            return images
+
+        collector = cloud_info.core.Collector(self.opts)
+        static = collector.static_provider
+        static.get_site_info.return_value = DATA.site_info
+        static.get_compute_endpoints.return_value = DATA.compute_endpoints
+        static.get_storage_endpoints.return_value = DATA.storage_endpoints
+        static.get_templates.return_value = templates
+        static.get_images.return_value = {}
+        dynamic = collector.dynamic_provider
+        for method in ('get_site_info', 'get_compute_endpoints',
+                       'get_storage_endpoints', 'get_templates'):
+            getattr(dynamic, method).return_value = {}
+        dynamic.get_images.side_effect = get_images
+        return [cls_(self.opts, collector=collector)
+                for cls_ in (cloud_info.core.CloudBDII,
+                             cloud_info.core.ComputeBDII,
+                             cloud_info.core.StorageBDII)]
+
+    def test_slow_images(self):
+        # The site information and the endpoints are collected before the
+        # images, so their sections are written when the budget runs out
+        bdiis = self._get_bdiis(images_delay=0.6)
+        out = io.BytesIO()
+        cloud_info.core.write_output(self.opts, bdiis, out=out)
+        output = out.getvalue().decode('utf-8')
+        self.assertIn('GLUE2GroupID=cloud', output)
+        self.assertIn('objectClass: GLUE2StorageService\n', output)
+        self.assertNotIn('objectClass: GLUE2ComputingService\n', output)
+        self.assertEqual(['compute'], bdiis[0].collector.skipped_sections)
+
+        bdiis = self._get_bdiis(images_delay=0)
+        out = io.BytesIO()
+        cloud_info.core.write_output(self.opts, bdiis, out=out)
+        self.assertIn(b'objectClass: GLUE2ComputingService\n',
+                      out.getvalue())
+        self.assertEqual([], bdiis[0].collector.skipped_sections)
+
+
+class SnapshotCollectorTest(BaseTest):
+    def setUp(self):
+        super(SnapshotCollectorTest, self).setUp()
+        self.tmpdir = tempfile.mkdtemp()
+        self.opts.snapshot_file = os.path.join(self.tmpdir, 'snapshot.json')
+        self.snapshot = cloud_info.snapshot.Snapshot(
+            self.opts.snapshot_file)
+        self.info = {'get_site_info': DATA.site_info}
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_collector_from_info(self):
+        collector = cloud_info.core.Collector(self.opts, info=self.info)
+        self.assertIsNone(collector.static_provider)
+        self.assertIsNone(collector.dynamic_provider)
+        self.assertEqual(DATA.site_info, collector.get_info('get_site_info'))
+        for m in cloud_info.core.SUPPORTED_MIDDLEWARE.values():
+            self.assertFalse(m.called)
+
+    def test_no_snapshot(self):
+        self.opts.snapshot_file = None
+        collector = cloud_info.core.get_collector(self.opts)
+        self.assertIsNotNone(collector.static_provider)
+        self.assertFalse(os.listdir(self.tmpdir))
+
+    def test_missing_snapshot(self):
+        static = cloud_info.core.SUPPORTED_MIDDLEWARE['static'].return_value
+        static.get_compute_endpoints.return_value = DATA.compute_endpoints
+        collector = cloud_info.core.get_collector(self.opts)
+        self.assertIsNotNone(collector.static_provider)
+        timestamp, info = self.snapshot.load()
+        self.assertEqual(sorted(['get_site_info', 'get_compute_endpoints',
+                                 'get_storage_endpoints', 'get_images',
+                                 'get_templates']), sorted(info))
+
+    @mock.patch.object(cloud_info.snapshot.Snapshot,
+                       'refresh_in_background')
+    def test_fresh_snapshot(self, m_refresh):
+        self.snapshot.save(self.info)
+        collector = cloud_info.core.get_collector(self.opts)
+        self.assertIsNone(collector.static_provider)
+        self.assertEqual(self.info, collector.info)
+        self.assertFalse(m_refresh.called)
+
+    @mock.patch.object(cloud_info.snapshot.Snapshot,
+                       'refresh_in_background')
+    def test_stale_snapshot(self, m_refresh):
+        self.snapshot.save(self.info, timestamp=time.time() - 600)
+        collector = cloud_info.core.get_collector(self.opts, argv=['--foo'])
+        self.assertIsNone(collector.static_provider)
+        self.assertEqual(self.info, collector.info)
+        m_refresh.assert_called_once_with(['--foo'])
+
+    @mock.patch.object(cloud_info.snapshot.Snapshot,
+                       'refresh_in_background')
+    def test_expired_snapshot(self, m_refresh):
+        self.snapshot.save(self.info, timestamp=time.time() - 7200)
+        collector = cloud_info.core.get_collector(self.opts)
+        self.assertIsNotNone(collector.static_provider)
+        self.assertFalse(m_refresh.called)
+        timestamp, info = self.snapshot.load()
+        self.assertAlmostEqual(time.time(), timestamp, delta=60)
+
+    def test_expired_snapshot_backend_down(self):
+        self.snapshot.save(self.info, timestamp=time.time() - 7200)
+        provider = cloud_info.core.SUPPORTED_MIDDLEWARE['foo middleware']
+        provider.side_effect = exceptions.BackendUnavailable(
+            backend='foo middleware', seconds=300)
+        with mock.patch.object(cloud_info.core.logger, 'exception'):
+            collector = cloud_info.core.get_collector(self.opts)
+        # The old information is better than nothing
+        self.assertIsNone(collector.static_provider)
+        self.assertEqual(self.info, collector.info)
+
+        os.unlink(self.opts.snapshot_file)
+        self.assertRaises(exceptions.BackendUnavailable,
+                          cloud_info.core.get_collector, self.opts)
+
+
 class CloudBDIITest(BaseTest):
     @mock.patch.object(cloud_info.core.BaseBDII, '_format_template')
     @mock.patch.object(cloud_info.core.CloudBDII, '_get_info_from_providers')
@@ -152,6 +901,43 @@ class CloudBDIITest(BaseTest):
                                   mock.call("clouddomain",
                                             DATA.site_info_full)])
 
+    @mock.patch.object(cloud_info.core.CloudBDII, '_get_info_from_providers')
+    def test_iter_objects(self, m_get_info):
+        m_get_info.return_value = DATA.site_info
+        bdii = cloud_info.core.CloudBDII(self.opts)
+        self.assertEqual([{'dn': 'o=glue',
+                           'objectClass': 'organization',
+                           'o': 'glue'},
+                          {'dn': 'GLUE2GroupID=cloud,o=glue',
+                           'objectClass': 'GLUE2Group',
+                           'GLUE2GroupID': 'cloud'}],
+                         list(bdii.iter_objects()))
+
+    @mock.patch.object(cloud_info.core.CloudBDII, '_get_info_from_providers')
+    def test_iter_objects_full(self, m_get_info):
+        self.opts.full_bdii_ldif = True
+        self.opts.template_extension = 'ldif'
+        m_get_info.return_value = DATA.site_info_full
+        bdii = cloud_info.core.CloudBDII(self.opts)
+        bdii.load_templates()
+        entries = cloud_info.ldif.parse(bdii.render())
+
+        out = io.StringIO()
+        cloud_info.core.write_json([bdii], out)
+        objects = [json.loads(line, object_pairs_hook=collections.OrderedDict)
+                   for line in out.getvalue().splitlines()]
+        self.assertEqual(16, len(objects))
+        self.assertEqual(list(entries), [obj['dn'] for obj in objects])
+        for obj in objects:
+            attrs = []
+            for attr, value in obj.items():
+                if attr == 'dn':
+                    continue
+                if not isinstance(value, list):
+                    value = [value]
+                attrs.extend((attr, u' %s' % v) for v in value)
+            self.assertEqual(entries[obj['dn']], attrs)
+
 
 class StorageBDIITEst(BaseTest):
     @mock.patch.object(cloud_info.core.BaseBDII, '_format_template')
@@ -187,6 +973,40 @@ class StorageBDIITEst(BaseTest):
         bdii = cloud_info.core.StorageBDII(self.opts)
         self.assertEqual('', bdii.render())
 
+    @mock.patch.object(cloud_info.core.StorageBDII, '_get_info_from_providers')
+    def test_iter_objects(self, m_get_info):
+        m_get_info.side_effect = (
+            DATA.storage_endpoints,
+            DATA.site_info
+        )
+        bdii = cloud_info.core.StorageBDII(self.opts)
+        objects = list(bdii.iter_objects())
+        service_dn = ('GLUE2ServiceID=%s_cloud.storage,GLUE2GroupID=cloud,'
+                      'o=glue' %
+                      DATA.storage_endpoints['storage_service_name'])
+        self.assertEqual(
+            [service_dn, 'GLUE2ManagerID='] + ['GLUE2EndpointID='] * 2 +
+            ['GLUE2StorageServiceCapacityID='],
+            [objects[0]['dn']] + [o['dn'].partition('=')[0] + '='
+                                  for o in objects[1:]])
+        for obj in objects[1:]:
+            self.assertTrue(obj['dn'].endswith(',' + service_dn))
+        self.assertEqual(['GLUE2Entity', 'GLUE2Service',
+                          'GLUE2StorageService'], objects[0]['objectClass'])
+        self.assertEqual(['cloud.data.upload'],
+                         objects[0]['GLUE2ServiceCapability'])
+        self.assertEqual(
+            0, objects[-1]['GLUE2StorageServiceCapacityTotalSize'])
+
+    @mock.patch.object(cloud_info.core.StorageBDII, '_get_info_from_providers')
+    def test_iter_objects_empty(self, m_get_info):
+        m_get_info.side_effect = (
+            {},
+            DATA.site_info
+        )
+        bdii = cloud_info.core.StorageBDII(self.opts)
+        self.assertEqual([], list(bdii.iter_objects()))
+
 
 class ComputeBDIITest(BaseTest):
     @mock.patch.object(cloud_info.core.BaseBDII, '_format_template')
@@ -235,3 +1055,206 @@ class ComputeBDIITest(BaseTest):
         )
         bdii = cloud_info.core.ComputeBDII(self.opts)
         self.assertEqual('', bdii.render())
+
+    def _get_collector(self):
+        templates = DATA.compute_templates
+        for template_id, template in templates.items():
+            template['template_id'] = template_id
+            template['template_disk'] = None
+        images = DATA.compute_images
+        for image_id, image in images.items():
+            image['image_id'] = image_id
+            image['image_description'] = None
+
+        collector = cloud_info.core.Collector(self.opts)
+        static = collector.static_provider
+        static.get_compute_endpoints.return_value = DATA.compute_endpoints
+        static.get_site_info.return_value = DATA.site_info
+        static.get_templates.return_value = templates
+        static.get_images.return_value = {}
+        dynamic = collector.dynamic_provider
+        dynamic.get_compute_endpoints.return_value = {}
+        dynamic.get_site_info.return_value = {}
+        dynamic.get_templates.return_value = {}
+        dynamic.iter_templates.side_effect = lambda: iter([])
+        dynamic.get_images.return_value = images
+        dynamic.iter_images.side_effect = lambda: iter(images.items())
+        return collector
+
+    def test_render_stream(self):
+        self.opts.template_extension = 'ldif'
+        bdii = cloud_info.core.ComputeBDII(self.opts,
+                                           collector=self._get_collector())
+        bdii.load_templates()
+        expected = bdii.render()
+
+        bdii = cloud_info.core.ComputeBDII(self.opts,
+                                           collector=self._get_collector())
+        bdii.load_templates()
+        out = io.StringIO()
+        bdii.render_stream(out)
+        self.assertEqual(expected, out.getvalue())
+        self.assertIn('GLUE2ApplicationEnvironmentAppName: Foo Image',
+                      expected)
+        self.assertNotIn('get_images', bdii.collector.info)
+
+    def test_prefetch(self):
+        collector = self._get_collector()
+        bdii = cloud_info.core.ComputeBDII(self.opts, collector=collector)
+        cloud_info.core.prefetch_sections([bdii])
+        self.assertIn('get_images', collector.info)
+
+        # Without endpoints, the entities are not collected at all
+        collector = self._get_collector()
+        collector.static_provider.get_compute_endpoints.return_value = {}
+        collector.dynamic_provider.reset_mock()
+        bdii = cloud_info.core.ComputeBDII(self.opts, collector=collector)
+        cloud_info.core.prefetch_sections([bdii])
+        self.assertNotIn('get_images', collector.info)
+        self.assertFalse(collector.dynamic_provider.get_templates.called)
+        self.assertFalse(collector.dynamic_provider.get_images.called)
+
+    def _render_native(self, collector, width=0, stream=False):
+        self.opts.ldif_writer = 'native'
+        self.opts.ldif_fold_width = width
+        bdii = cloud_info.core.ComputeBDII(self.opts, collector=collector)
+        if not stream:
+            return bdii.render()
+        out = io.StringIO()
+        bdii.render_stream(out)
+        return out.getvalue()
+
+    def test_render_native(self):
+        self.opts.template_extension = 'ldif'
+        bdii = cloud_info.core.ComputeBDII(self.opts,
+                                           collector=self._get_collector())
+        bdii.load_templates()
+        expected = bdii.render()
+
+        self.assertEqual(expected,
+                         self._render_native(self._get_collector()))
+        self.assertEqual(expected,
+                         self._render_native(self._get_collector(),
+                                             stream=True))
+
+    def test_render_native_processes(self):
+        expected = self._render_native(self._get_collector())
+        self.opts.render_processes = 2
+        self.assertEqual(expected,
+                         self._render_native(self._get_collector()))
+        self.assertEqual(expected,
+                         self._render_native(self._get_collector(),
+                                             stream=True))
+
+    def test_render_native_encoding(self):
+        collector = self._get_collector()
+        images = collector.dynamic_provider.get_images.return_value
+        images['os_tpl#foobarid']['image_name'] = u'Caf\xe9 Image'
+        output = self._render_native(collector, width=40)
+        entries = cloud_info.ldif.parse(output)
+        self.assertTrue(entries)
+        for line in output.splitlines():
+            self.assertLessEqual(len(line), 40)
+
+        image = [attrs for dn, attrs in entries.items()
+                 if dn.startswith('GLUE2ApplicationEnvironmentID=os_tpl')]
+        name = dict(image[0])['GLUE2ApplicationEnvironmentAppName']
+        self.assertTrue(name.startswith(': '))
+        self.assertEqual(u'Caf\xe9 Image',
+                         base64.b64decode(name[2:]).decode('utf-8'))
+
+    def test_iter_objects(self):
+        self.opts.template_extension = 'ldif'
+        bdii = cloud_info.core.ComputeBDII(self.opts,
+                                           collector=self._get_collector())
+        bdii.load_templates()
+        entries = cloud_info.ldif.parse(bdii.render())
+
+        bdii = cloud_info.core.ComputeBDII(self.opts,
+                                           collector=self._get_collector())
+        objects = list(bdii.iter_objects())
+        self.assertEqual(list(entries), [o['dn'] for o in objects])
+        self.assertNotIn('get_images', bdii.collector.info)
+
+        image = objects[-1]
+        self.assertEqual(['GLUE2Entity', 'GLUE2ApplicationEnvironment'],
+                         image['objectClass'])
+        self.assertEqual('Foo Image',
+                         image['GLUE2ApplicationEnvironmentAppName'])
+        self.assertEqual(1.0, image['GLUE2ApplicationEnvironmentAppVersion'])
+        # The values are the same as in the LDIF, but keep their types
+        for obj in objects:
+            for attr, value in entries[obj['dn']]:
+                value = value.strip()
+                obj_value = obj[attr]
+                if isinstance(obj_value, list) and attr == 'objectClass':
+                    self.assertIn(value, obj_value)
+                else:
+                    self.assertEqual(value, six.text_type(obj_value))
+
+    def test_render_layered(self):
+        self.opts.template_extension = 'ldif'
+        collector = self._get_collector()
+        bdii = cloud_info.core.ComputeBDII(self.opts, collector=collector)
+        bdii.load_templates()
+        output = bdii.render()
+        self.assertIn('GLUE2ApplicationEnvironmentAppName: Foo Image',
+                      output)
+
+        # The static info is not copied into the entities
+        for method in ('get_compute_endpoints', 'get_templates',
+                       'get_images'):
+            info = collector.info[method]
+            entities = info.get('endpoints', info)
+            self.assertTrue(entities)
+            for entity in entities.values():
+                self.assertNotIn('suffix', entity)
+                self.assertNotIn('site_name', entity)
+
+        # But the entities see it, and it takes precedence as when it was
+        # copied into them
+        info = bdii._get_compute_info()
+        image_id, image = next(iter(info['images'].items()))
+        self.assertEqual(DATA.site_info['site_name'], image['site_name'])
+        collector.info['get_images'][image_id]['site_name'] = 'foo'
+        self.assertEqual(DATA.site_info['site_name'], image['site_name'])
+
+        # Writes do not modify the entities nor the static info
+        image['foo'] = 'bar'
+        image['site_name'] = 'bar'
+        self.assertEqual('bar', image['foo'])
+        self.assertEqual('bar', image['site_name'])
+        self.assertNotIn('foo', collector.info['get_images'][image_id])
+        self.assertNotIn('foo', info['static_compute_info'])
+        self.assertEqual(DATA.site_info['site_name'],
+                         info['static_compute_info']['site_name'])
+
+    def test_entity_metrics(self):
+        self.opts.template_extension = 'ldif'
+        for stream in (False, True):
+            bdii = cloud_info.core.ComputeBDII(
+                self.opts, collector=self._get_collector())
+            bdii.collector.metrics = mock.Mock()
+            bdii.load_templates()
+            if stream:
+                bdii.render_stream(io.StringIO())
+            else:
+                bdii.render()
+            m_set = bdii.collector.metrics.set
+            m_set.assert_any_call(
+                'entities', len(DATA.compute_endpoints['endpoints']),
+                section='compute', type='endpoints')
+            m_set.assert_any_call(
+                'entities', len(DATA.compute_templates),
+                section='compute', type='templates')
+            m_set.assert_any_call(
+                'entities', len(DATA.compute_images),
+                section='compute', type='images')
+
+    @mock.patch.object(cloud_info.core.ComputeBDII, '_get_info_from_providers')
+    def test_render_stream_empty(self, m_get_info):
+        m_get_info.return_value = {}
+        bdii = cloud_info.core.ComputeBDII(self.opts)
+        out = io.StringIO()
+        bdii.render_stream(out)
+        self.assertEqual('', out.getvalue())
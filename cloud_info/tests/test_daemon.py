@@ -0,0 +1,133 @@
+import io
+import os.path
+import shutil
+import stat
+import tempfile
+import unittest
+
+import mock
+
+from cloud_info import client
+from cloud_info import daemon
+
+
+class FakeOpts(object):
+    full_bdii_ldif = False
+    parallel_sections = False
+    daemon_interval = 300
+    daemon_socket_mode = 0o600
+    metrics_file = None
+    format = 'ldif'
+    deadline = None
+    backend_retries = 0
+    backend_retry_delay = 0.5
+    circuit_breaker_threshold = 0
+    circuit_breaker_reset = 300
+    circuit_breaker_file = None
+
+
+class DaemonTest(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.opts = FakeOpts()
+        self.opts.daemon_socket = os.path.join(self.tmpdir, 'daemon.sock')
+        self.daemon = daemon.Daemon(self.opts)
+
+    def tearDown(self):
+        self.daemon.shutdown()
+        shutil.rmtree(self.tmpdir)
+
+    @mock.patch.object(daemon.core, 'Collector')
+    def test_load(self, m_collector):
+        self.daemon.load()
+        self.assertIs(m_collector.return_value, self.daemon.collector)
+        self.assertEqual(3, len(self.daemon.bdiis))
+        for bdii in self.daemon.bdiis:
+            self.assertIs(m_collector.return_value, bdii.collector)
+
+    @mock.patch.object(daemon.core, 'render_sections')
+    @mock.patch.object(daemon.core, 'Collector')
+    def test_refresh(self, m_collector, m_render):
+        m_render.return_value = [u'foo', u'baré']
+        self.assertTrue(self.daemon.refresh())
+        self.assertEqual(u'foo\nbaré\n'.encode('utf-8'),
+                         self.daemon.output)
+        m_collector.assert_called_once_with(self.opts)
+
+        # Providers are kept between refreshes, only the info is reset
+        self.assertTrue(self.daemon.refresh())
+        m_collector.assert_called_once_with(self.opts)
+        m_collector.return_value.reset.assert_called_once_with()
+
+        # Unless we are reloading
+        self.daemon.reload()
+        self.assertTrue(self.daemon.refresh())
+        self.assertEqual(2, m_collector.call_count)
+
+    @mock.patch.object(daemon.core, 'render_sections')
+    @mock.patch.object(daemon.core, 'Collector')
+    def test_refresh_reload_error(self, m_collector, m_render):
+        m_render.return_value = [u'foo']
+        self.assertTrue(self.daemon.refresh())
+        collector = self.daemon.collector
+
+        # A failed reload is retried on the next refresh
+        self.daemon.reload()
+        m_collector.side_effect = Exception()
+        self.assertFalse(self.daemon.refresh())
+        self.assertIs(collector, self.daemon.collector)
+        m_collector.side_effect = None
+        self.assertTrue(self.daemon.refresh())
+        self.assertEqual(3, m_collector.call_count)
+        self.assertFalse(self.daemon._reload)
+
+    @mock.patch.object(daemon.core, 'write_json')
+    @mock.patch.object(daemon.core, 'Collector')
+    def test_refresh_json(self, m_collector, m_write_json):
+        self.opts.format = 'json'
+        m_write_json.side_effect = lambda bdiis, out: out.write(u'{}\n')
+        self.assertTrue(self.daemon.refresh())
+        self.assertEqual(b'{}\n', self.daemon.output)
+        m_write_json.assert_called_once_with(self.daemon.bdiis, mock.ANY)
+
+    @mock.patch.object(daemon.core, 'render_sections')
+    @mock.patch.object(daemon.core, 'Collector')
+    def test_refresh_error(self, m_collector, m_render):
+        m_render.return_value = [u'foo']
+        self.assertTrue(self.daemon.refresh())
+
+        m_render.side_effect = Exception()
+        self.assertFalse(self.daemon.refresh())
+        self.assertEqual(b'foo\n', self.daemon.output)
+        m_collector.return_value.report_metrics.assert_called_with(
+            success=False)
+
+    def test_serve(self):
+        self.daemon.output = b'foo\nbar\n'
+        self.daemon.serve()
+
+        out = io.BytesIO()
+        self.assertEqual(8, client.fetch(self.opts.daemon_socket, out,
+                                         timeout=5))
+        self.assertEqual(b'foo\nbar\n', out.getvalue())
+        self.assertEqual(0o600, stat.S_IMODE(
+            os.stat(self.opts.daemon_socket).st_mode))
+
+        self.daemon.shutdown()
+        self.assertFalse(os.path.exists(self.opts.daemon_socket))
+
+    def test_serve_no_output(self):
+        self.daemon.serve()
+
+        out = io.BytesIO()
+        self.assertEqual(0, client.fetch(self.opts.daemon_socket, out,
+                                         timeout=5))
+
+    def test_stop(self):
+        with mock.patch.object(self.daemon, 'refresh') as m_refresh:
+            m_refresh.side_effect = self.daemon.stop
+            with mock.patch('signal.signal'):
+                self.daemon.run()
+            m_refresh.assert_called_once_with()
+        self.assertIsNone(self.daemon.server)
+        self.assertFalse(os.path.exists(self.opts.daemon_socket))
@@ -0,0 +1,124 @@
+import os.path
+import shutil
+import tempfile
+import unittest
+
+import mock
+
+from cloud_info import fleet
+
+ROOT = os.path.join(os.path.dirname(__file__), '..', '..')
+
+MANIFEST = '''
+defaults: [--middleware, static]
+sites:
+    SITE-B:
+        output: %(tmpdir)s/site-b.ldif
+        options: [--yaml-file, site-b.yaml]
+    SITE-A:
+        output: %(tmpdir)s/site-a.ldif
+'''
+
+
+class FleetTest(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmpdir)
+
+    def _write(self, name, data):
+        path = os.path.join(self.tmpdir, name)
+        with open(path, 'w') as f:
+            f.write(data % {'tmpdir': self.tmpdir})
+        return path
+
+    def _read(self, name):
+        with open(os.path.join(self.tmpdir, name)) as f:
+            return f.read()
+
+    def test_load_manifest(self):
+        sites = fleet.load_manifest(self._write('fleet.yaml', MANIFEST))
+        self.assertEqual(
+            [fleet.Site('SITE-A', ['--middleware', 'static'],
+                        os.path.join(self.tmpdir, 'site-a.ldif')),
+             fleet.Site('SITE-B', ['--middleware', 'static',
+                                   '--yaml-file', 'site-b.yaml'],
+                        os.path.join(self.tmpdir, 'site-b.ldif'))],
+            sites)
+
+    def test_load_manifest_invalid(self):
+        for manifest in ('foo', 'sites: [foo]',
+                         'sites: {foo: {options: []}}',
+                         'sites: {foo: {output: a, options: {b: c}}}',
+                         'sites: {foo: {output: a}}\ndefaults: bar',
+                         'sites: {foo: [}'):
+            path = self._write('fleet.yaml', manifest)
+            self.assertRaises(fleet.ManifestError, fleet.load_manifest,
+                              path)
+
+    def _get_site(self, name, yaml_file):
+        site_cfg = self._write('%s.cfg' % name, 'SITE_NAME=%s\n' % name)
+        return fleet.Site(name, [
+            '--yaml-file', yaml_file,
+            '--glite-site-info-static', site_cfg,
+            '--template-dir', os.path.join(ROOT, 'etc', 'templates'),
+            '--block-cache-size', '0',
+        ], os.path.join(self.tmpdir, '%s.ldif' % name))
+
+    def test_render_sites(self):
+        with open(os.path.join(ROOT, 'etc', 'sample.static.yaml')) as f:
+            sample = f.read()
+        # The static templates and images lack attributes needed by the
+        # compute template (e.g. the disk or the description)
+        compute = sample[:sample.index('    templates:')]
+        storage = sample[sample.index('storage:'):]
+        yaml_file = self._write('static.yaml', compute + storage)
+        sites = [self._get_site('SITE-A', yaml_file),
+                 self._get_site('SITE-B', '/nonexistent.yaml')]
+        with open(sites[1].output, 'w') as f:
+            f.write('previous output')
+
+        for processes in (1, 2):
+            results = dict((name, error) for name, error, duration
+                           in fleet.render_sites(sites, processes))
+            self.assertEqual(['SITE-A', 'SITE-B'], sorted(results))
+            self.assertIsNone(results['SITE-A'])
+            self.assertIn('nonexistent.yaml', results['SITE-B'])
+
+            self.assertIn('GLUE2ServiceAdminDomainForeignKey: SITE-A',
+                          self._read('SITE-A.ldif'))
+            # Failing sites keep their previous output
+            self.assertEqual('previous output', self._read('SITE-B.ldif'))
+            os.unlink(sites[0].output)
+
+        # No temporary files are left behind
+        self.assertEqual(['SITE-A.cfg', 'SITE-B.cfg', 'SITE-B.ldif',
+                          'static.yaml'],
+                         sorted(os.listdir(self.tmpdir)))
+
+    def test_render_site_invalid_options(self):
+        site = fleet.Site('foo', ['--foo'], os.path.join(self.tmpdir, 'foo'))
+        with mock.patch('sys.stderr'):
+            name, error, duration = fleet.render_site(site)
+        self.assertEqual('foo', name)
+        self.assertIn('SystemExit', error)
+        self.assertFalse(os.path.exists(site.output))
+
+    @mock.patch.object(fleet, 'render_sites')
+    def test_main(self, m_render):
+        path = self._write('fleet.yaml', MANIFEST)
+        m_render.return_value = [('SITE-A', None, 1.0),
+                                 ('SITE-B', None, 1.0)]
+        self.assertEqual(0, fleet.main([path, '--processes', '4']))
+        sites = m_render.call_args[0][0]
+        self.assertEqual(['SITE-A', 'SITE-B'], [s.name for s in sites])
+        self.assertEqual(4, m_render.call_args[0][1])
+
+        m_render.return_value = [('SITE-B', 'Traceback', 1.0)]
+        with mock.patch('sys.stderr'):
+            self.assertEqual(1, fleet.main([path, '--site', 'SITE-B']))
+        sites = m_render.call_args[0][0]
+        self.assertEqual(['SITE-B'], [s.name for s in sites])
+
+        with mock.patch('sys.stderr'):
+            self.assertEqual(2, fleet.main([path, '--site', 'SITE-C']))
+            self.assertEqual(2, fleet.main([path + '.missing']))
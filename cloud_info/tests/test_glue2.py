@@ -0,0 +1,124 @@
+import collections
+import unittest
+
+import mock
+
+from cloud_info import glue2
+from cloud_info import ldif
+from cloud_info import utils
+
+
+class EntryFormatTest(unittest.TestCase):
+    def setUp(self):
+        self.format = glue2._EntryFormat([
+            ('objectClass', 'GLUE2Entity'),
+            (None, '#GLUE2EndpointSemantics:'),
+            ('GLUE2EntityName', None),
+        ])
+
+    def test_format(self):
+        self.assertEqual(
+            [u'dn: foo\nobjectClass: GLUE2Entity\n'
+             u'#GLUE2EndpointSemantics:\nGLUE2EntityName: 100%\n\n'],
+            list(self.format.format(('foo', '100%'))))
+
+    def test_format_unsafe(self):
+        for value in (u'caf\xe9', u'foo\nbar: baz', u' foo', u':foo',
+                      u'<foo'):
+            text = u''.join(self.format.format(('foo', value)))
+            self.assertEqual(
+                [('objectClass', u' GLUE2Entity'),
+                 ('GLUE2EntityName', u': ' + ldif.format_attribute(
+                     'x', value)[len(u'x:: '):])],
+                ldif.parse(text)['foo'])
+
+    def test_format_many(self):
+        entries = [('foo%d' % i, 'bar') for i in range(5)]
+        entries[3] = ('foo3', u'caf\xe9')
+        batches = list(self.format.format_many(entries, batch_size=2))
+        self.assertEqual(3, len(batches))
+        text = u''.join(batches)
+        expected = u''.join(u''.join(self.format.format(e))
+                            for e in entries)
+        self.assertEqual(expected, text)
+        self.assertEqual(5, len(ldif.parse(text)))
+        self.assertIn(u'GLUE2EntityName:: ', batches[1])
+        self.assertNotIn(u'GLUE2EntityName:: ', batches[0])
+
+    def test_format_folded(self):
+        text = u''.join(self.format.format(('foo', 'x' * 50), width=20))
+        for line in text.splitlines():
+            self.assertLessEqual(len(line), 20)
+        self.assertEqual([('objectClass', u' GLUE2Entity'),
+                          ('GLUE2EntityName', u' ' + 'x' * 50)],
+                         ldif.parse(text)['foo'])
+
+
+class ComputeWriterTest(unittest.TestCase):
+    def setUp(self):
+        static = {
+            'suffix': 'o=glue',
+            'site_name': 'SITE',
+            'compute_service_name': 'cloud.example.org',
+            'compute_service_production_level': 'production',
+            'compute_capabilities': 'cloud.managementSystem',
+            'compute_hypervisor': 'KVM',
+            'compute_hypervisor_version': '1.0',
+            'compute_total_cores': 100,
+            'compute_total_ram': 1000,
+            'image_os_family': 'linux',
+            'image_os_name': 'Ubuntu',
+            'image_os_version': '18.04',
+            'image_platform': 'amd64',
+        }
+        endpoint = dict(compute_endpoint_url='https://cloud.example.org',
+                        compute_api_type='OCCI',
+                        compute_api_version='1.1',
+                        compute_api_authn_method='X509-VOMS',
+                        compute_production_level='production',
+                        compute_middleware='OpenStack',
+                        compute_middleware_version='Queens',
+                        compute_middleware_developer='OpenStack',
+                        compute_api_endpoint_technology='REST')
+        templates = dict(
+            ('tpl%02d' % i, {'template_id': 'tpl%02d' % i,
+                             'template_memory': 1024 * i,
+                             'template_platform': 'amd64',
+                             'template_cpu': i,
+                             'template_disk': None})
+            for i in range(7))
+        images = dict(
+            ('img%02d' % i, {'image_id': 'img%02d' % i,
+                             'image_name': u'Caf\xe9 %d' % i,
+                             'image_version': '1.0',
+                             'image_marketplace_id': 'http://example.org',
+                             'image_description': None})
+            for i in range(11))
+
+        def layer(entities):
+            return collections.OrderedDict(
+                (key, utils.layer(entities[key], static))
+                for key in sorted(entities))
+
+        self.info = {
+            'static_compute_info': static,
+            'endpoints': {'endpoints': layer({'foo': endpoint})},
+            'templates': layer(templates),
+            'images': layer(images),
+        }
+
+    def test_render_processes(self):
+        expected = glue2.ComputeWriter(self.info, width=40).render()
+        self.assertEqual(7 + 11 + 3, len(ldif.parse(expected)))
+        writer = glue2.ComputeWriter(self.info, width=40, processes=2,
+                                     shard_size=3)
+        self.assertEqual(expected, writer.render())
+
+    @mock.patch('multiprocessing.Pool')
+    def test_render_processes_daemonic(self, m_pool):
+        expected = glue2.ComputeWriter(self.info).render()
+        writer = glue2.ComputeWriter(self.info, processes=2)
+        with mock.patch('multiprocessing.current_process') as m_process:
+            m_process.return_value.daemon = True
+            self.assertEqual(expected, writer.render())
+        self.assertFalse(m_pool.called)
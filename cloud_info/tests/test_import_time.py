@@ -0,0 +1,60 @@
+import os.path
+import subprocess
+import sys
+import unittest
+
+# Maximum cumulative time (in microseconds) for importing cloud_info.core.
+# It is well above the actual figure, so that it only catches regressions
+# like importing heavy libraries at module level.
+IMPORT_TIME_BUDGET = 300000
+
+HEAVY_MODULES = (
+    'defusedxml',
+    'mako',
+    'novaclient',
+    'yaml',
+    'xmlrpclib',
+    'xmlrpc',
+)
+
+
+def _import_times(module):
+    '''Get the cumulative import time of each module using -X importtime.'''
+    cmd = [sys.executable, '-X', 'importtime', '-c', 'import %s' % module]
+    cwd = os.path.join(os.path.dirname(__file__), '..', '..')
+    proc = subprocess.Popen(cmd, cwd=cwd, stdout=subprocess.PIPE,
+                            stderr=subprocess.PIPE)
+    out, err = proc.communicate()
+    times = {}
+    for line in err.decode('utf-8').splitlines():
+        if not line.startswith('import time:'):
+            continue
+        fields = line[len('import time:'):].split('|')
+        try:
+            cumulative = int(fields[1])
+        except ValueError:
+            # Header line
+            continue
+        times[fields[2].strip()] = cumulative
+    return times
+
+
+@unittest.skipIf(sys.version_info < (3, 7), '-X importtime needs Python 3.7')
+class ImportTimeTest(unittest.TestCase):
+    def test_no_heavy_imports(self):
+        times = _import_times('cloud_info.core')
+        self.assertIn('cloud_info.core', times)
+        for module in times:
+            self.assertNotIn(module.split('.')[0], HEAVY_MODULES)
+
+    def test_import_time_budget(self):
+        # Take the best of several runs to avoid noise
+        best = min(_import_times('cloud_info.core')['cloud_info.core']
+                   for i in range(3))
+        self.assertLess(best, IMPORT_TIME_BUDGET)
+
+    def test_client_import(self):
+        times = _import_times('cloud_info.client')
+        for module in times:
+            self.assertFalse(module.startswith('cloud_info.core'))
+            self.assertNotIn(module.split('.')[0], HEAVY_MODULES)
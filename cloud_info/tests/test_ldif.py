@@ -0,0 +1,180 @@
+import os.path
+import shutil
+import tempfile
+import unittest
+
+from cloud_info import ldif
+
+OLD = """dn: o=glue
+objectClass: organization
+o: glue
+
+dn: GLUE2GroupID=cloud,o=glue
+objectClass: GLUE2Group
+GLUE2GroupID: cloud
+
+dn: GLUE2ServiceID=foo,GLUE2GroupID=cloud,o=glue
+objectClass: GLUE2Entity
+objectClass: GLUE2Service
+GLUE2ServiceType: IaaS
+GLUE2ServiceCapability: foo
+#GLUE2EndpointSemantics:
+
+dn: GLUE2ResourceID=small,GLUE2ServiceID=foo,GLUE2GroupID=cloud,o=glue
+objectClass: GLUE2Resource
+GLUE2ExecutionEnvironmentMainMemorySize: 1024
+"""
+
+NEW = """dn: o=glue
+objectClass: organization
+o: glue
+
+dn: GLUE2GroupID=cloud,o=glue
+objectClass: GLUE2Group
+GLUE2GroupID: cloud
+
+dn: GLUE2ServiceID=foo,GLUE2GroupID=cloud,o=glue
+objectClass: GLUE2Entity
+objectClass: GLUE2Service
+GLUE2ServiceType: IaaS
+GLUE2EntityName: a very long name that has been folded by some
+ one else
+
+dn: GLUE2ResourceID=large,GLUE2ServiceID=foo,GLUE2GroupID=cloud,o=glue
+objectClass: GLUE2Resource
+GLUE2ExecutionEnvironmentMainMemorySize: 4096
+"""
+
+DELTA = """\
+dn: GLUE2ResourceID=large,GLUE2ServiceID=foo,GLUE2GroupID=cloud,o=glue
+changetype: add
+objectClass: GLUE2Resource
+GLUE2ExecutionEnvironmentMainMemorySize: 4096
+
+dn: GLUE2ServiceID=foo,GLUE2GroupID=cloud,o=glue
+changetype: modify
+replace: GLUE2EntityName
+GLUE2EntityName: a very long name that has been folded by someone else
+-
+delete: GLUE2ServiceCapability
+-
+
+dn: GLUE2ResourceID=small,GLUE2ServiceID=foo,GLUE2GroupID=cloud,o=glue
+changetype: delete
+
+"""
+
+
+class LDIFTest(unittest.TestCase):
+    def test_parse(self):
+        entries = ldif.parse(OLD)
+        self.assertEqual(
+            ['o=glue',
+             'GLUE2GroupID=cloud,o=glue',
+             'GLUE2ServiceID=foo,GLUE2GroupID=cloud,o=glue',
+             'GLUE2ResourceID=small,GLUE2ServiceID=foo,'
+             'GLUE2GroupID=cloud,o=glue'],
+            list(entries))
+        self.assertEqual(
+            [('objectClass', ' GLUE2Entity'),
+             ('objectClass', ' GLUE2Service'),
+             ('GLUE2ServiceType', ' IaaS'),
+             ('GLUE2ServiceCapability', ' foo')],
+            entries['GLUE2ServiceID=foo,GLUE2GroupID=cloud,o=glue'])
+
+    def test_parse_base64(self):
+        entries = ldif.parse('dn: o=glue\nfoo:: YmFy\n')
+        self.assertEqual([('foo', ': YmFy')], entries['o=glue'])
+
+    def test_format_attribute(self):
+        self.assertEqual(u'foo: bar', ldif.format_attribute('foo', 'bar'))
+        self.assertEqual(u'foo: 1', ldif.format_attribute('foo', 1))
+        self.assertEqual(u'foo: ', ldif.format_attribute('foo', ''))
+        self.assertEqual(u'foo: a:b <c', ldif.format_attribute('foo',
+                                                               'a:b <c'))
+
+    def test_format_attribute_base64(self):
+        for value in (u'caf\xe9', u' bar', u':bar', u'<bar', u'bar\n',
+                      u'b\rar'):
+            line = ldif.format_attribute('foo', value)
+            self.assertTrue(line.startswith(u'foo:: '), line)
+            self.assertEqual(
+                [('foo', u': ' + line[len(u'foo:: '):])],
+                ldif.parse(u'dn: o=glue\n%s\n' % line)['o=glue'])
+
+    def test_fold(self):
+        line = u'foo: ' + u'x' * 20
+        self.assertEqual(line, ldif.fold(line, 0))
+        self.assertEqual(line, ldif.fold(line, 25))
+        folded = ldif.fold(line, 10)
+        self.assertEqual(u'foo: xxxxx\n xxxxxxxxx\n xxxxxx', folded)
+        self.assertEqual([line], ldif._unfold(folded))
+        self.assertEqual(
+            u'foo: xxxxx\n xxxxxxxxx\n xxxxxx',
+            ldif.format_attribute('foo', u'x' * 20, width=10))
+
+    def test_diff(self):
+        self.assertEqual(DELTA, ldif.diff(ldif.parse(OLD), ldif.parse(NEW)))
+
+    def test_diff_same(self):
+        self.assertEqual('', ldif.diff(ldif.parse(OLD), ldif.parse(OLD)))
+
+    def test_diff_value_order(self):
+        old = ldif.parse('dn: o=glue\nfoo: 1\nfoo: 2\n')
+        new = ldif.parse('dn: o=glue\nfoo: 2\nfoo: 1\n')
+        self.assertEqual('', ldif.diff(old, new))
+
+    def test_diff_all_new(self):
+        delta = ldif.diff({}, ldif.parse(OLD))
+        # Parents are added before their children
+        self.assertEqual(
+            ['o=glue',
+             'GLUE2GroupID=cloud,o=glue',
+             'GLUE2ServiceID=foo,GLUE2GroupID=cloud,o=glue',
+             'GLUE2ResourceID=small,GLUE2ServiceID=foo,'
+             'GLUE2GroupID=cloud,o=glue'],
+            [line[4:] for line in delta.splitlines()
+             if line.startswith('dn: ')])
+
+    def test_diff_all_deleted(self):
+        delta = ldif.diff(ldif.parse(OLD), {})
+        # Children are deleted before their parents
+        self.assertEqual(
+            ['GLUE2ResourceID=small,GLUE2ServiceID=foo,'
+             'GLUE2GroupID=cloud,o=glue',
+             'GLUE2ServiceID=foo,GLUE2GroupID=cloud,o=glue',
+             'GLUE2GroupID=cloud,o=glue',
+             'o=glue'],
+            [line[4:] for line in delta.splitlines()
+             if line.startswith('dn: ')])
+
+
+class DeltaStateTest(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.state = ldif.DeltaState(os.path.join(self.tmpdir, 'state'))
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_delta(self):
+        self.assertEqual(ldif.diff({}, ldif.parse(OLD)),
+                         self.state.delta(OLD))
+        self.state.commit()
+        self.assertEqual(ldif.parse(OLD), self.state.load())
+        self.assertEqual(DELTA, self.state.delta(NEW))
+        self.state.commit()
+        self.assertEqual('', self.state.delta(NEW))
+
+    def test_not_committed(self):
+        self.state.delta(OLD)
+        self.state.commit()
+        self.state.delta(NEW)
+        # e.g. the output could not be written
+        self.assertEqual(ldif.parse(OLD), self.state.load())
+        self.assertEqual(DELTA, self.state.delta(NEW))
+
+    def test_invalid_state(self):
+        with open(self.state.path, 'w') as f:
+            f.write('foo')
+        self.assertEqual({}, self.state.load())
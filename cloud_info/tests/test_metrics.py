@@ -0,0 +1,81 @@
+import os.path
+import shutil
+import tempfile
+import unittest
+
+from cloud_info import metrics
+
+
+class FakeOpts(object):
+    metrics_file = None
+
+
+class MetricsTest(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmpdir, 'cloud_info.prom')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def _read(self):
+        with open(self.path) as f:
+            return f.read()
+
+    def test_get_metrics(self):
+        opts = FakeOpts()
+        self.assertIsInstance(metrics.get_metrics(opts), metrics.NoMetrics)
+        opts.metrics_file = self.path
+        m = metrics.get_metrics(opts)
+        self.assertIsInstance(m, metrics.Metrics)
+        self.assertEqual(self.path, m.path)
+
+    def test_no_metrics(self):
+        m = metrics.NoMetrics()
+        m.start()
+        m.set('foo', 1)
+        m.finish()
+
+    def test_format(self):
+        m = metrics.Metrics(self.path)
+        m.set('entities', 3, section='compute', type='images')
+        m.set('entities', 1, section='compute', type='endpoints')
+        m.set('call_duration_seconds', 0.5,
+              provider='foo "bar"', method='get_images')
+        self.assertEqual(
+            '# HELP cloud_info_provider_call_duration_seconds '
+            'Time spent in each provider method.\n'
+            '# TYPE cloud_info_provider_call_duration_seconds gauge\n'
+            'cloud_info_provider_call_duration_seconds'
+            '{method="get_images",provider="foo \\"bar\\""} 0.5\n'
+            '# HELP cloud_info_provider_entities '
+            'Number of entities emitted in each section.\n'
+            '# TYPE cloud_info_provider_entities gauge\n'
+            'cloud_info_provider_entities'
+            '{section="compute",type="endpoints"} 1.0\n'
+            'cloud_info_provider_entities'
+            '{section="compute",type="images"} 3.0\n',
+            m.format())
+
+    def test_unknown_metric(self):
+        m = metrics.Metrics(self.path)
+        self.assertRaises(ValueError, m.set, 'foo', 1)
+
+    def test_finish(self):
+        m = metrics.Metrics(self.path)
+        m.set('output_bytes', 10)
+        m.finish()
+        content = self._read()
+        self.assertIn('cloud_info_provider_output_bytes 10.0\n', content)
+        self.assertIn('cloud_info_provider_last_run_success 1.0\n', content)
+        self.assertIn('cloud_info_provider_run_duration_seconds ', content)
+        self.assertIn('cloud_info_provider_last_run_timestamp_seconds ',
+                      content)
+        self.assertEqual(['cloud_info.prom'], os.listdir(self.tmpdir))
+
+        # A new run forgets the metrics of the previous one
+        m.start()
+        m.finish(success=False)
+        content = self._read()
+        self.assertNotIn('output_bytes', content)
+        self.assertIn('cloud_info_provider_last_run_success 0.0\n', content)
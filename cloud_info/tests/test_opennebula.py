@@ -1,11 +1,20 @@
 import argparse
+import collections
 import mock
+import socket
+import time
 import unittest
 import xml.etree.ElementTree
 
+import six
+from six.moves import xmlrpc_client  # nosec
+
 from cloud_info import exceptions
 from cloud_info.providers import opennebula
+from cloud_info import resilience
+import cloud_info.utils
 from cloud_info.tests import data
+from cloud_info.tests import utils
 
 FAKES = data.ONE_FAKES
 
@@ -25,6 +34,14 @@ class OpenNebulaBaseProviderOptionsTest(unittest.TestCase):
         self.assertEqual(opts.on_auth, 'foo')
         self.assertEqual(opts.on_rpcxml_endpoint, 'bar')
         self.assertTrue(opts.cloudkeeper_images)
+        self.assertFalse(opts.on_rpcxml_async)
+
+        opts = parser.parse_args(['--on-rpcxml-async',
+                                  '--on-rpcxml-timeout', '30',
+                                  '--on-rpcxml-connections', '2'])
+        self.assertTrue(opts.on_rpcxml_async)
+        self.assertEqual(30, opts.on_rpcxml_timeout)
+        self.assertEqual(2, opts.on_rpcxml_connections)
 
     def test_options(self):
         class Opts(object):
@@ -121,6 +138,48 @@ class OpenNebulaBaseProviderTest(unittest.TestCase):
     def test_get_templates(self):
         self.assertDictEqual({}, self.provider.get_templates())
 
+    def test_api_calls(self):
+        self.provider.get_images()
+        self.assertEqual(1, self.provider.api_calls)
+        self.assertGreater(self.provider.api_received_bytes, 0)
+
+
+class OpenNebulaBaseProviderRetryTest(unittest.TestCase):
+    def setUp(self):
+        provider_class = opennebula.OpenNebulaBaseProvider
+        self.provider = provider_class.__new__(provider_class)
+        self.provider.on_auth = 'oneadmin:opennebula'
+        self.provider.server_proxy = mock.Mock()
+        self.provider.backend = resilience.Backend('opennebula', retries=2)
+        self.m_info = self.provider.server_proxy.one.templatepool.info
+
+        patcher = mock.patch('time.sleep')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_retry(self):
+        # oned is too busy to answer
+        self.m_info.side_effect = [
+            [False, 'Internal error', opennebula.ONE_INTERNAL_ERROR],
+            xmlrpc_client.ProtocolError('foo', 503, 'Unavailable', {}),
+            [True, FAKES.templatepool, 0],
+        ]
+        self.assertEqual([True, FAKES.templatepool, 0],
+                         self.provider._call_pool('one.templatepool.info',
+                                                  -3, -1, -1))
+        self.assertEqual(3, self.m_info.call_count)
+
+    def test_not_transient(self):
+        self.m_info.side_effect = xmlrpc_client.ProtocolError(
+            'foo', 404, 'Not found', {})
+        self.assertRaises(xmlrpc_client.ProtocolError,
+                          self.provider._call_pool, 'one.templatepool.info')
+        self.m_info.return_value = [False, 'Not authorized', 0x0100]
+        self.m_info.side_effect = None
+        self.assertRaises(exceptions.OpenNebulaProviderException,
+                          self.provider._get_one_templates)
+        self.assertEqual(2, self.m_info.call_count)
+
 
 class OpenNebulaProviderTest(OpenNebulaBaseProviderTest):
     def __init__(self, *args, **kwargs):
@@ -223,3 +282,102 @@ class IndigoONProviderTest(OpenNebulaBaseProviderTest):
     def test_get_templates(self):
         self.assertDictEqual(
             self.expected_templates, self.provider.get_templates())
+
+
+@unittest.skipIf(six.PY2, 'asyncio requires Python 3')
+class IndigoONProviderAsyncTest(IndigoONProviderTest):
+    def setUp(self):
+        super(IndigoONProviderAsyncTest, self).setUp()
+
+        self.requests = collections.Counter()
+        self.delay = 0
+
+        def pool(name, xml):
+            def info(auth, *args):
+                self.requests[name] += 1
+                time.sleep(self.delay)
+                return [True, xml, 0]
+            return info
+
+        self.server = utils.XMLRPCServer({
+            'one.templatepool.info': pool('templatepool', FAKES.templatepool),
+            'one.imagepool.info': pool('imagepool', FAKES.imagepool),
+        })
+        self.server.start()
+        self.addCleanup(self.server.stop)
+
+        self.provider.server_proxy = None
+        self.provider.on_rpcxml_endpoint = self.server.uri
+        self.provider.on_rpcxml_async = True
+        self.provider.on_rpcxml_timeout = 5
+        self.provider.on_rpcxml_connections = 2
+        self.provider._async_responses = {}
+
+    def test_concurrent_requests(self):
+        self.delay = 0.2
+        start = time.time()
+        self.provider.get_templates()
+        self.assertEqual({'templatepool': 1, 'imagepool': 1}, self.requests)
+        self.assertLess(time.time() - start, 0.35)
+
+        # The images were fetched with the templates
+        self.assertDictEqual(self.expected_images,
+                             self.provider.get_images())
+        self.assertEqual({'templatepool': 1, 'imagepool': 1}, self.requests)
+        self.assertEqual(2, self.provider.api_calls)
+
+        # Responses are only used once
+        self.provider.get_images()
+        self.assertEqual({'templatepool': 2, 'imagepool': 2}, self.requests)
+
+    def test_timeout(self):
+        self.delay = 0.5
+        self.provider.on_rpcxml_timeout = 0.1
+        self.assertRaises(exceptions.OpenNebulaProviderException,
+                          self.provider.get_images)
+
+    def test_deadline(self):
+        self.delay = 0.5
+        self.provider.deadline = cloud_info.utils.Deadline(0.1)
+        start = time.time()
+        self.assertRaises(exceptions.OpenNebulaProviderException,
+                          self.provider.get_images)
+        self.assertLess(time.time() - start, 0.4)
+
+
+class IndigoONProviderTimeoutTest(IndigoONProviderAsyncTest):
+    '''The synchronous transport, with the timeouts of the requests.'''
+    def setUp(self):
+        super(IndigoONProviderTimeoutTest, self).setUp()
+        self.provider.on_rpcxml_async = False
+        self.provider.server_proxy = self.provider._get_server_proxy()
+
+    def test_concurrent_requests(self):
+        self.assertDictEqual(self.expected_images,
+                             self.provider.get_images())
+        self.assertEqual({'imagepool': 1}, self.requests)
+
+    def test_timeout(self):
+        self.delay = 0.5
+        self.provider.on_rpcxml_timeout = 0.1
+        self.assertRaises(socket.timeout, self.provider.get_images)
+
+    def test_deadline(self):
+        self.delay = 0.5
+        self.provider.deadline = cloud_info.utils.Deadline(0.1)
+        start = time.time()
+        self.assertRaises(socket.timeout, self.provider.get_images)
+        self.assertLess(time.time() - start, 0.4)
+
+    def test_threads(self):
+        # Every thread has its own ServerProxy, so they are not serialized
+        import multiprocessing.pool
+
+        self.delay = 0.3
+        pool = multiprocessing.pool.ThreadPool(2)
+        self.addCleanup(pool.close)
+        start = time.time()
+        results = pool.map(lambda i: self.provider.get_images(), range(2))
+        self.assertLess(time.time() - start, 0.5)
+        self.assertEqual([self.expected_images] * 2, results)
+        self.assertEqual({'imagepool': 2}, self.requests)
@@ -1,11 +1,18 @@
 import argparse
+import os.path
+import shutil
+import socket
 import sys
+import tempfile
+import time
 import unittest
 
 import mock
 
 from cloud_info import exceptions
+import cloud_info.utils
 from cloud_info.providers import openstack as os_provider
+from cloud_info import resilience
 from cloud_info.tests import data
 from cloud_info.tests import utils as utils
 
@@ -41,6 +48,10 @@ class OpenStackProviderOptionsTest(unittest.TestCase):
             os_cacert = None
             insecure = False
             legacy_occi_os = False
+            deadline = None
+            os_token_cache_file = None
+            os_token_refresh_margin = 300
+            os_image_page_size = 1000
 
         sys.modules['novaclient'] = mock.Mock()
         sys.modules['novaclient.client'] = mock.Mock()
@@ -60,6 +71,144 @@ class OpenStackProviderOptionsTest(unittest.TestCase):
         setattr(o, 'os_tenant_id', None)
         self.assertRaises(exceptions.OpenStackProviderException, provider, o)
 
+    @mock.patch('cloud_info.providers.static.StaticProvider')
+    def test_options_deadline(self, m_static):
+        class Opts(object):
+            os_username = os_password = os_tenant_name = 'foo'
+            os_auth_url = 'http://foo.example.org'
+            os_cacert = None
+            insecure = False
+            legacy_occi_os = False
+            deadline = 30
+            os_token_cache_file = None
+            os_token_refresh_margin = 300
+            os_image_page_size = 1000
+
+        m_novaclient = mock.Mock()
+        with mock.patch.dict(sys.modules, {'novaclient': m_novaclient,
+                                           'novaclient.client': mock.Mock()}):
+            os_provider.OpenStackProvider(Opts())
+        m_client = m_novaclient.client.Client
+        self.assertEqual(30, m_client.call_args[1]['timeout'])
+
+
+class OpenStackProviderTokenTest(unittest.TestCase):
+    def setUp(self):
+        tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmpdir)
+
+        class Opts(object):
+            os_username = os_password = os_tenant_name = 'foo'
+            os_auth_url = 'http://foo.example.org'
+            os_cacert = None
+            insecure = False
+            legacy_occi_os = False
+            deadline = None
+            os_token_cache_file = os.path.join(tmpdir, 'tokens.json')
+            os_token_refresh_margin = 300
+            os_image_page_size = 1000
+
+        self.opts = Opts()
+        self.expires = time.time() + 3600
+
+        self.m_novaclient = mock.Mock()
+        patcher = mock.patch.dict(sys.modules, {
+            'novaclient': self.m_novaclient,
+            'novaclient.client': mock.Mock(),
+        })
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        patcher = mock.patch('cloud_info.providers.static.StaticProvider')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        m_api = self.m_novaclient.client.Client.return_value
+        m_api.authenticate.side_effect = lambda: self._authenticate(m_api)
+
+    def _authenticate(self, api, token='token'):
+        expires = time.strftime('%Y-%m-%dT%H:%M:%SZ',
+                                time.gmtime(self.expires))
+        api.client.auth_token = token
+        api.client.management_url = 'http://foo.example.org:8774/v2'
+        api.client.service_catalog.catalog = {
+            'access': {'token': {'id': token, 'expires': expires},
+                       'serviceCatalog': []}}
+
+    def test_received_bytes(self):
+        m_api = self.m_novaclient.client.Client.return_value
+        m_request = m_api.client.request
+        m_request.return_value = (mock.Mock(content=b'x' * 10), {})
+        provider = os_provider.OpenStackProvider(self.opts)
+        provider.image_page_size = 0
+        provider.static.get_image_defaults.return_value = {}
+        provider.api.images.list.side_effect = lambda **kwargs: (
+            provider.api.client.request('/images/detail', 'GET') and [])
+        provider.get_images()
+        self.assertEqual(10, provider.api_received_bytes)
+        m_request.assert_called_once_with('/images/detail', 'GET')
+
+    def test_token_reused(self):
+        provider = os_provider.OpenStackProvider(self.opts)
+        provider.api.authenticate.assert_called_once_with()
+        self.assertEqual(1, provider.api_calls)
+
+        # The next run does not authenticate
+        self.m_novaclient.client.Client.return_value = mock.Mock()
+        provider = os_provider.OpenStackProvider(self.opts)
+        self.assertFalse(provider.api.authenticate.called)
+        self.assertEqual(0, provider.api_calls)
+        self.assertEqual('token', provider.api.client.auth_token)
+        self.assertEqual('http://foo.example.org:8774/v2',
+                         provider.api.client.management_url)
+        m_catalog = self.m_novaclient.service_catalog.ServiceCatalog
+        self.assertEqual([], m_catalog.call_args[0][0]['access'][
+            'serviceCatalog'])
+
+    def test_token_expiring(self):
+        self.expires = time.time() + 60
+        os_provider.OpenStackProvider(self.opts)
+        provider = os_provider.OpenStackProvider(self.opts)
+        provider.api.authenticate.assert_called_with()
+        self.assertEqual(2, provider.api.authenticate.call_count)
+
+    def test_renew(self):
+        provider = os_provider.OpenStackProvider(self.opts)
+        provider.renew()
+        provider.api.authenticate.assert_called_once_with()
+
+    def test_renew_expiring(self):
+        self.expires = time.time() + 60
+        provider = os_provider.OpenStackProvider(self.opts)
+
+        # Proactively renewed before it expires
+        self.expires = time.time() + 7200
+        provider.renew()
+        self.assertEqual(2, provider.api.authenticate.call_count)
+        self.assertAlmostEqual(self.expires, provider._token_expires,
+                               delta=1)
+
+    def test_no_token(self):
+        # Clients using a keystoneauth session do not expose their token
+        m_api = self.m_novaclient.client.Client.return_value
+        m_api.authenticate.side_effect = lambda: (
+            self._authenticate(m_api) or delattr(m_api.client, 'auth_token'))
+        os_provider.OpenStackProvider(self.opts)
+        self.assertFalse(os.path.exists(self.opts.os_token_cache_file))
+
+    def test_unauthorized(self):
+        provider = os_provider.OpenStackProvider(self.opts)
+
+        # novaclient authenticates again after a 401, the new token is kept
+        provider.api.images.list.side_effect = (
+            lambda **kwargs: self._authenticate(provider.api, 'new') or [])
+        provider.static.get_image_defaults.return_value = {}
+        provider.get_images()
+
+        self.m_novaclient.client.Client.return_value = mock.Mock()
+        provider = os_provider.OpenStackProvider(self.opts)
+        self.assertFalse(provider.api.authenticate.called)
+        self.assertEqual('new', provider.api.client.auth_token)
+
 
 class OpenStackProviderTest(unittest.TestCase):
     def setUp(self):
@@ -295,7 +444,7 @@ class OpenStackProviderTest(unittest.TestCase):
                 mock.patch.object(self.provider.api.images, 'list'),
         ) as (m_get_image_defaults, m_images_list):
             m_get_image_defaults.return_value = {}
-            m_images_list.return_value = FAKES.images
+            m_images_list.side_effect = [FAKES.images, []]
 
             images = self.provider.get_images()
             assert m_get_image_defaults.called
@@ -305,6 +454,103 @@ class OpenStackProviderTest(unittest.TestCase):
                               template="compute.ldif",
                               ignored_fields=["compute_service_name"])
 
+    def test_deadline(self):
+        self.provider.static.get_template_defaults.return_value = {}
+        self.provider.static.get_image_defaults.return_value = {}
+        self.provider.api.flavors.list.return_value = []
+        self.provider.api.images.list.return_value = []
+
+        self.provider.get_templates()
+        self.assertIsNone(self.provider.api.client.timeout)
+
+        # Requests get the time left until the deadline
+        self.provider.deadline = cloud_info.utils.Deadline(10)
+        self.provider.get_images()
+        self.assertTrue(0 < self.provider.api.client.timeout <= 10)
+
+    def test_deadline_expired(self):
+        self.provider.static.get_image_defaults.return_value = {}
+        self.provider.api.images.list.return_value = []
+        self.provider.deadline = cloud_info.utils.Deadline(0)
+        self.assertRaises(exceptions.DeadlineExceeded,
+                          self.provider.get_images)
+        self.assertFalse(self.provider.api.images.list.called)
+
+    def test_retry(self):
+        class ClientException(Exception):
+            def __init__(self, code):
+                self.code = code
+
+        self.provider.backend = resilience.Backend('openstack', retries=2)
+        self.provider.static.get_image_defaults.return_value = {}
+        self.provider.api.images.list.side_effect = [
+            ClientException(503), socket.timeout(), []]
+        with mock.patch('time.sleep'):
+            self.assertEqual({}, self.provider.get_images())
+        self.assertEqual(3, self.provider.api.images.list.call_count)
+
+        self.provider.api.images.list.reset_mock()
+        self.provider.api.images.list.side_effect = ClientException(404)
+        self.assertRaises(ClientException, self.provider.get_images)
+        self.provider.api.images.list.assert_called_once_with(
+            detailed=True, limit=1000, marker=None)
+
+    def _fake_pages(self, images):
+        '''Make images.list return images a page at a time.'''
+        ids = [image.id for image in images]
+
+        def list_images(detailed, limit=None, marker=None):
+            self.assertTrue(detailed)
+            start = 0 if marker is None else ids.index(marker) + 1
+            end = None if limit is None else start + limit
+            return images[start:end]
+
+        self.provider.static.get_image_defaults.return_value = {}
+        self.provider.api.images.list.side_effect = list_images
+
+    def test_get_images_pages(self):
+        images = [mock.Mock(id='image %d' % i, links=[],
+                            metadata={'marketplace': 'foo'})
+                  for i in range(5)]
+        self._fake_pages(images)
+        self.provider.image_page_size = 2
+
+        result = list(self.provider.iter_images())
+        self.assertEqual(['image %d' % i for i in range(5)],
+                         [i for i, image in result])
+        m_list = self.provider.api.images.list
+        self.assertEqual(
+            [mock.call(detailed=True, limit=2, marker=None),
+             mock.call(detailed=True, limit=2, marker='image 1'),
+             mock.call(detailed=True, limit=2, marker='image 3'),
+             mock.call(detailed=True, limit=2, marker='image 4')],
+            m_list.call_args_list)
+        self.assertEqual(4, self.provider.api_calls)
+
+        # Without pages
+        m_list.reset_mock()
+        self.provider.image_page_size = 0
+        self.assertEqual(result, list(self.provider.iter_images()))
+        m_list.assert_called_once_with(detailed=True)
+
+    def test_get_images_pages_prefetched(self):
+        images = [mock.Mock(id='image %d' % i, links=[],
+                            metadata={'marketplace': 'foo'})
+                  for i in range(4)]
+        self._fake_pages(images)
+        self.provider.image_page_size = 2
+
+        # The next page is requested while the current one is processed
+        result = self.provider.iter_images()
+        self.assertEqual('image 0', next(result)[0])
+        for i in range(100):
+            if self.provider.api.images.list.call_count == 2:
+                break
+            time.sleep(0.01)
+        self.provider.api.images.list.assert_called_with(
+            detailed=True, limit=2, marker='image 1')
+        result.close()
+
     def test_get_endpoints_with_defaults_from_static(self):
         expected_endpoints = {
             'endpoints': {
@@ -0,0 +1,105 @@
+import os.path
+import pstats
+import shutil
+import tempfile
+import time
+import unittest
+
+import mock
+import six
+
+from cloud_info import profiling
+
+
+class FakeOpts(object):
+    profile = True
+    profile_output = None
+    profile_sample_rate = 1.0
+
+
+class ProfilerTest(unittest.TestCase):
+    def setUp(self):
+        self.out = six.StringIO()
+
+    def test_get_profiler(self):
+        opts = FakeOpts()
+        opts.profile_sample_rate = 0.5
+        profiler = profiling.get_profiler(opts)
+        self.assertIsInstance(profiler, profiling.Profiler)
+        self.assertEqual(0.5, profiler.sample_rate)
+
+        opts.profile = False
+        self.assertIsInstance(profiling.get_profiler(opts),
+                              profiling.NoProfiler)
+
+    def test_no_profiler(self):
+        profiler = profiling.NoProfiler()
+        profiler.start()
+        with profiler.phase('foo'):
+            pass
+        profiler.finish()
+
+    def test_phases(self):
+        profiler = profiling.Profiler(out=self.out)
+        profiler.start()
+        with profiler.phase('foo'):
+            pass
+        profiler.add('bar', 1)
+        self.assertEqual(['foo', 'bar'],
+                         [name for name, seconds in profiler.timings])
+        profiler.finish()
+
+        report = self.out.getvalue()
+        for name in ('foo', 'bar', 'total', 'cumulative'):
+            self.assertIn(name, report)
+
+        # Finishing twice does not report the run again
+        profiler.finish()
+        self.assertEqual(report, self.out.getvalue())
+
+    def test_timed_iter(self):
+        def produce():
+            yield 1
+            time.sleep(0.1)
+            yield 2
+
+        done = mock.Mock()
+        items = profiling.timed_iter(produce(), done)
+        self.assertEqual(1, next(items))
+        # The time spent by the consumer is not included
+        time.sleep(0.2)
+        self.assertEqual([2], list(items))
+        seconds, = done.call_args[0]
+        self.assertTrue(0.1 <= seconds < 0.2)
+
+    def test_phase_error(self):
+        profiler = profiling.Profiler(out=self.out)
+        profiler.start()
+
+        def fail():
+            with profiler.phase('foo'):
+                raise ValueError()
+        self.assertRaises(ValueError, fail)
+        self.assertEqual(['foo'], [name for name, seconds in profiler.timings])
+        profiler.finish()
+
+    def test_not_sampled(self):
+        profiler = profiling.Profiler(sample_rate=0, out=self.out)
+        profiler.start()
+        self.assertFalse(profiler.sampled)
+        with profiler.phase('foo'):
+            pass
+        self.assertEqual([], profiler.timings)
+        profiler.finish()
+        self.assertEqual('', self.out.getvalue())
+
+    def test_dump_stats(self):
+        tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmpdir)
+        path = os.path.join(tmpdir, 'profile.pstats')
+
+        profiler = profiling.Profiler(path=path, out=self.out)
+        profiler.start()
+        profiler.finish()
+        self.assertNotIn('cumulative', self.out.getvalue())
+        pstats.Stats(path)
@@ -0,0 +1,167 @@
+import errno
+import os
+import shutil
+import socket
+import tempfile
+import unittest
+
+import mock
+
+from cloud_info import exceptions
+from cloud_info import resilience
+from cloud_info import utils
+
+
+class FakeOpts(object):
+    middleware = 'foo'
+    backend_retries = 2
+    backend_retry_delay = 0.5
+    circuit_breaker_threshold = 3
+    circuit_breaker_reset = 300
+    circuit_breaker_file = None
+
+
+class TransientErrorTest(unittest.TestCase):
+    def test_is_transient_error(self):
+        self.assertTrue(resilience.is_transient_error(socket.timeout()))
+        self.assertTrue(resilience.is_transient_error(
+            socket.error(errno.ECONNREFUSED, 'Connection refused')))
+        self.assertFalse(resilience.is_transient_error(
+            IOError(errno.ENOENT, 'No such file or directory')))
+        self.assertFalse(resilience.is_transient_error(IOError()))
+        self.assertFalse(resilience.is_transient_error(ValueError()))
+
+
+class BackendTest(unittest.TestCase):
+    def setUp(self):
+        patcher = mock.patch('time.sleep')
+        self.m_sleep = patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.func = mock.Mock()
+
+    def test_call(self):
+        backend = resilience.Backend('foo', retries=2)
+        self.func.return_value = 'bar'
+        self.assertEqual('bar', backend.call(self.func, ('baz',)))
+        self.func.assert_called_once_with('baz')
+        self.assertFalse(self.m_sleep.called)
+
+    def test_retry(self):
+        backend = resilience.Backend('foo', retries=2, retry_delay=0.5)
+        self.func.side_effect = [socket.timeout(), socket.timeout(), 'bar']
+        self.assertEqual('bar', backend.call(self.func))
+        self.assertEqual(3, self.func.call_count)
+
+        # Jittered exponential backoff
+        first, second = [c[0][0] for c in self.m_sleep.call_args_list]
+        self.assertTrue(0 <= first <= 0.5)
+        self.assertTrue(0 <= second <= 1)
+
+    def test_retry_exhausted(self):
+        backend = resilience.Backend('foo', retries=2)
+        self.func.side_effect = socket.timeout()
+        self.assertRaises(socket.timeout, backend.call, self.func)
+        self.assertEqual(3, self.func.call_count)
+
+    def test_not_transient(self):
+        backend = resilience.Backend('foo', retries=2)
+        self.func.side_effect = ValueError()
+        self.assertRaises(ValueError, backend.call, self.func)
+        self.func.assert_called_once_with()
+
+        self.func.reset_mock()
+        self.assertRaises(ValueError, backend.call, self.func,
+                          is_transient=lambda e: False)
+        self.func.assert_called_once_with()
+
+    def test_deadline(self):
+        backend = resilience.Backend('foo', retries=2)
+        self.func.side_effect = socket.timeout()
+        self.assertRaises(socket.timeout, backend.call, self.func,
+                          deadline=utils.Deadline(0))
+        self.func.assert_called_once_with()
+        self.assertFalse(self.m_sleep.called)
+
+    def test_breaker(self):
+        breaker = resilience.CircuitBreaker('foo', threshold=2)
+        backend = resilience.Backend('foo', retries=1, breaker=breaker)
+        self.func.side_effect = socket.timeout()
+        for i in range(2):
+            self.assertRaises(socket.timeout, backend.call, self.func)
+        self.assertEqual(4, self.func.call_count)
+
+        # The backend is skipped straight away
+        self.func.reset_mock()
+        self.assertRaises(exceptions.BackendUnavailable, backend.call,
+                          self.func)
+        self.assertFalse(self.func.called)
+
+        # Until it is time to try again
+        with mock.patch('time.time') as m_time:
+            m_time.return_value = breaker.opened_at + 300
+            self.func.side_effect = None
+            backend.call(self.func)
+        self.func.assert_called_once_with()
+        self.assertEqual(0, breaker.retry_after())
+
+    def test_breaker_not_transient(self):
+        breaker = resilience.CircuitBreaker('foo', threshold=1)
+        backend = resilience.Backend('foo', breaker=breaker)
+        self.func.side_effect = ValueError()
+        self.assertRaises(ValueError, backend.call, self.func)
+        self.assertEqual(0, breaker.retry_after())
+
+    def test_get_backend(self):
+        opts = FakeOpts()
+        backend = resilience.get_backend(opts)
+        self.assertEqual('foo', backend.name)
+        self.assertEqual(2, backend.retries)
+        self.assertEqual(3, backend.breaker.threshold)
+
+        opts.circuit_breaker_threshold = 0
+        self.assertIsNone(resilience.get_backend(opts).breaker)
+
+
+class CircuitBreakerTest(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmpdir)
+        self.path = os.path.join(self.tmpdir, 'breaker.json')
+
+    def test_persisted(self):
+        breaker = resilience.CircuitBreaker('foo', threshold=2,
+                                            path=self.path)
+        breaker.failure()
+        self.assertEqual(0, breaker.retry_after())
+
+        # A later run sees the failures of the previous ones
+        breaker = resilience.CircuitBreaker('foo', threshold=2,
+                                            path=self.path)
+        breaker.failure()
+        self.assertTrue(0 < breaker.retry_after() <= 300)
+
+        # Backends are independent
+        other = resilience.CircuitBreaker('bar', threshold=2, path=self.path)
+        self.assertEqual(0, other.retry_after())
+        other.failure()
+
+        breaker = resilience.CircuitBreaker('foo', threshold=2,
+                                            path=self.path)
+        self.assertTrue(breaker.retry_after())
+        breaker.success()
+        breaker = resilience.CircuitBreaker('foo', threshold=2,
+                                            path=self.path)
+        self.assertEqual(0, breaker.retry_after())
+        other = resilience.CircuitBreaker('bar', threshold=2, path=self.path)
+        other.retry_after()
+        self.assertEqual(1, other.failures)
+
+    def test_invalid_state(self):
+        with open(self.path, 'w') as f:
+            f.write('foo')
+        breaker = resilience.CircuitBreaker('foo', threshold=1,
+                                            path=self.path)
+        self.assertEqual(0, breaker.retry_after())
+        breaker.failure()
+        self.assertTrue(breaker.retry_after())
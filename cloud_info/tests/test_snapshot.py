@@ -0,0 +1,77 @@
+import json
+import os.path
+import shutil
+import stat
+import tempfile
+import time
+import unittest
+
+import mock
+
+from cloud_info import snapshot
+from cloud_info.tests import data
+
+DATA = data.DATA
+
+
+class SnapshotTest(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmpdir, 'snapshot.json')
+        self.snapshot = snapshot.Snapshot(self.path)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_load_missing(self):
+        self.assertIsNone(self.snapshot.load())
+
+    def test_load_invalid(self):
+        with open(self.path, 'w') as f:
+            f.write('{foo')
+        self.assertIsNone(self.snapshot.load())
+
+    def test_load_other_version(self):
+        with open(self.path, 'w') as f:
+            json.dump({'version': -1, 'timestamp': 0, 'info': {}}, f)
+        self.assertIsNone(self.snapshot.load())
+
+    def test_save_load(self):
+        info = {'get_site_info': DATA.site_info,
+                'get_compute_endpoints': DATA.compute_endpoints}
+        self.snapshot.save(info, timestamp=1234)
+        self.assertEqual((1234, info), self.snapshot.load())
+        self.assertEqual(['snapshot.json'], os.listdir(self.tmpdir))
+        self.assertEqual(0o644,
+                         stat.S_IMODE(os.stat(self.path).st_mode))
+
+    def test_save_replaces(self):
+        self.snapshot.save({'foo': {}}, timestamp=1)
+        self.snapshot.save({'bar': {}}, timestamp=2)
+        self.assertEqual((2, {'bar': {}}), self.snapshot.load())
+
+    def test_age(self):
+        self.assertAlmostEqual(60, self.snapshot.age(time.time() - 60),
+                               delta=5)
+        self.assertEqual(0, self.snapshot.age(time.time() + 60))
+
+    def test_lock(self):
+        lock = self.snapshot.lock()
+        self.assertIsNotNone(lock)
+        self.assertTrue(self.snapshot.refreshing())
+        lock.close()
+        self.assertFalse(self.snapshot.refreshing())
+
+    @mock.patch('subprocess.Popen')
+    def test_refresh_in_background(self, m_popen):
+        self.snapshot.refresh_in_background(['--foo', 'bar'])
+        cmd = m_popen.call_args[0][0]
+        self.assertEqual(['-m', 'cloud_info.core', '--foo', 'bar',
+                          '--snapshot-refresh'], cmd[1:])
+
+    @mock.patch('subprocess.Popen')
+    def test_refresh_in_background_running(self, m_popen):
+        lock = self.snapshot.lock()
+        self.assertIsNone(self.snapshot.refresh_in_background([]))
+        lock.close()
+        self.assertFalse(m_popen.called)
@@ -7,6 +7,7 @@ import six
 from cloud_info import exceptions
 from cloud_info.providers import static as static_provider
 from cloud_info.tests import data
+from cloud_info import utils
 
 DATA = data.DATA
 
@@ -18,6 +19,7 @@ class StaticProviderTest(unittest.TestCase):
             full_bdii_ldif = False
             site_in_suffix = False
             glite_site_info_static = "foo"
+            yaml_cache_dir = None
 
         cwd = os.path.dirname(__file__)
         yaml_file = os.path.join(cwd, "..", "..", "etc", "sample.static.yaml")
@@ -205,17 +207,27 @@ class StaticProviderTest(unittest.TestCase):
 
     def test_get_default_storage_service_name(self):
         self.provider.yaml = {'storage': {'endpoints': {}}}
-        with mock.patch('socket.getfqdn') as m_fqdn:
+        with mock.patch('cloud_info.utils.getfqdn') as m_fqdn:
             m_fqdn.return_value = 'foo'
             ep = self.provider.get_storage_endpoints()
             self.assertEqual('foo', ep.get('storage_service_name'))
+            m_fqdn.assert_called_once_with(self.provider.fqdn_timeout)
 
     def test_get_default_compute_service_name(self):
         self.provider.yaml = {'compute': {'endpoints': {}}}
-        with mock.patch('socket.getfqdn') as m_fqdn:
+        with mock.patch('cloud_info.utils.getfqdn') as m_fqdn:
             m_fqdn.return_value = 'foo'
             ep = self.provider.get_compute_endpoints()
             self.assertEqual('foo', ep.get('compute_service_name'))
+            m_fqdn.assert_called_once_with(self.provider.fqdn_timeout)
+
+    def test_get_default_service_name_deadline(self):
+        self.provider.yaml = {'compute': {'endpoints': {}}}
+        self.provider.deadline = utils.Deadline(1)
+        with mock.patch('cloud_info.utils.getfqdn') as m_fqdn:
+            self.provider.get_compute_endpoints()
+            timeout, = m_fqdn.call_args[0]
+            self.assertTrue(0 < timeout <= 1)
 
     def test_get_storage_endpoints(self):
         expected = DATA.storage_endpoints
@@ -0,0 +1,84 @@
+import os
+import shutil
+import stat
+import tempfile
+import unittest
+
+import mock
+
+from cloud_info import template_cache
+from cloud_info.tests import utils
+
+
+class TemplateCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.cache_dir = os.path.join(self.tmpdir, 'cache')
+        self.filename = os.path.join(self.tmpdir, 'foo.ldif')
+        self._write('foo ${attributes["foo"]}')
+        template_cache.clear_cache()
+
+    def tearDown(self):
+        template_cache.clear_cache()
+        shutil.rmtree(self.tmpdir)
+
+    def _write(self, contents, mtime=None):
+        with open(self.filename, 'w') as f:
+            f.write(contents)
+        if mtime is not None:
+            os.utime(self.filename, (mtime, mtime))
+
+    def _render(self, **kwargs):
+        tpl = template_cache.get_template(self.filename, **kwargs)
+        return tpl.render(attributes={'foo': 'bar'})
+
+    def test_compiled_once(self):
+        with mock.patch('mako.template.Template') as m_tpl:
+            template_cache.get_template(self.filename)
+            template_cache.get_template(self.filename)
+            m_tpl.assert_called_once_with(filename=self.filename,
+                                          module_filename=None)
+
+    def test_modified(self):
+        self.assertEqual('foo bar', self._render())
+        self._write('baz ${attributes["foo"]}', mtime=1)
+        self.assertEqual('baz bar', self._render())
+
+    def test_cache_dir(self):
+        self.assertEqual('foo bar', self._render(cache_dir=self.cache_dir))
+        modules = os.listdir(self.cache_dir)
+        self.assertEqual(1, len(modules))
+        self.assertTrue(modules[0].startswith('foo.ldif.'))
+
+        # A new process loads the compiled module instead of compiling it
+        template_cache.clear_cache()
+        with mock.patch('mako.template._compile_module_file') as m_compile:
+            self.assertEqual('foo bar',
+                             self._render(cache_dir=self.cache_dir))
+            self.assertFalse(m_compile.called)
+
+    def test_cache_dir_modified(self):
+        self._render(cache_dir=self.cache_dir)
+        self._write('baz ${attributes["foo"]}', mtime=1)
+        self.assertEqual('baz bar', self._render(cache_dir=self.cache_dir))
+        self.assertEqual(2, len(os.listdir(self.cache_dir)))
+
+    def test_cache_dir_mode(self):
+        self._render(cache_dir=self.cache_dir)
+        self.assertEqual(0o700, stat.S_IMODE(os.stat(self.cache_dir).st_mode))
+
+    def test_cache_dir_untrusted(self):
+        os.makedirs(self.cache_dir)
+        os.chmod(self.cache_dir, 0o777)
+        self.assertEqual('foo bar', self._render(cache_dir=self.cache_dir))
+        self.assertEqual([], os.listdir(self.cache_dir))
+
+        # Owned by another user
+        st = mock.Mock(st_uid=1001, st_mode=stat.S_IFDIR | 0o700)
+        with utils.nested(mock.patch('os.getuid'),
+                          mock.patch('os.stat')) as (m_getuid, m_stat):
+            m_getuid.return_value = 1000
+            m_stat.return_value = st
+            self.assertFalse(template_cache._is_trusted(self.cache_dir))
+            st.st_uid = 1000
+            self.assertTrue(template_cache._is_trusted(self.cache_dir))
@@ -0,0 +1,66 @@
+import os
+import shutil
+import stat
+import tempfile
+import time
+import unittest
+
+from cloud_info import token_cache
+
+
+class TokenCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmpdir)
+        self.path = os.path.join(self.tmpdir, 'tokens', 'tokens.json')
+        self.cache = token_cache.TokenCache(self.path)
+        self.key = token_cache.get_key('http://example.org', 'foo', 'secret')
+
+    def _token(self, expires_in):
+        return {'token': 'bar', 'expires': time.time() + expires_in}
+
+    def test_save_load(self):
+        self.assertIsNone(self.cache.load(self.key))
+        token = self._token(3600)
+        self.cache.save(self.key, token)
+        self.assertEqual(token, token_cache.TokenCache(self.path).load(
+            self.key))
+        self.assertIsNone(self.cache.load(
+            token_cache.get_key('http://example.org', 'foo', 'other')))
+
+    def test_permissions(self):
+        self.cache.save(self.key, self._token(3600))
+        self.assertEqual(0o600, stat.S_IMODE(os.stat(self.path).st_mode))
+        with open(self.path) as f:
+            self.assertNotIn('secret', f.read())
+
+    def test_expired(self):
+        self.cache.save(self.key, self._token(60))
+        self.assertIsNotNone(self.cache.load(self.key))
+        # Tokens are renewed shortly before they expire
+        self.assertIsNone(self.cache.load(self.key, margin=300))
+
+        self.cache.save(self.key, dict(self._token(0), expires=None))
+        self.assertIsNone(self.cache.load(self.key))
+
+    def test_expired_other_credentials(self):
+        other = token_cache.get_key('http://example.org', 'bar', 'secret')
+        self.cache.save(other, self._token(-1))
+        self.cache.save(self.key, self._token(3600))
+        self.assertEqual([self.key], list(self.cache._load_all()))
+
+    def test_invalid(self):
+        os.makedirs(os.path.dirname(self.path))
+        with open(self.path, 'w') as f:
+            f.write('foo')
+        self.assertIsNone(self.cache.load(self.key))
+        self.cache.save(self.key, self._token(3600))
+        self.assertIsNotNone(self.cache.load(self.key))
+
+    def test_parse_expires(self):
+        self.assertEqual(1791504000, token_cache.parse_expires(
+            '2026-10-09T00:00:00Z'))
+        self.assertEqual(1791504000, token_cache.parse_expires(
+            '2026-10-09T00:00:00.000000Z'))
+        self.assertIsNone(token_cache.parse_expires(None))
+        self.assertIsNone(token_cache.parse_expires('foo'))
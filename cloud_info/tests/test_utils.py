@@ -0,0 +1,73 @@
+import threading
+import unittest
+
+import mock
+
+from cloud_info import utils
+
+
+class DeadlineTest(unittest.TestCase):
+    def test_no_deadline(self):
+        deadline = utils.Deadline()
+        self.assertIsNone(deadline.remaining())
+        self.assertFalse(deadline.expired())
+        self.assertIsNone(deadline.timeout())
+        self.assertEqual(5, deadline.timeout(5))
+
+    def test_deadline(self):
+        deadline = utils.Deadline(60)
+        self.assertFalse(deadline.expired())
+        self.assertTrue(0 < deadline.remaining() <= 60)
+        self.assertEqual(5, deadline.timeout(5))
+        self.assertTrue(5 < deadline.timeout() <= 60)
+        self.assertTrue(5 < deadline.timeout(120) <= 60)
+
+    def test_expired(self):
+        deadline = utils.Deadline(0)
+        self.assertTrue(deadline.expired())
+        self.assertEqual(0, deadline.remaining())
+        self.assertEqual(0, deadline.timeout(5))
+
+
+class LayerTest(unittest.TestCase):
+    def test_layer(self):
+        entity = {'name': 'entity', 'id': 'foo'}
+        shared = {'name': 'shared', 'site': 'SITE'}
+        layered = utils.layer(entity, shared)
+        self.assertEqual('shared', layered['name'])
+        self.assertEqual('foo', layered['id'])
+        self.assertEqual('SITE', layered['site'])
+        layered['name'] = 'bar'
+        layered['other'] = 'baz'
+        self.assertEqual('bar', layered['name'])
+        self.assertEqual({'name': 'entity', 'id': 'foo'}, entity)
+        self.assertEqual({'name': 'shared', 'site': 'SITE'}, shared)
+
+
+class GetFQDNTest(unittest.TestCase):
+    def setUp(self):
+        utils.clear_fqdn_cache()
+        self.addCleanup(utils.clear_fqdn_cache)
+
+    @mock.patch('socket.getfqdn')
+    def test_getfqdn(self, m_fqdn):
+        m_fqdn.return_value = 'foo.example.org'
+        self.assertEqual('foo.example.org', utils.getfqdn(5))
+        self.assertEqual('foo.example.org', utils.getfqdn(5))
+        m_fqdn.assert_called_once_with()
+
+    @mock.patch('socket.gethostname')
+    @mock.patch('socket.getfqdn')
+    def test_getfqdn_timeout(self, m_fqdn, m_hostname):
+        done = threading.Event()
+        self.addCleanup(done.set)
+        m_fqdn.side_effect = lambda: done.wait(5) and 'foo.example.org'
+        m_hostname.return_value = 'foo'
+
+        self.assertEqual('foo', utils.getfqdn(0.05))
+        self.assertEqual('foo', utils.getfqdn(0.05))
+        # The lookup that timed out is not started again
+        m_fqdn.assert_called_once_with()
+
+        done.set()
+        self.assertEqual('foo.example.org', utils.getfqdn(5))
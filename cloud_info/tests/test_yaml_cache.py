@@ -0,0 +1,80 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import mock
+
+from cloud_info import yaml_cache
+
+
+class YAMLCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.cache_dir = os.path.join(self.tmpdir, 'cache')
+        self.filename = os.path.join(self.tmpdir, 'static.yaml')
+        self._write('site: {name: foo}')
+        yaml_cache.clear_cache()
+
+    def tearDown(self):
+        yaml_cache.clear_cache()
+        shutil.rmtree(self.tmpdir)
+
+    def _write(self, contents, mtime=None):
+        with open(self.filename, 'w') as f:
+            f.write(contents)
+        if mtime is not None:
+            os.utime(self.filename, (mtime, mtime))
+
+    def test_parsed_once(self):
+        with mock.patch('yaml.load') as m_load:
+            data = yaml_cache.load(self.filename)
+            self.assertIs(data, yaml_cache.load(self.filename))
+            self.assertEqual(1, m_load.call_count)
+
+    def test_loader(self):
+        import yaml
+
+        with mock.patch('yaml.load') as m_load:
+            yaml_cache.load(self.filename)
+        loader = m_load.call_args[1]['Loader']
+        self.assertEqual(getattr(yaml, 'CSafeLoader', yaml.SafeLoader),
+                         loader)
+
+    def test_modified(self):
+        self.assertEqual({'site': {'name': 'foo'}},
+                         yaml_cache.load(self.filename))
+        self._write('site: {name: bar}', mtime=1)
+        self.assertEqual({'site': {'name': 'bar'}},
+                         yaml_cache.load(self.filename))
+
+    def test_cache_dir(self):
+        data = yaml_cache.load(self.filename, cache_dir=self.cache_dir)
+        self.assertEqual(1, len(os.listdir(self.cache_dir)))
+
+        # A new process loads the cached data instead of parsing the file
+        yaml_cache.clear_cache()
+        with mock.patch('yaml.load') as m_load:
+            self.assertEqual(data, yaml_cache.load(self.filename,
+                                                   cache_dir=self.cache_dir))
+            self.assertFalse(m_load.called)
+
+    def test_cache_dir_modified(self):
+        yaml_cache.load(self.filename, cache_dir=self.cache_dir)
+        self._write('site: {name: bar}', mtime=1)
+        yaml_cache.clear_cache()
+        self.assertEqual({'site': {'name': 'bar'}},
+                         yaml_cache.load(self.filename,
+                                         cache_dir=self.cache_dir))
+        self.assertEqual(1, len(os.listdir(self.cache_dir)))
+
+    def test_cache_dir_invalid(self):
+        yaml_cache.load(self.filename, cache_dir=self.cache_dir)
+        cache_filename, = os.listdir(self.cache_dir)
+        with open(os.path.join(self.cache_dir, cache_filename), 'w') as f:
+            f.write('foo')
+
+        yaml_cache.clear_cache()
+        self.assertEqual({'site': {'name': 'foo'}},
+                         yaml_cache.load(self.filename,
+                                         cache_dir=self.cache_dir))
@@ -2,8 +2,11 @@ import contextlib  # noqa
 import itertools
 import os.path
 import re
+import threading
 
 import six
+from six.moves import socketserver
+from six.moves import xmlrpc_server  # nosec
 
 IGNORED_FIELDS = ["suffix", "site_name"]
 
@@ -30,3 +33,48 @@ else:
     def nested(*contexts):
         with contextlib.ExitStack() as stack:
             yield [stack.enter_context(c) for c in contexts]
+
+
+class _RequestHandler(xmlrpc_server.SimpleXMLRPCRequestHandler):
+    # Keep the connections open, as OpenNebula does
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, *args):
+        pass
+
+
+class _Server(socketserver.ThreadingMixIn, xmlrpc_server.SimpleXMLRPCServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        # e.g. clients that timed out and closed the connection
+        pass
+
+
+class XMLRPCServer(object):
+    '''Local XML-RPC server, running in a thread.'''
+    def __init__(self, functions):
+        self.server = _Server(('127.0.0.1', 0), _RequestHandler,
+                              logRequests=False, allow_none=True)
+        self.connections = 0
+        get_request = self.server.get_request
+
+        def count_connections():
+            self.connections += 1
+            return get_request()
+        self.server.get_request = count_connections
+
+        for name, function in functions.items():
+            self.server.register_function(function, name)
+        self.uri = 'http://127.0.0.1:%d/RPC2' % self.server.server_address[1]
+
+    def start(self):
+        self.thread = threading.Thread(target=self.server.serve_forever,
+                                       args=(0.05,))
+        self.thread.daemon = True
+        self.thread.start()
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.thread.join()
@@ -0,0 +1,99 @@
+import calendar
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+
+import six
+
+from cloud_info import utils
+
+logger = logging.getLogger(__name__)
+
+# Formats of the expiration times of the Keystone tokens
+_EXPIRES_FORMATS = ('%Y-%m-%dT%H:%M:%SZ', '%Y-%m-%dT%H:%M:%S.%fZ')
+
+
+def get_key(*credentials):
+    '''Get the cache key of a set of credentials.
+
+    The credentials are hashed, so that they are not stored in the cache.
+    '''
+    data = '\0'.join(c or '' for c in credentials)
+    return hashlib.sha256(data.encode('utf-8')).hexdigest()
+
+
+def parse_expires(expires):
+    '''Convert the expiration time of a token into a timestamp.
+
+    Returns None if it cannot be parsed.
+    '''
+    if not isinstance(expires, six.string_types):
+        return None
+    for fmt in _EXPIRES_FORMATS:
+        try:
+            return calendar.timegm(time.strptime(expires, fmt))
+        except ValueError:
+            pass
+    logger.warning('Cannot parse the token expiration time %s', expires)
+    return None
+
+
+class TokenCache(object):
+    '''Authentication tokens stored across runs.
+
+    Tokens are stored in path, that is only readable by its owner, keyed by
+    the (hashed) credentials that obtained them, together with their
+    expiration time and the service catalog.
+    '''
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def _load_all(self):
+        try:
+            with open(self.path, 'r') as f:
+                tokens = json.load(f)
+        except (IOError, OSError):
+            return {}
+        except ValueError:
+            logger.warning('Ignoring invalid token cache %s', self.path)
+            return {}
+        if not isinstance(tokens, dict):
+            return {}
+        return dict((k, v) for k, v in tokens.items()
+                    if isinstance(v, dict) and 'expires' in v)
+
+    def load(self, key, margin=0):
+        '''Get the token stored for key, as the dict given to save.
+
+        Returns None if there is no token, or if it expires in less than
+        margin seconds.
+        '''
+        with self._lock:
+            token = self._load_all().get(key)
+        if token is None or token['expires'] is None:
+            return None
+        if token['expires'] - margin <= time.time():
+            return None
+        return token
+
+    def save(self, key, token):
+        '''Store token, a dict whose 'expires' is a timestamp, for key.'''
+        with self._lock:
+            tokens = self._load_all()
+            # Forget the expired tokens of other credentials
+            now = time.time()
+            tokens = dict((k, v) for k, v in tokens.items()
+                          if (v.get('expires') or 0) > now)
+            tokens[key] = token
+            try:
+                dirname = os.path.dirname(os.path.abspath(self.path))
+                if not os.path.isdir(dirname):
+                    os.makedirs(dirname, 0o700)
+                utils.atomic_write(self.path, json.dumps(tokens), mode=0o600)
+            except (IOError, OSError) as e:
+                logger.warning('Cannot write token cache %s: %s',
+                               self.path, e)
@@ -1,5 +1,11 @@
+import collections
+import contextlib
 import os
+import socket
 import string
+import tempfile
+import threading
+import timeit
 
 import six
 
@@ -7,9 +13,59 @@ import six
 if six.PY2:
     maketrans = string.maketrans
     translate = string.translate
+    collections_abc = collections
 else:
     maketrans = str.maketrans
     translate = str.translate
+    import collections.abc as collections_abc
+
+Mapping = collections_abc.Mapping
+MutableMapping = collections_abc.MutableMapping
+
+
+if six.PY2:
+    class ChainMap(MutableMapping):
+        '''Minimal backport of collections.ChainMap.
+
+        Lookups search the mappings in order, while writes and deletions
+        only affect the first one.
+        '''
+        def __init__(self, *maps):
+            self.maps = list(maps) or [{}]
+
+        def __getitem__(self, key):
+            for mapping in self.maps:
+                if key in mapping:
+                    return mapping[key]
+            raise KeyError(key)
+
+        def __setitem__(self, key, value):
+            self.maps[0][key] = value
+
+        def __delitem__(self, key):
+            del self.maps[0][key]
+
+        def __iter__(self):
+            return iter(set().union(*self.maps))
+
+        def __len__(self):
+            return len(set().union(*self.maps))
+
+        def __repr__(self):
+            return '%s(%s)' % (self.__class__.__name__,
+                               ', '.join(repr(m) for m in self.maps))
+else:
+    ChainMap = collections.ChainMap
+
+
+def layer(entity, shared):
+    '''View of entity with the shared attributes over it.
+
+    As when the shared attributes were copied into the entity, they take
+    precedence over the entity ones. Writes go to a layer of their own, so
+    neither the entity nor the shared attributes are modified.
+    '''
+    return ChainMap({}, shared, entity)
 
 
 def env(*args, **kwargs):
@@ -29,3 +85,118 @@ def get_tag_value(xml, tag):
         return xml.getElementsByTagName(tag)[0].firstChild.nodeValue
     else:
         return None
+
+
+@contextlib.contextmanager
+def atomic_open(path, mode=0o644):
+    '''Open a binary file that atomically replaces path once closed.
+
+    The data is written into a temporary file in the same directory that is
+    then renamed over path, so readers see either the old or the new file.
+    If an exception is raised while writing, path is left untouched.
+    '''
+    dirname = os.path.dirname(os.path.abspath(path))
+    fd, tmp = tempfile.mkstemp(dir=dirname,
+                               prefix='.%s.' % os.path.basename(path))
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            yield f
+            f.flush()
+            os.fsync(f.fileno())
+        os.chmod(tmp, mode)
+        os.rename(tmp, path)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+
+
+def atomic_write(path, data, mode=0o644):
+    '''Atomically replace the contents of path with data.'''
+    if isinstance(data, six.text_type):
+        data = data.encode('utf-8')
+
+    with atomic_open(path, mode=mode) as f:
+        f.write(data)
+
+
+class Deadline(object):
+    '''Time budget of a run.
+
+    seconds is the length of the budget, starting now. If it is None the
+    budget never runs out.
+    '''
+    def __init__(self, seconds=None):
+        self.seconds = seconds
+        self._end = None
+        if seconds is not None:
+            self._end = timeit.default_timer() + seconds
+
+    def remaining(self):
+        '''Seconds left in the budget (never negative), or None.'''
+        if self._end is None:
+            return None
+        return max(0.0, self._end - timeit.default_timer())
+
+    def expired(self):
+        return self._end is not None and not self.remaining()
+
+    def timeout(self, default=None):
+        '''Timeout for an operation, bounded by the time left.
+
+        Returns the smallest of default and the remaining time, or None if
+        there is no bound at all.
+        '''
+        remaining = self.remaining()
+        if remaining is None:
+            return default
+        if default is None:
+            return remaining
+        return min(default, remaining)
+
+
+_fqdn = None
+_fqdn_lookup = None
+_fqdn_lock = threading.Lock()
+
+
+def _lookup_fqdn():
+    global _fqdn
+
+    fqdn = socket.getfqdn()
+    with _fqdn_lock:
+        _fqdn = fqdn
+
+
+def getfqdn(timeout=None):
+    '''Get the fully qualified domain name of this host.
+
+    socket.getfqdn() may block on DNS for a long time, so the lookup is made
+    in a background thread and the plain host name is returned if it does
+    not finish within timeout seconds. The result of the lookup is cached
+    for the life of the process, and a lookup that timed out is not started
+    again while it is still running.
+    '''
+    global _fqdn_lookup
+
+    with _fqdn_lock:
+        if _fqdn is not None:
+            return _fqdn
+        if _fqdn_lookup is None or not _fqdn_lookup.is_alive():
+            _fqdn_lookup = threading.Thread(target=_lookup_fqdn)
+            _fqdn_lookup.daemon = True
+            _fqdn_lookup.start()
+        lookup = _fqdn_lookup
+
+    lookup.join(timeout)
+    with _fqdn_lock:
+        if _fqdn is not None:
+            return _fqdn
+    return socket.gethostname()
+
+
+def clear_fqdn_cache():
+    '''Forget the domain name found by getfqdn.'''
+    global _fqdn
+
+    with _fqdn_lock:
+        _fqdn = None
@@ -0,0 +1,93 @@
+import hashlib
+import logging
+import os
+import threading
+
+from six.moves import cPickle as pickle
+
+from cloud_info import template_cache
+from cloud_info import utils
+
+logger = logging.getLogger(__name__)
+
+_cache = {}
+_lock = threading.Lock()
+
+
+def _cache_filename(filename, cache_dir):
+    path = os.path.abspath(filename)
+    digest = hashlib.sha1(path.encode('utf-8')).hexdigest()  # nosec
+    name = '%s.%s.pickle' % (os.path.basename(filename), digest)
+    return os.path.join(cache_dir, name)
+
+
+def _parse(filename):
+    # PyYAML is imported here as it takes a while to load
+    import yaml
+
+    # The libyaml based loader is much faster, if it is available
+    loader = getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
+    with open(filename, 'r') as f:
+        return yaml.load(f, Loader=loader)  # nosec
+
+
+def _load_cached(cache_filename, stamp):
+    try:
+        with open(cache_filename, 'rb') as f:
+            cached_stamp, data = pickle.load(f)  # nosec
+    except (IOError, OSError):
+        return None
+    except Exception:
+        logger.warning('Ignoring invalid YAML cache %s', cache_filename)
+        return None
+    if cached_stamp != stamp:
+        return None
+    return data
+
+
+def _save_cached(cache_filename, stamp, data):
+    try:
+        if not os.path.isdir(os.path.dirname(cache_filename)):
+            os.makedirs(os.path.dirname(cache_filename))
+        utils.atomic_write(cache_filename,
+                           pickle.dumps((stamp, data), protocol=2))
+    except (IOError, OSError) as e:
+        logger.warning('Cannot write YAML cache %s: %s', cache_filename, e)
+
+
+def load(filename, cache_dir=None):
+    '''Get the data of the YAML file filename.
+
+    Files are parsed only once per process, unless they are modified. If
+    cache_dir is set, the parsed data is stored there, keyed by the path,
+    modification time and size of the file, so that later runs do not need
+    to parse it again. The data must not be modified, as it is shared by
+    all the callers.
+    '''
+    stamp = template_cache.get_stamp(filename)
+    key = os.path.abspath(filename)
+
+    with _lock:
+        cached = _cache.get(key)
+        if cached is not None and cached[0] == stamp:
+            return cached[1]
+
+        data = None
+        cache_filename = None
+        if cache_dir is not None:
+            cache_filename = _cache_filename(filename, cache_dir)
+            data = _load_cached(cache_filename, stamp)
+
+        if data is None:
+            data = _parse(filename)
+            if cache_filename is not None:
+                _save_cached(cache_filename, stamp, data)
+
+        _cache[key] = (stamp, data)
+        return data
+
+
+def clear_cache():
+    '''Forget all the YAML files parsed by this process.'''
+    with _lock:
+        _cache.clear()
@@ -52,6 +52,8 @@ rm -rf $RPM_BUILD_ROOT
 %defattr(-,root,root,-)
 %{python_sitelib}/cloud_info*
 /usr/bin/cloud-info-provider-service
+/usr/bin/cloud-info-provider-client
+/usr/bin/cloud-info-provider-fleet
 %config /etc/cloud-info-provider/
 
 %changelog